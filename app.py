@@ -1,24 +1,1007 @@
 import streamlit as st
 import numpy as np
-import matplotlib.pyplot as plt
-import librosa
 import io
 import time
 import tempfile
 import os
-import imageio
+import sys
+import argparse
 import subprocess
-from scipy.io import wavfile
+import hashlib
+import shutil
+import threading
+import contextlib
+import re
+import json
+import uuid
+import copy
+import traceback
 from datetime import datetime
 
+# librosa, matplotlib, scipy e imageio sono importati solo dove servono:
+# l'avvio dell'app e la schermata iniziale non ne pagano il costo.
+
+DEFAULT_COLORS = {
+    'low': '#FF0000', 'mid': '#0000FF', 'high': '#FFFFFF', 'bg': '#000000'
+}
+
+DEFAULT_EFFECTS = {
+    'intensity': 1.0,
+    'speed': 0.1,
+    'randomness': 0.0
+}
+
+PATTERN_TYPES = ("waves", "interference", "flowing", "am", "fm", "reflected",
+                 "varied_amplitude", "varied_shape", "varied_motion")
+
+# Colori "simbolici" passati ai metodi draw_* durante il calcolo della geometria:
+# ogni linea registra la banda a cui appartiene invece di un colore reale
+GEOMETRY_COLOR_KEYS = {'low': 'low', 'mid': 'mid', 'high': 'high', 'bg': 'bg'}
+GEOMETRY_BANDS = ('low', 'mid', 'high')
+
+# Analisi dei canali: downmix mono, sinistro/destro oppure mid/side
+CHANNEL_MODES = ('mono', 'stereo', 'midside')
+# Disposizione dei due layer stereo: metà inferiore capovolta o schermo diviso
+STEREO_LAYOUTS = ('mirrored', 'split')
+
+# Cache su disco della geometria dei frame (coordinate e spessori delle linee)
+GEOMETRY_CACHE_DIR = os.path.join(tempfile.gettempdir(), "audioline_geometry")
+GEOMETRY_CACHE_MAX_BYTES = 2 * 1024 ** 3
+GEOMETRY_CHUNK_FRAMES = 100
+# Da incrementare quando cambia la geometria prodotta per un frame (calcolo delle
+# linee o corrispondenza frame→tempo): le voci salvate in precedenza non valgono più
+GEOMETRY_CACHE_VERSION = 2
+# Spostamento massimo (in pixel) delle linee rispetto all'ultimo frame disegnato
+# sotto il quale il frame precedente viene riusato senza rasterizzare
+FRAME_REUSE_TOLERANCE_PX = 0.25
+
+
+def same_raster_geometry(lines, previous, px_per_unit, tolerance_px=FRAME_REUSE_TOLERANCE_PX):
+    """True se due liste di linee (banda, x, y, spessore, alpha) danno lo stesso frame.
+
+    Le coordinate sono confrontate in pixel (`px_per_unit` = pixel per unità
+    degli assi in x e y): la fase del movimento cambia a ogni hop, ma con
+    ampiezze quasi nulle sposta le linee di frazioni di pixel invisibili.
+    """
+    if previous is None or len(lines) != len(previous):
+        return False
+    scale_x, scale_y = px_per_unit
+    for (band, x, y, width, alpha), (prev_band, prev_x, prev_y, prev_width, prev_alpha) in zip(lines, previous):
+        if band != prev_band or len(x) != len(prev_x) or len(y) != len(prev_y):
+            return False
+        if abs(width - prev_width) > 0.01 or abs(alpha - prev_alpha) > 0.005:
+            return False
+        if len(x) and (np.max(np.abs(x - prev_x)) * scale_x > tolerance_px
+                       or np.max(np.abs(y - prev_y)) * scale_y > tolerance_px):
+            return False
+    return True
+
+
+class LineRecorder:
+    """Sostituto di un Axes che registra le linee invece di disegnarle.
+
+    `y_scale`/`y_offset` collocano il disegno in una porzione del frame
+    (es. metà superiore o inferiore, eventualmente capovolta) per i layer
+    stereo; `size_px` è la dimensione in pixel di quella porzione.
+
+    I metodi draw_* accettano anche bande e tempi come colonne (K, 1): ogni
+    `plot` riceve allora y (K, punti) e spessori/alpha (K, 1) e registra una
+    linea per frame, con il frame in `line_rows` (geometria di K frame in
+    un solo passaggio, vedi `render_poster`). Le linee con alpha nullo
+    (onde assenti in quel frame) non vengono registrate.
+    """
+
+    def __init__(self, size_px, y_scale=1.0, y_offset=0.0):
+        self.size_px = size_px
+        self.y_scale = y_scale
+        self.y_offset = y_offset
+        self.lines = []
+        self.line_rows = []
+
+    def plot(self, x, y, color=None, linewidth=1.0, alpha=1.0):
+        y = np.asarray(y, dtype=np.float64)
+        if self.y_scale != 1.0 or self.y_offset != 0.0:
+            y = y * self.y_scale + self.y_offset
+        x = np.asarray(x, dtype=np.float32)
+        if y.ndim == 1:
+            self.lines.append((color, x, y.astype(np.float32), float(linewidth), float(alpha)))
+            self.line_rows.append(0)
+            return
+        y = y.astype(np.float32)
+        widths = np.broadcast_to(np.asarray(linewidth, dtype=np.float64).reshape(-1), (len(y),))
+        alphas = np.broadcast_to(np.asarray(alpha, dtype=np.float64).reshape(-1), (len(y),))
+        for row in np.flatnonzero(alphas > 0):
+            self.lines.append((color, x, y[row], float(widths[row]), float(alphas[row])))
+            self.line_rows.append(int(row))
+
+
+class GeometryCache:
+    """Geometria per-frame di un video, salvata su disco a blocchi di frame.
+
+    La chiave combina impronta dell'analisi, pattern, effetti, aspect ratio,
+    risoluzione e FPS: cambiando solo colori, sfondo o titolo la geometria
+    viene riletta invece di essere ricalcolata.
+    """
+
+    def __init__(self, key_parts, chunk_frames=GEOMETRY_CHUNK_FRAMES, cache_dir=None):
+        self.key = hashlib.sha1(repr(key_parts).encode()).hexdigest()
+        self.cache_dir = cache_dir or GEOMETRY_CACHE_DIR
+        self.path = os.path.join(self.cache_dir, self.key)
+        self.chunk_frames = chunk_frames
+        self._loaded_chunk = None
+        self._loaded_frames = {}
+        self._pending_chunk = None
+        self._pending_frames = {}
+        self.hits = 0
+        self.misses = 0
+        os.makedirs(self.path, exist_ok=True)
+        os.utime(self.path)
+
+    def _chunk_path(self, chunk_idx):
+        return os.path.join(self.path, f"chunk_{chunk_idx:06d}.npz")
+
+    def get(self, frame_idx):
+        """Restituisce le linee del frame, o None se non sono in cache"""
+        chunk_idx = frame_idx // self.chunk_frames
+        if chunk_idx != self._loaded_chunk:
+            self._loaded_chunk = chunk_idx
+            self._loaded_frames = self._read_chunk(chunk_idx)
+        lines = self._loaded_frames.get(frame_idx)
+        if lines is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return lines
+
+    def put(self, frame_idx, lines):
+        """Aggiunge le linee di un frame; i blocchi completi vanno su disco"""
+        chunk_idx = frame_idx // self.chunk_frames
+        if chunk_idx != self._pending_chunk:
+            self.flush()
+            self._pending_chunk = chunk_idx
+        self._pending_frames[frame_idx] = lines
+        if len(self._pending_frames) == self.chunk_frames:
+            self.flush()
+
+    def flush(self):
+        """Scrive su disco il blocco in corso, unito ai frame già presenti in cache"""
+        if self._pending_frames:
+            frames = dict(self._pending_frames)
+            if self._loaded_chunk == self._pending_chunk:
+                frames = {**self._loaded_frames, **frames}
+                self._loaded_frames = frames
+            self._write_chunk(self._pending_chunk, frames)
+        self._pending_chunk = None
+        self._pending_frames = {}
+
+    def close(self):
+        self.flush()
+        prune_geometry_cache(keep=self.key, cache_dir=self.cache_dir)
+
+    def _write_chunk(self, chunk_idx, frames):
+        frame_ids, line_counts, bands, widths, alphas, point_counts, xs, ys = [], [], [], [], [], [], [], []
+        for frame_idx in sorted(frames):
+            lines = frames[frame_idx]
+            frame_ids.append(frame_idx)
+            line_counts.append(len(lines))
+            for band, x, y, width, alpha in lines:
+                bands.append(GEOMETRY_BANDS.index(band))
+                widths.append(width)
+                alphas.append(alpha)
+                point_counts.append(len(x))
+                xs.append(x)
+                ys.append(y)
+        tmp_path = self._chunk_path(chunk_idx) + f".{os.getpid()}.tmp.npz"
+        np.savez(
+            tmp_path,
+            frame_ids=np.array(frame_ids, dtype=np.int64),
+            line_counts=np.array(line_counts, dtype=np.int64),
+            bands=np.array(bands, dtype=np.uint8),
+            widths=np.array(widths, dtype=np.float64),
+            alphas=np.array(alphas, dtype=np.float64),
+            point_counts=np.array(point_counts, dtype=np.int64),
+            x=np.concatenate(xs) if xs else np.zeros(0, dtype=np.float32),
+            y=np.concatenate(ys) if ys else np.zeros(0, dtype=np.float32)
+        )
+        os.replace(tmp_path, self._chunk_path(chunk_idx))
+
+    def _read_chunk(self, chunk_idx):
+        path = self._chunk_path(chunk_idx)
+        if not os.path.exists(path):
+            return {}
+        try:
+            data = np.load(path)
+            frame_ids, line_counts = data['frame_ids'], data['line_counts']
+            bands, widths, alphas = data['bands'], data['widths'], data['alphas']
+            point_bounds = np.concatenate([[0], np.cumsum(data['point_counts'])])
+            x, y = data['x'], data['y']
+        except (OSError, ValueError, KeyError):
+            return {}
+        frames = {}
+        line_idx = 0
+        for frame_idx, count in zip(frame_ids, line_counts):
+            lines = []
+            for i in range(line_idx, line_idx + count):
+                p0, p1 = point_bounds[i], point_bounds[i + 1]
+                lines.append((GEOMETRY_BANDS[bands[i]], x[p0:p1], y[p0:p1],
+                              float(widths[i]), float(alphas[i])))
+            frames[int(frame_idx)] = lines
+            line_idx += count
+        return frames
+
+
+def prune_geometry_cache(keep=None, max_bytes=GEOMETRY_CACHE_MAX_BYTES, cache_dir=None):
+    """Elimina le geometrie usate meno di recente oltre il limite di spazio"""
+    cache_dir = cache_dir or GEOMETRY_CACHE_DIR
+    if not os.path.isdir(cache_dir):
+        return
+    entries = []
+    for name in os.listdir(cache_dir):
+        path = os.path.join(cache_dir, name)
+        if not os.path.isdir(path):
+            continue
+        size = sum(os.path.getsize(os.path.join(path, f)) for f in os.listdir(path))
+        entries.append((os.path.getmtime(path), name, path, size))
+    total = sum(entry[3] for entry in entries)
+    for _, name, path, size in sorted(entries):
+        if total <= max_bytes:
+            break
+        if name == keep:
+            continue
+        shutil.rmtree(path, ignore_errors=True)
+        total -= size
+
+
+def env_int(name, default):
+    """Intero da variabile d'ambiente; valori non validi ricadono sul default con un avviso"""
+    value = os.environ.get(name, '').strip()
+    if not value:
+        return default
+    try:
+        return int(value)
+    except ValueError:
+        print(f"Avviso: {name}={value!r} non è un intero, uso {default}", file=sys.stderr)
+        return default
+
+
+# Metriche operative: endpoint HTTP e/o file in formato testo Prometheus
+# (0 / vuoto = disattivati)
+METRICS_PORT = env_int('AUDIOLINE_METRICS_PORT', 0)
+METRICS_FILE = os.environ.get('AUDIOLINE_METRICS_FILE', '')
+METRICS_FILE_INTERVAL = 15.0
+LATENCY_BUCKETS = (0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0)
+FRAME_LATENCY_BUCKETS = (0.002, 0.005, 0.01, 0.02, 0.05, 0.1, 0.2, 0.5, 1.0)
+
+
+class Metric:
+    """Contatore, gauge o istogramma con etichette, esposto in formato Prometheus"""
+
+    def __init__(self, name, kind, help_text, labels=(), buckets=None):
+        self.name = name
+        self.kind = kind
+        self.help_text = help_text
+        self.labels = tuple(labels)
+        self.buckets = buckets
+        self.function = None
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def _key(self, labels):
+        return tuple(str(labels[name]) for name in self.labels)
+
+    def inc(self, value=1.0, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + value
+
+    def set(self, value, **labels):
+        with self._lock:
+            self._values[self._key(labels)] = float(value)
+
+    def set_function(self, function):
+        """Gauge letto al momento dell'esportazione (es. profondità della coda)"""
+        self.function = function
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = {'counts': [0] * len(self.buckets), 'sum': 0.0, 'count': 0}
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    state['counts'][i] += 1
+            state['sum'] += value
+            state['count'] += 1
+
+    @contextlib.contextmanager
+    def time(self, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def _format_labels(self, key, extra=()):
+        pairs = list(zip(self.labels, key)) + list(extra)
+        if not pairs:
+            return ""
+        return "{" + ",".join(f'{name}="{value}"' for name, value in pairs) + "}"
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} {self.kind}"]
+        if self.function is not None:
+            self.set(self.function())
+        with self._lock:
+            values = {key: (dict(v, counts=list(v['counts'])) if isinstance(v, dict) else v)
+                      for key, v in self._values.items()}
+        for key, value in sorted(values.items()):
+            if self.kind != 'histogram':
+                lines.append(f"{self.name}{self._format_labels(key)} {value:g}")
+                continue
+            for bound, count in zip(self.buckets, value['counts']):
+                lines.append(f"{self.name}_bucket{self._format_labels(key, [('le', f'{bound:g}')])} {count}")
+            lines.append(f"{self.name}_bucket{self._format_labels(key, [('le', '+Inf')])} {value['count']}")
+            lines.append(f"{self.name}_sum{self._format_labels(key)} {value['sum']:g}")
+            lines.append(f"{self.name}_count{self._format_labels(key)} {value['count']}")
+        return "\n".join(lines)
+
+
+class MetricsRegistry:
+    """Insieme delle metriche del processo; `render()` produce il testo per /metrics"""
+
+    def __init__(self):
+        self.metrics = {}
+
+    def add(self, name, kind, help_text, labels=(), buckets=None):
+        metric = Metric(name, kind, help_text, labels, buckets)
+        self.metrics[name] = metric
+        return metric
+
+    def __getattr__(self, name):
+        try:
+            return self.__dict__['metrics'][f"audioline_{name}"]
+        except KeyError:
+            raise AttributeError(name)
+
+    def render(self):
+        return "\n".join(metric.render() for metric in self.metrics.values()) + "\n"
+
+    def write_file(self, path):
+        """Esportazione su file (es. textfile collector di node_exporter), scrittura atomica"""
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'w') as f:
+            f.write(self.render())
+        os.replace(tmp_path, path)
+
+
+@st.cache_resource(show_spinner=False)
+def get_metrics():
+    """Registro metriche unico del processo (condiviso tra rerun e sessioni)"""
+    registry = MetricsRegistry()
+    registry.add('audioline_renders_started_total', 'counter', "Rendering avviati", ('kind',))
+    registry.add('audioline_renders_completed_total', 'counter', "Rendering conclusi per esito", ('kind', 'status'))
+    registry.add('audioline_frames_rendered_total', 'counter', "Frame renderizzati", ('mode',))
+    registry.add('audioline_frame_render_seconds', 'histogram', "Tempo di rendering per frame", ('mode',),
+                 FRAME_LATENCY_BUCKETS)
+    registry.add('audioline_analysis_cache_requests_total', 'counter', "Richieste alla cache delle analisi",
+                 ('result',))
+    registry.add('audioline_analysis_seconds', 'histogram', "Durata dell'analisi STFT a bande", (), LATENCY_BUCKETS)
+    registry.add('audioline_decode_seconds', 'histogram', "Durata della decodifica audio", ('decoder',),
+                 LATENCY_BUCKETS)
+    registry.add('audioline_mux_seconds', 'histogram', "Durata del mux audio/video", ('audio_mode',),
+                 LATENCY_BUCKETS)
+    registry.add('audioline_encoder_errors_total', 'counter', "Errori di ffmpeg per fase", ('stage',))
+    registry.add('audioline_scheduler_wait_seconds', 'histogram', "Attesa in coda del pianificatore", ('kind',),
+                 LATENCY_BUCKETS)
+    registry.add('audioline_scheduler_queue_depth', 'gauge', "Job in attesa nel pianificatore")
+    registry.add('audioline_scheduler_running_jobs', 'gauge', "Job in esecuzione nel pianificatore")
+    return registry
+
+
+def serve_metrics(registry, port, host="0.0.0.0"):
+    """Avvia in un thread un server HTTP che espone `registry` su /metrics"""
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    class MetricsHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split('?')[0] != '/metrics':
+                self.send_error(404)
+                return
+            body = registry.render().encode()
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer((host, port), MetricsHandler)
+    threading.Thread(target=server.serve_forever, name="audioline-metrics", daemon=True).start()
+    return server
+
+
+def export_metrics_periodically(registry, path, interval=METRICS_FILE_INTERVAL):
+    """Riscrive il file delle metriche ogni `interval` secondi in un thread"""
+    def loop():
+        while True:
+            registry.write_file(path)
+            time.sleep(interval)
+    threading.Thread(target=loop, name="audioline-metrics-file", daemon=True).start()
+
+
+@st.cache_resource(show_spinner=False)
+def start_metrics_exporters(port=METRICS_PORT, path=METRICS_FILE):
+    """Endpoint e file exporter configurati, avviati una sola volta per processo"""
+    registry = get_metrics()
+    server = serve_metrics(registry, port) if port else None
+    if path:
+        export_metrics_periodically(registry, path)
+    return server
+
+
+# Codec audio copiati nel contenitore MP4 senza ricodifica
+MP4_AUDIO_CODECS = ('aac', 'mp3')
+
+# Rendition di un export multiplo (1080p per YouTube, 720p per il web, 540p per
+# le anteprime): lato corto in pixel e impostazioni x264 di ciascuna
+RENDITIONS = {
+    '1080p': {'short_side': 1080, 'crf': 20, 'preset': 'medium', 'maxrate': '8M', 'bufsize': '16M'},
+    '720p': {'short_side': 720, 'crf': 23, 'preset': 'medium', 'maxrate': '4M', 'bufsize': '8M'},
+    '540p': {'short_side': 540, 'crf': 27, 'preset': 'fast', 'maxrate': '1500k', 'bufsize': '3M'},
+}
+
+# Poster del brano: risoluzione e numero di tratti per layout
+POSTER_RESOLUTION = (1920, 1080)
+POSTER_LAYOUTS = ('overlay', 'strip')
+POSTER_FRAMES = {'overlay': 32, 'strip': 12}
+
+# Formati audio accettati (upload e report di intere cartelle)
+AUDIO_EXTENSIONS = ('wav', 'mp3', 'm4a', 'flac')
+
+# Formati decodificati direttamente con soundfile (libsndfile); gli altri via ffmpeg
+SOUNDFILE_EXTENSIONS = ('.wav', '.flac', '.ogg', '.aiff', '.aif')
+DECODE_BLOCK_FRAMES = 1 << 16
+
+
+def spool_upload(uploaded_file):
+    """Scrive l'upload su un file temporaneo una sola volta, senza copie in memoria"""
+    suffix = os.path.splitext(uploaded_file.name or "")[1].lower()
+    with tempfile.NamedTemporaryFile(delete=False, suffix=suffix) as tmpfile:
+        tmpfile.write(uploaded_file.getbuffer())
+        return tmpfile.name
+
+
+def probe_audio(path):
+    """Legge codec, sample rate, canali e durata del file audio"""
+    if path.lower().endswith(SOUNDFILE_EXTENSIONS):
+        import soundfile as sf
+        try:
+            info = sf.info(path)
+            return {
+                'codec': info.subtype.lower(),
+                'container': info.format.lower(),
+                'sr': info.samplerate,
+                'channels': info.channels,
+                'duration': info.duration
+            }
+        except RuntimeError:
+            pass
+
+    # ffmpeg senza output stampa le informazioni sullo stream e termina con errore
+    result = subprocess.run(['ffmpeg', '-hide_banner', '-i', path],
+                            stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    stderr = result.stderr.decode(errors='replace')
+    stream = re.search(r"Stream #\S+.*?: Audio: (\w+).*?, (\d+) Hz, ([^,]+)", stderr)
+    if stream is None:
+        raise ValueError(f"Nessuno stream audio trovato in {os.path.basename(path)}")
+    layout = stream.group(3).strip()
+    channels = {'mono': 1, 'stereo': 2}.get(layout)
+    if channels is None:
+        match = re.match(r"(\d+) channels", layout)
+        channels = int(match.group(1)) if match else 2
+    duration = re.search(r"Duration: (\d+):(\d+):(\d+(?:\.\d+)?)", stderr)
+    seconds = None
+    if duration:
+        seconds = int(duration.group(1)) * 3600 + int(duration.group(2)) * 60 + float(duration.group(3))
+    container = re.search(r"Input #0, ([^,]+)", stderr)
+    return {
+        'codec': stream.group(1),
+        'container': container.group(1) if container else '',
+        'sr': int(stream.group(2)),
+        'channels': channels,
+        'duration': seconds
+    }
+
+
+def decode_audio(path, start=0.0, duration=None, info=None, mono=True):
+    """Decodifica il file in float32 alla sample rate originale.
+
+    WAV/FLAC/OGG vengono letti a blocchi con soundfile, MP3/M4A e gli altri
+    formati tramite una pipe ffmpeg in PCM float32. In entrambi i casi il
+    downmix avviene blocco per blocco in un array preallocato, così il
+    picco di memoria è circa il solo segnale decodificato. Con `start` e
+    `duration` (secondi) viene decodificato solo quel tratto: soundfile fa
+    seek direttamente sul campione, ffmpeg usa `-ss`/`-t` in input.
+    Con `mono=False` l'audio è un array (canali, campioni) senza downmix.
+    Restituisce (audio, sr, nome del decoder).
+    """
+    if path.lower().endswith(SOUNDFILE_EXTENSIONS):
+        import soundfile as sf
+        try:
+            with sf.SoundFile(path) as f:
+                first = min(int(round(start * f.samplerate)), f.frames)
+                frames = f.frames - first
+                if duration is not None:
+                    frames = min(frames, int(round(duration * f.samplerate)))
+                f.seek(first)
+                audio = np.empty(frames if mono else (f.channels, frames), dtype=np.float32)
+                pos = 0
+                for block in f.blocks(blocksize=DECODE_BLOCK_FRAMES, frames=frames,
+                                      dtype='float32', always_2d=True):
+                    audio[..., pos:pos + len(block)] = block.mean(axis=1) if mono else block.T
+                    pos += len(block)
+                return audio[..., :pos], f.samplerate, "soundfile"
+        except RuntimeError:
+            pass
+
+    try:
+        info = info or probe_audio(path)
+        return decode_with_ffmpeg(path, info, start, duration, mono), info['sr'], "ffmpeg"
+    except (OSError, ValueError, subprocess.CalledProcessError):
+        # Ultima risorsa: il caricamento generico di librosa (audioread)
+        import librosa
+        audio, sr = librosa.load(path, sr=None, mono=mono, offset=start, duration=duration)
+        return audio, sr, "librosa"
+
+
+def decode_with_ffmpeg(path, info, start=0.0, duration=None, mono=True):
+    """Decodifica con ffmpeg in float32 interleaved e fa il downmix (o de-interleave) a blocchi"""
+    channels = info['channels']
+    # -ss/-t prima di -i: seek sul demuxer, si decodifica solo il segmento richiesto
+    seek = ['-ss', f"{start:.6f}"] if start > 0 else []
+    if duration is not None:
+        seek += ['-t', f"{duration:.6f}"]
+    command = ['ffmpeg', '-v', 'error', *seek, '-i', path, '-vn',
+               '-f', 'f32le', '-acodec', 'pcm_f32le', '-ac', str(channels), 'pipe:1']
+    process = subprocess.Popen(command, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+
+    # Preallocazione dalla durata dichiarata (con margine), estesa se necessario
+    total = info['duration'] or 60
+    length = max(total - start, 0) if duration is None else min(duration, max(total - start, 0))
+    expected = int(length * info['sr']) + info['sr']
+    audio = np.empty(expected if mono else (channels, expected), dtype=np.float32)
+    frame_bytes = 4 * channels
+    block = bytearray(DECODE_BLOCK_FRAMES * frame_bytes)
+    view = memoryview(block)
+    pos = 0
+    pending = 0
+    while True:
+        n = process.stdout.readinto(view[pending:])
+        if not n:
+            break
+        pending += n
+        usable = pending - pending % frame_bytes
+        samples = np.frombuffer(block, dtype=np.float32, count=usable // 4).reshape(-1, channels)
+        if pos + len(samples) > audio.shape[-1]:
+            grown = np.empty((*audio.shape[:-1], max(2 * audio.shape[-1], pos + len(samples))), dtype=np.float32)
+            grown[..., :pos] = audio[..., :pos]
+            audio = grown
+        audio[..., pos:pos + len(samples)] = samples.mean(axis=1) if mono else samples.T
+        pos += len(samples)
+        # Conserva l'eventuale frame incompleto per la lettura successiva
+        block[:pending - usable] = block[usable:pending]
+        pending -= usable
+
+    stderr = process.stderr.read()
+    if process.wait() != 0:
+        raise subprocess.CalledProcessError(process.returncode, command, stderr=stderr)
+    return audio[..., :pos]
+
+
+# Parametri STFT dell'analisi (condivisi con il pre-roll dei segmenti)
+ANALYSIS_N_FFT = 2048
+ANALYSIS_HOP_LENGTH = 512
+# Pre-roll decodificato prima dell'inizio di un segmento: le prime finestre STFT
+# vedono lo stesso audio che vedrebbero nell'analisi dell'intero brano
+ANALYSIS_PREROLL_SAMPLES = ANALYSIS_N_FFT
+ANALYSIS_CACHE_MAX_ENTRIES = 8
+# Frame STFT elaborati per blocco (limita la memoria dello spettrogramma)
+STFT_BLOCK_FRAMES = 1024
+# Risultati dell'analisi conservati in cache (le matrici STFT non vengono tenute)
+ANALYSIS_FIELDS = ('hop_length', 'n_fft', 'times', 'freq_bins', 'band_edges', 'band_energy',
+                   'channel_band_energy', 'channel_mode', 'band_maxima', 'control_signals')
+
+# Segnali di controllo calcolati insieme all'analisi (vedi `compute_control_signals`):
+# inviluppi attack/release delle bande, forza degli onset e curve di movimento.
+# Cambiano la geometria dei frame: se si modificano, incrementare GEOMETRY_CACHE_VERSION
+ENVELOPE_ATTACK_SECONDS = 0.02
+ENVELOPE_RELEASE_SECONDS = 0.3
+ONSET_MEL_BANDS = 64
+# Movimento delle onde: a tempo costante, a ritmo dei beat o spinto dagli onset
+MOTION_MODES = ('time', 'beat', 'onset')
+
+# Bande di analisi: i 3 intervalli storici (estremi inclusi) oppure N bande
+# lineari, logaritmiche, mel o con bordi scelti dall'utente
+BAND_SCALES = ('standard', 'linear', 'log', 'mel', 'custom')
+DEFAULT_BAND_EDGES = (20.0, 250.0, 4000.0, 20000.0)
+
+
+def file_fingerprint(path):
+    """SHA-1 del contenuto del file (chiave stabile tra upload e sessioni)"""
+    digest = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def load_segment(path, start=0.0, end=None, info=None, mono=True):
+    """Decodifica solo [start, end) più pre-roll e post-roll di analisi.
+
+    Il pre-roll è un multiplo di hop_length, così i frame STFT del segmento
+    sono allineati come in un'analisi che parte da `start`; il post-roll di
+    mezza finestra evita il padding a zero sull'ultimo frame (la durata del
+    segmento va passata ad AudioVisualizer come `duration`).
+    Restituisce (audio con pre-roll, sr, decoder, campioni di pre-roll).
+    """
+    try:
+        info = info or probe_audio(path)
+    except (OSError, ValueError):
+        info = None
+    if info is None:
+        # Formato non riconosciuto: decodifica completa e taglio in memoria
+        decode_start = time.perf_counter()
+        audio, sr, decoder = decode_audio(path, mono=mono)
+        get_metrics().decode_seconds.observe(time.perf_counter() - decode_start, decoder=decoder)
+        first = min(int(round(start * sr)), audio.shape[-1])
+        preroll = min(ANALYSIS_PREROLL_SAMPLES, first) // ANALYSIS_HOP_LENGTH * ANALYSIS_HOP_LENGTH
+        last = audio.shape[-1] if end is None else int(round(end * sr)) + ANALYSIS_N_FFT // 2
+        return audio[..., first - preroll:last], sr, decoder, preroll
+
+    sr = info['sr']
+    first = int(round(start * sr))
+    preroll = min(ANALYSIS_PREROLL_SAMPLES, first) // ANALYSIS_HOP_LENGTH * ANALYSIS_HOP_LENGTH
+    duration = None if end is None else max(end - start, 0.0) + (preroll + ANALYSIS_N_FFT // 2) / sr
+    decode_start = time.perf_counter()
+    audio, sr, decoder = decode_audio(path, (first - preroll) / sr, duration, info, mono)
+    get_metrics().decode_seconds.observe(time.perf_counter() - decode_start, decoder=decoder)
+    return audio, sr, decoder, preroll
+
+
+def make_band_edges(scale='standard', count=3, fmin=20.0, fmax=20000.0, edges=None, sr=None):
+    """Bordi in Hz (N+1 valori crescenti) delle bande di analisi"""
+    if scale == 'standard':
+        return np.array(DEFAULT_BAND_EDGES)
+    if scale == 'custom':
+        edges = np.unique(np.asarray(edges, dtype=np.float64))
+        if len(edges) < 2:
+            raise ValueError("Servono almeno due bordi per definire una banda")
+        return edges
+    if sr:
+        fmax = min(fmax, sr / 2)
+    if scale == 'linear':
+        return np.linspace(fmin, fmax, count + 1)
+    if scale == 'log':
+        return np.geomspace(max(fmin, 1.0), fmax, count + 1)
+    if scale == 'mel':
+        import librosa
+        return librosa.mel_frequencies(n_mels=count + 1, fmin=fmin, fmax=fmax)
+    raise ValueError(f"Scala di bande sconosciuta: {scale}")
+
+
+def build_filterbank(freq_bins, band_edges):
+    """Matrice sparsa (bande × bin): ogni riga fa la media del modulo sui bin della banda.
+
+    Come negli intervalli storici i bordi sono inclusi; una banda più stretta
+    di un bin usa il bin più vicino al suo centro.
+    """
+    from scipy import sparse
+
+    rows, cols, weights = [], [], []
+    for band, (low, high) in enumerate(zip(band_edges[:-1], band_edges[1:])):
+        idx = np.flatnonzero((freq_bins >= low) & (freq_bins <= high))
+        if idx.size == 0:
+            idx = np.array([np.argmin(np.abs(freq_bins - (low + high) / 2))])
+        rows.append(np.full(idx.size, band))
+        cols.append(idx)
+        weights.append(np.full(idx.size, 1.0 / idx.size, dtype=np.float32))
+    return sparse.csr_matrix(
+        (np.concatenate(weights), (np.concatenate(rows), np.concatenate(cols))),
+        shape=(len(band_edges) - 1, len(freq_bins))
+    )
+
+
+def default_layer_map(n_bands):
+    """Bande contigue divise tra i tre layer delle onde (basse, medie, acute)"""
+    if n_bands >= 3:
+        groups = np.array_split(np.arange(n_bands), 3)
+    else:
+        groups = [[min(i, n_bands - 1)] for i in range(3)]
+    return {layer: tuple(int(b) for b in group) for layer, group in zip(GEOMETRY_BANDS, groups)}
+
+
+def parse_layer_map(value):
+    """Mappa bande → layer nella forma "low=0,1;mid=2-5;high=6-7" """
+    layer_map = {}
+    for item in value.split(';'):
+        layer, _, bands = item.partition('=')
+        layer = layer.strip()
+        if layer not in GEOMETRY_BANDS or not bands.strip():
+            raise argparse.ArgumentTypeError(f"Mappa layer non valida: {item!r}")
+        indices = []
+        for part in bands.split(','):
+            first, _, last = part.strip().partition('-')
+            try:
+                indices.extend(range(int(first), int(last or first) + 1))
+            except ValueError:
+                raise argparse.ArgumentTypeError(f"Bande non valide per {layer}: {bands!r}")
+        layer_map[layer] = tuple(indices)
+    return layer_map
+
+
+def stft_band_energy(audio, n_fft, hop_length, filterbank, skip_frames=0, block_frames=STFT_BLOCK_FRAMES,
+                     center=True):
+    """Modulo STFT medio per banda, per tutti i canali insieme: (canali, bande, frame).
+
+    Equivale a `librosa.stft` (center=True con padding a zero, finestra Hann
+    periodica) seguito dal filterbank, ma lavora a blocchi di frame: ogni
+    blocco (canali × frame × n_fft) passa in una sola rfft e viene ridotto
+    subito con un unico prodotto per la matrice sparsa (bande × bin), senza
+    mai tenere in memoria lo spettrogramma completo. Il costo della riduzione
+    è proporzionale ai bin, non al numero di bande. I frame che precedono
+    `skip_frames` (pre-roll) non vengono calcolati. Con `center=False` i
+    frame sono causali (il frame k finisce al campione k·hop + n_fft), come
+    serve all'analisi live.
+    """
+    from scipy import fft as sp_fft
+
+    channels = np.atleast_2d(np.asarray(audio, dtype=np.float32))
+    if center:
+        channels = np.pad(channels, ((0, 0), (n_fft // 2, n_fft // 2)))
+    if channels.shape[-1] < n_fft:
+        return np.zeros((channels.shape[0], filterbank.shape[0], 0), dtype=np.float32)
+    frames = np.lib.stride_tricks.sliding_window_view(channels, n_fft, axis=-1)[:, skip_frames * hop_length::hop_length]
+    window = (0.5 - 0.5 * np.cos(2 * np.pi * np.arange(n_fft) / n_fft)).astype(np.float32)
+    # (bin × bande): il blocco (canali·frame × bin) si riduce con un solo prodotto
+    filterbank_t = filterbank.T.tocsr()
+    n_channels, n_bands = channels.shape[0], filterbank.shape[0]
+
+    energy = np.empty((n_channels, n_bands, frames.shape[1]), dtype=np.float32)
+    for start in range(0, frames.shape[1], block_frames):
+        magnitude = np.abs(sp_fft.rfft(frames[:, start:start + block_frames] * window, axis=-1))
+        reduced = magnitude.reshape(-1, magnitude.shape[-1]) @ filterbank_t
+        energy[:, :, start:start + block_frames] = reduced.reshape(n_channels, -1, n_bands).transpose(0, 2, 1)
+    return energy
+
+
+def attack_release_envelope(energy, hop_seconds, attack=ENVELOPE_ATTACK_SECONDS,
+                            release=ENVELOPE_RELEASE_SECONDS):
+    """Inviluppo attack/release lungo l'ultimo asse, vettoriale su tutti gli altri.
+
+    Il rilascio esponenziale con attacco istantaneo, y[t] = max_k x[t-k]·r^k,
+    in scala logaritmica diventa un massimo cumulativo (nessun ciclo sugli
+    hop); l'attacco è poi un IIR a un polo (`lfilter`) sullo stesso array.
+    """
+    from scipy.signal import lfilter
+
+    energy = np.asarray(energy, dtype=np.float64)
+    if energy.shape[-1] == 0:
+        return energy.astype(np.float32)
+    log_decay = np.arange(energy.shape[-1]) * (-hop_seconds / release)
+    log_energy = np.log(np.maximum(energy, np.finfo(np.float32).tiny))
+    peak = np.exp(np.maximum.accumulate(log_energy - log_decay, axis=-1) + log_decay)
+    pole = np.exp(-hop_seconds / attack)
+    smoothed, _ = lfilter([1 - pole], [1, -pole], peak, axis=-1, zi=pole * peak[..., :1])
+    return smoothed.astype(np.float32)
+
+
+def estimate_tempo(onset_strength, sr, hop_length, start_bpm=120.0, min_bpm=30.0, max_bpm=300.0):
+    """Tempo globale (BPM) dall'autocorrelazione dell'intero inviluppo di onset.
+
+    Stesso criterio di `librosa.feature.tempo` (autocorrelazione pesata da
+    un prior log-normale centrato su `start_bpm`), ma con una sola FFT
+    sull'intero brano invece di un tempogramma a finestre per ogni hop.
+    """
+    import librosa
+
+    autocorrelation = librosa.autocorrelate(onset_strength - onset_strength.mean())
+    lags = np.arange(1, len(autocorrelation))
+    bpms = 60.0 * sr / (hop_length * lags)
+    prior = np.exp(-0.5 * np.log2(bpms / start_bpm) ** 2)
+    score = np.where((bpms >= min_bpm) & (bpms <= max_bpm), autocorrelation[1:] * prior, -np.inf)
+    return float(bpms[np.argmax(score)]) if np.isfinite(score).any() else start_bpm
+
+
+def beat_motion_curve(beat_frames, n_hops):
+    """Tempo di movimento (in hop) agganciato ai beat.
+
+    Ogni beat fa avanzare la fase di un periodo medio di beat con una curva
+    ease-out: scatto sul colpo, rallentamento verso il successivo. In media
+    la velocità è la stessa del movimento a tempo costante. Prima del primo
+    e dopo l'ultimo beat la griglia prosegue con il periodo mediano.
+    """
+    hops = np.arange(n_hops, dtype=np.float64)
+    if len(beat_frames) < 2:
+        return hops
+    beat_frames = np.asarray(beat_frames, dtype=np.float64)
+    period = float(np.median(np.diff(beat_frames)))
+    beat_index = np.interp(hops, beat_frames, np.arange(len(beat_frames)))
+    beat_index = np.where(hops < beat_frames[0], (hops - beat_frames[0]) / period, beat_index)
+    beat_index = np.where(hops > beat_frames[-1], len(beat_frames) - 1 + (hops - beat_frames[-1]) / period,
+                          beat_index)
+    whole = np.floor(beat_index)
+    eased = 1 - (1 - (beat_index - whole)) ** 3
+    return (whole + eased) * period
+
+
+def compute_control_signals(channel_band_energy, band_energy, onset_spectrum, sr, hop_length):
+    """Segnali di controllo dell'intero brano, calcolati una volta con l'analisi.
+
+    - `envelope`/`band_envelope`: energie per banda (per canale e complessive)
+      con inviluppo attack/release, al posto di quelle grezze (effetto `smoothing`);
+    - `onset_strength`: flusso spettrale di `librosa.onset` sullo spettro mel
+      ridotto nello stesso passaggio STFT delle bande (0-1);
+    - `tempo`: BPM globale (vedi `estimate_tempo`);
+    - `motion_onset`: tempo di movimento in hop per `motion` 'onset' (avanza
+      con gli attacchi, si ferma nel silenzio).
+
+    I beat si aggiungono al primo uso (`compute_beat_signals`). I pattern
+    leggono solo questi array: il costo per frame non cambia.
+    """
+    import librosa
+
+    n_hops = band_energy.shape[-1]
+    envelope = attack_release_envelope(np.concatenate([channel_band_energy, band_energy[None]]),
+                                       hop_length / sr)
+    onset = np.zeros(n_hops, dtype=np.float32)
+    if n_hops > 1:
+        log_spectrum = librosa.amplitude_to_db(onset_spectrum, ref=np.max)
+        onset = librosa.onset.onset_strength(S=log_spectrum, sr=sr, hop_length=hop_length,
+                                             center=False).astype(np.float32)
+    peak = float(onset.max(initial=0.0))
+    tempo = 0.0
+    if peak > 0:
+        onset /= peak
+        tempo = estimate_tempo(onset, sr, hop_length)
+    mean_onset = float(onset.mean()) if n_hops else 0.0
+    return {
+        'envelope': envelope[:-1],
+        'band_envelope': envelope[-1],
+        'onset_strength': onset,
+        'tempo': tempo,
+        'motion_onset': np.cumsum(onset) / mean_onset if mean_onset > 0 else np.arange(n_hops, dtype=np.float64)
+    }
+
+
+def compute_beat_signals(onset_strength, tempo, sr, hop_length):
+    """Beat e curva di movimento 'beat' (`beat_frames`, `motion_beat`) dagli onset.
+
+    `librosa.beat.beat_track` riceve il tempo già stimato, così resta solo la
+    programmazione dinamica; separato da `compute_control_signals` perché la
+    prima chiamata nel processo compila il beat tracker (alcuni secondi) e
+    serve solo con `motion` 'beat'.
+    """
+    import librosa
+
+    beat_frames = np.zeros(0, dtype=np.int64)
+    if tempo > 0:
+        # trim=False: lo scalino di fine brano (padding) non deve scartare i beat deboli
+        _, beat_frames = librosa.beat.beat_track(onset_envelope=onset_strength, sr=sr, hop_length=hop_length,
+                                                 bpm=tempo, trim=False)
+    beat_frames = np.asarray(beat_frames, dtype=np.int64)
+    return {'beat_frames': beat_frames, 'motion_beat': beat_motion_curve(beat_frames, len(onset_strength))}
+
+
+@st.cache_resource(show_spinner=False)
+def get_analysis_cache():
+    """Cache delle analisi condivisa tra rerun e sessioni (chiave -> curve di banda)"""
+    return {'entries': {}, 'lock': threading.Lock()}
+
+
+def get_cached_analysis(key):
+    cache = get_analysis_cache()
+    with cache['lock']:
+        entry = cache['entries'].pop(key, None)
+        if entry is not None:
+            # Reinserita in coda: l'ordine del dict fa da LRU
+            cache['entries'][key] = entry
+        return entry
+
+
+def store_analysis(key, entry):
+    cache = get_analysis_cache()
+    with cache['lock']:
+        cache['entries'][key] = entry
+        while len(cache['entries']) > ANALYSIS_CACHE_MAX_ENTRIES:
+            del cache['entries'][next(iter(cache['entries']))]
+
+
+def prepare_analysis_channels(audio, channel_mode='mono'):
+    """Segnali da analizzare secondo la modalità canali.
+
+    `audio` è (campioni,) o (canali, campioni). Restituisce (segnali di
+    analisi, downmix mono, modalità effettiva): senza almeno due canali la
+    modalità torna 'mono'.
+    """
+    audio = np.asarray(audio)
+    if audio.ndim == 2 and audio.shape[0] == 1:
+        audio = audio[0]
+    if audio.ndim == 1:
+        return audio, audio, 'mono'
+    mono_audio = audio.mean(axis=0)
+    if channel_mode == 'stereo':
+        return audio[:2], mono_audio, channel_mode
+    if channel_mode == 'midside':
+        left, right = audio[0], audio[1]
+        return np.stack([(left + right) * 0.5, (left - right) * 0.5]), mono_audio, channel_mode
+    return mono_audio, mono_audio, 'mono'
+
+
+def get_track_band_maxima(path, fingerprint=None, info=None, channel_mode='mono', band_edges=None):
+    """Massimi di banda dell'intero brano, per normalizzare i segmenti in modo coerente.
+
+    L'analisi completa passa dalla cache: viene calcolata una sola volta per
+    file e riusata per tutte le clip estratte dallo stesso brano.
+    """
+    band_edges = np.asarray(DEFAULT_BAND_EDGES if band_edges is None else band_edges, dtype=np.float64)
+    key = (fingerprint or file_fingerprint(path), 0.0, None, channel_mode, tuple(band_edges))
+    entry = get_cached_analysis(key)
+    if entry is None:
+        decode_start = time.perf_counter()
+        audio, sr, decoder = decode_audio(path, info=info, mono=channel_mode == 'mono')
+        get_metrics().decode_seconds.observe(time.perf_counter() - decode_start, decoder=decoder)
+        AudioVisualizer(audio, sr, channel_mode=channel_mode, band_edges=band_edges, analysis_cache_key=key)
+        entry = get_cached_analysis(key)
+    return entry['band_maxima']
+
+
 # Classe AudioVisualizer semplificata
 class AudioVisualizer:
-    def __init__(self, audio_data, sr, duration=None):
-        self.audio_data = audio_data
+    # Errore massimo (pixel) ammesso tra onda ideale e spezzata disegnata
+    line_error_px = 0.25
+    min_line_points = 16
+    # Cartella della cache di geometria (None = GEOMETRY_CACHE_DIR)
+    geometry_cache_dir = None
+
+    def __init__(self, audio_data, sr, duration=None, source_path=None, source_info=None,
+                 start_time=0.0, preroll_samples=0, norm_maxima=None, analysis_cache_key=None,
+                 channel_mode='mono', band_edges=None, layer_map=None, geometry_cache_dir=None):
+        # audio_data può iniziare con `preroll_samples` campioni prima del segmento:
+        # servono solo all'analisi, il video parte da `start_time` del file sorgente.
+        # Può essere mono (campioni,) o multicanale (canali, campioni).
+        analysis_audio, mono_audio, channel_mode = prepare_analysis_channels(audio_data, channel_mode)
+        self.channel_mode = channel_mode
+        self.geometry_cache_dir = geometry_cache_dir
+        self.audio_data = mono_audio[preroll_samples:]
         self.sr = sr
-        self.original_duration = len(audio_data) / sr
-        self.duration = min(duration, self.original_duration) if duration else self.original_duration
-        self.setup_frequency_analysis()
+        self.start_time = start_time
+        # File originale (se disponibile): usato per il mux audio senza WAV intermedio
+        self.source_path = source_path
+        self.source_info = source_info
+        self.audio_mux_mode = None
+        self.original_duration = len(self.audio_data) / sr
+        self.duration = min(duration, self.original_duration) if duration is not None else self.original_duration
+
+        metrics = get_metrics()
+        cached = get_cached_analysis(analysis_cache_key) if analysis_cache_key is not None else None
+        if cached is not None:
+            metrics.analysis_cache_requests_total.inc(result='hit')
+            self.__dict__.update(cached)
+        else:
+            if analysis_cache_key is not None:
+                metrics.analysis_cache_requests_total.inc(result='miss')
+            with metrics.analysis_seconds.time():
+                self.setup_frequency_analysis(analysis_audio, preroll_samples, band_edges)
+            if analysis_cache_key is not None:
+                store_analysis(analysis_cache_key, {name: getattr(self, name) for name in ANALYSIS_FIELDS})
+        if norm_maxima is not None:
+            # Normalizzazione sui massimi dell'intero brano (clip coerenti tra loro)
+            self.band_maxima = np.asarray(norm_maxima, dtype=np.float32)
+        self.set_layer_map(layer_map)
+        self._static_layers = None
         
         # Variabili per il tracking dei colori
         self.color_statistics = {
@@ -28,60 +1011,194 @@ class AudioVisualizer:
             'total_energy': 0
         }
         
-    def setup_frequency_analysis(self):
-        """Configurazione analisi frequenze"""
-        # Parametri per l'analisi FFT
-        self.hop_length = 512
-        self.n_fft = 2048
-        
-        # Calcola spettrogramma
-        self.stft = librosa.stft(
-            self.audio_data, 
-            n_fft=self.n_fft, 
-            hop_length=self.hop_length
-        )
-        self.magnitude = np.abs(self.stft)
+    def setup_frequency_analysis(self, analysis_audio=None, preroll_samples=0, band_edges=None):
+        """Configurazione analisi frequenze.
+
+        `analysis_audio` include l'eventuale pre-roll: i frame STFT che cadono
+        prima dell'inizio del segmento non vengono nemmeno calcolati. Se è
+        multicanale (canali, campioni) STFT e riduzione in bande avvengono
+        insieme per tutti i canali (vedi `stft_band_energy`). `band_edges`
+        (Hz, N+1 valori) definisce le bande; di default le 3 storiche.
+        """
+        import librosa
+        from scipy import sparse
         
-        # Calcola il tempo per ogni frame
-        self.times = librosa.times_like(self.stft, sr=self.sr, hop_length=self.hop_length)
+        # Parametri per l'analisi FFT
+        self.hop_length = ANALYSIS_HOP_LENGTH
+        self.n_fft = ANALYSIS_N_FFT
+        if analysis_audio is None:
+            analysis_audio = self.audio_data
+        skip_frames = preroll_samples // self.hop_length
         
         # Definisci bande di frequenza
         self.freq_bins = librosa.fft_frequencies(sr=self.sr, n_fft=self.n_fft)
-        self.low_freq_idx = np.where((self.freq_bins >= 20) & (self.freq_bins <= 250))[0]
-        self.mid_freq_idx = np.where((self.freq_bins >= 250) & (self.freq_bins <= 4000))[0]
-        self.high_freq_idx = np.where((self.freq_bins >= 4000) & (self.freq_bins <= 20000))[0]
-        
-        # Trova il picco massimo per la normalizzazione
-        self.max_low = np.max(np.mean(self.magnitude[self.low_freq_idx, :], axis=0))
-        self.max_mid = np.max(np.mean(self.magnitude[self.mid_freq_idx, :], axis=0))
-        self.max_high = np.max(np.mean(self.magnitude[self.high_freq_idx, :], axis=0))
-        
-    def get_frequency_bands(self, time_idx):
-        """Estrai intensità per bande di frequenza"""
-        if time_idx >= self.magnitude.shape[1]:
-            return 0, 0, 0
-            
-        low_energy = np.mean(self.magnitude[self.low_freq_idx, time_idx])
-        mid_energy = np.mean(self.magnitude[self.mid_freq_idx, time_idx])
-        high_energy = np.mean(self.magnitude[self.high_freq_idx, time_idx])
+        self.band_edges = np.asarray(DEFAULT_BAND_EDGES if band_edges is None else band_edges, dtype=np.float64)
+        filterbank = build_filterbank(self.freq_bins, self.band_edges)
+        n_bands = filterbank.shape[0]
+        # Spettro mel per gli onset ridotto nello stesso passaggio: nessuna STFT in più
+        mel_filterbank = sparse.csr_matrix(librosa.filters.mel(sr=self.sr, n_fft=self.n_fft, n_mels=ONSET_MEL_BANDS))
+        
+        # Energia media per banda su tutti i frame e canali (canali x bande x frame)
+        energy = stft_band_energy(
+            analysis_audio, self.n_fft, self.hop_length, sparse.vstack([filterbank, mel_filterbank]).tocsr(),
+            skip_frames
+        )
+        self.channel_band_energy = np.ascontiguousarray(energy[:, :n_bands])
+        
+        # Calcola il tempo per ogni frame (0 = inizio del segmento)
+        self.times = librosa.frames_to_time(np.arange(self.channel_band_energy.shape[-1]),
+                                            sr=self.sr, hop_length=self.hop_length)
+        
+        # Curve "complessive" (statistiche colori, report): media L/R, oppure il canale mid
+        if self.channel_mode == 'stereo':
+            self.band_energy = self.channel_band_energy.mean(axis=0)
+        else:
+            self.band_energy = self.channel_band_energy[0]
+        
+        # Trova il picco massimo per la normalizzazione (comune a tutti i canali,
+        # così il bilanciamento tra i layer resta visibile)
+        self.band_maxima = np.max(self.channel_band_energy, axis=(0, 2))
+        
+        # Inviluppi, onset e beat dell'intero segmento (stesso criterio delle curve complessive)
+        onset_spectrum = energy[:, n_bands:].mean(axis=0) if self.channel_mode == 'stereo' else energy[0, n_bands:]
+        self.control_signals = compute_control_signals(self.channel_band_energy, self.band_energy,
+                                                       onset_spectrum, self.sr, self.hop_length)
+        
+    def set_layer_map(self, layer_map=None):
+        """Associa le bande ai tre layer delle onde: {'low': (0,), 'mid': (1,), 'high': (2,)}.
+
+        Ogni layer è guidato dalla media delle bande (normalizzate) che gli
+        sono assegnate; senza mappa le bande contigue sono divise in tre.
+        """
+        n_bands = len(self.band_maxima)
+        layer_map = dict(default_layer_map(n_bands), **(layer_map or {}))
+        for layer, bands in layer_map.items():
+            if not bands or min(bands) < 0 or max(bands) >= n_bands:
+                raise ValueError(f"Bande non valide per il layer '{layer}': {bands} (disponibili 0-{n_bands - 1})")
+        self.layer_map = {layer: tuple(layer_map[layer]) for layer in GEOMETRY_BANDS}
+        self.update_analysis_key()
         
-        return low_energy, mid_energy, high_energy
+    def get_layer_range(self, layer):
+        """Intervallo di frequenze coperto dalle bande di un layer, es. "20-250Hz" """
+        bands = self.layer_map[layer]
+        return f"{self.band_edges[min(bands)]:.0f}-{self.band_edges[max(bands) + 1]:.0f}Hz"
+        
+    def update_analysis_key(self):
+        """Impronta dell'analisi: identifica curve di banda e normalizzazione per le cache di geometria"""
+        digest = hashlib.sha1()
+        digest.update(np.ascontiguousarray(self.channel_band_energy, dtype=np.float32).tobytes())
+        digest.update(np.ascontiguousarray(self.band_maxima, dtype=np.float32).tobytes())
+        digest.update(repr((self.sr, self.hop_length, self.n_fft, float(self.duration),
+                            tuple(self.band_edges), sorted(self.layer_map.items()))).encode())
+        self.analysis_key = digest.hexdigest()
+        
+    def export_analysis(self, path):
+        """Salva le sole curve di banda (niente audio né STFT) in un npz compatto per i worker"""
+        np.savez(
+            path,
+            sr=self.sr, hop_length=self.hop_length, n_fft=self.n_fft,
+            duration=self.duration, start_time=self.start_time,
+            times=self.times, band_edges=self.band_edges,
+            channel_band_energy=self.channel_band_energy, band_maxima=self.band_maxima,
+            channel_mode=np.array(self.channel_mode),
+            **{f"layer_{layer}": np.array(bands) for layer, bands in self.layer_map.items()},
+            **{f"control_{name}": np.asarray(value) for name, value in self.control_signals.items()}
+        )
     
-    def get_normalized_bands(self, time_idx):
-        """Restituisce le bande normalizzate"""
-        low, mid, high = self.get_frequency_bands(time_idx)
+    @classmethod
+    def from_analysis(cls, path):
+        """Ricrea un visualizzatore pronto al rendering da un file di `export_analysis`"""
+        data = np.load(path)
+        self = cls.__new__(cls)
+        self.sr = int(data['sr'])
+        self.hop_length = int(data['hop_length'])
+        self.n_fft = int(data['n_fft'])
+        self.duration = self.original_duration = float(data['duration'])
+        self.start_time = float(data['start_time'])
+        self.times = data['times']
+        self.band_edges = data['band_edges']
+        self.channel_band_energy = data['channel_band_energy']
+        self.band_maxima = data['band_maxima']
+        self.channel_mode = str(data['channel_mode'])
+        if self.channel_mode == 'stereo':
+            self.band_energy = self.channel_band_energy.mean(axis=0)
+        else:
+            self.band_energy = self.channel_band_energy[0]
+        self.control_signals = {name[len("control_"):]: data[name] for name in data.files
+                                if name.startswith("control_")}
+        self.control_signals['tempo'] = float(self.control_signals['tempo'])
+        self.audio_data = np.zeros(0, dtype=np.float32)
+        self.source_path = None
+        self.source_info = None
+        self.audio_mux_mode = None
+        self._static_layers = None
+        self.color_statistics = {'low_total': 0, 'mid_total': 0, 'high_total': 0, 'total_energy': 0}
+        self.set_layer_map({layer: tuple(int(b) for b in data[f"layer_{layer}"]) for layer in GEOMETRY_BANDS})
+        return self
         
-        # Normalizza rispetto ai valori massimi
-        low_norm = low / self.max_low if self.max_low > 0 else 0
-        mid_norm = mid / self.max_mid if self.max_mid > 0 else 0
-        high_norm = high / self.max_high if self.max_high > 0 else 0
+    def get_band_energy(self, effects=None, per_channel=False):
+        """Curve di banda lette dai frame: grezze o, con l'effetto `smoothing`, con inviluppo attack/release"""
+        if effects is not None and effects.get('smoothing') and self.control_signals is not None:
+            return self.control_signals['envelope' if per_channel else 'band_envelope']
+        return self.channel_band_energy if per_channel else self.band_energy
+    
+    def get_motion_offset(self, time_idx, effects):
+        """Fase di movimento delle onde all'hop `time_idx` (anche array di hop).
+
+        Con `motion` 'time' avanza di `speed` radianti per hop; con 'beat' e
+        'onset' segue la curva precalcolata in `control_signals`, alla stessa
+        velocità media.
+        """
+        speed = effects.get('speed', 0.1)
+        motion = effects.get('motion', 'time')
+        if motion == 'time' or self.control_signals is None:
+            return time_idx * speed
+        return np.take(self.get_control_signal(f"motion_{motion}"), time_idx, mode='clip') * speed
+    
+    def get_control_signal(self, name):
+        """Un array di `control_signals`; i beat vengono calcolati alla prima richiesta.
+
+        Il dizionario è lo stesso conservato nella cache delle analisi: i beat
+        di un brano si calcolano una volta sola per tutte le sessioni.
+        """
+        signals = self.control_signals
+        if name in ('beat_frames', 'motion_beat') and 'beat_frames' not in signals:
+            signals.update(compute_beat_signals(signals['onset_strength'], signals['tempo'],
+                                                self.sr, self.hop_length))
+        return signals[name]
+    
+    def get_frequency_bands(self, time_idx, effects=None):
+        """Estrai intensità per bande di frequenza (una per banda di analisi)"""
+        band_energy = self.get_band_energy(effects)
+        if time_idx >= band_energy.shape[1]:
+            return np.zeros(band_energy.shape[0], dtype=np.float32)
         
-        # Applica un minimo per evitare valori troppo bassi
-        low_norm = max(low_norm, 0.1)
-        mid_norm = max(mid_norm, 0.1)
-        high_norm = max(high_norm, 0.1)
+        return band_energy[:, time_idx]
+    
+    def get_normalized_bands(self, time_idx, effects=None):
+        """Restituisce i valori normalizzati dei tre layer (basse, medie, acute)"""
+        return self.normalize_bands(self.get_frequency_bands(time_idx, effects))
+    
+    def get_channel_bands(self, time_idx, effects=None):
+        """Layer normalizzati per canale: una terna per canale (una sola in mono)"""
+        channel_band_energy = self.get_band_energy(effects, per_channel=True)
+        if channel_band_energy.shape[0] == 1:
+            return (self.get_normalized_bands(time_idx, effects),)
+        if time_idx >= channel_band_energy.shape[2]:
+            silence = np.zeros(channel_band_energy.shape[1], dtype=np.float32)
+            return tuple(self.normalize_bands(silence) for _ in range(channel_band_energy.shape[0]))
+        return tuple(self.normalize_bands(energy) for energy in channel_band_energy[:, :, time_idx])
+    
+    def normalize_bands(self, energies):
+        """Normalizza le energie per banda sui massimi e le riduce ai tre layer"""
+        # Normalizza rispetto ai valori massimi
+        maxima = self.band_maxima
+        normalized = np.divide(energies, maxima, out=np.zeros(len(maxima), dtype=np.float32), where=maxima > 0)
         
-        return low_norm, mid_norm, high_norm
+        # Media delle bande di ogni layer, con un minimo per evitare valori troppo bassi
+        return tuple(
+            max(float(normalized[list(self.layer_map[layer])].mean()), 0.1) for layer in GEOMETRY_BANDS
+        )
     
     def update_color_statistics(self, low_norm, mid_norm, high_norm):
         """Aggiorna le statistiche sui colori per il calcolo delle percentuali"""
@@ -92,25 +1209,110 @@ class AudioVisualizer:
         self.color_statistics['high_total'] += high_norm
         self.color_statistics['total_energy'] += total_frame_energy
     
-    def get_color_percentages(self):
+    def get_color_percentages(self, statistics=None):
         """Calcola le percentuali finali di utilizzo dei colori"""
-        total = self.color_statistics['total_energy']
+        statistics = statistics if statistics is not None else self.color_statistics
+        total = statistics['total_energy']
         
         if total == 0:
             return 0, 0, 0
             
-        low_percent = (self.color_statistics['low_total'] / total) * 100
-        mid_percent = (self.color_statistics['mid_total'] / total) * 100
-        high_percent = (self.color_statistics['high_total'] / total) * 100
+        low_percent = (statistics['low_total'] / total) * 100
+        mid_percent = (statistics['mid_total'] / total) * 100
+        high_percent = (statistics['high_total'] / total) * 100
         
         return low_percent, mid_percent, high_percent
     
+    def get_frame_time_indices(self, fps, first_frame=0, last_frame=None):
+        """Indice dell'hop di analisi mostrato da ogni frame del video in [first_frame, last_frame).
+
+        Il frame N viene mostrato all'istante N / fps: è quello il tempo da
+        cercare tra gli hop (non `times[-1] / total_frames`, che si
+        discosta dal periodo reale e fa scivolare le onde rispetto all'audio).
+        """
+        total_frames = int(self.duration * fps)
+        last_frame = total_frames if last_frame is None else last_frame
+        if len(self.times) < 2 or total_frames == 0:
+            return np.zeros(max(last_frame - first_frame, 0), dtype=np.int64)
+        current_times = np.arange(first_frame, last_frame) / fps
+        # Hop più vicino; a parità di distanza il precedente, come np.argmin
+        idx = np.clip(np.searchsorted(self.times, current_times), 1, len(self.times) - 1)
+        previous_closer = current_times - self.times[idx - 1] <= self.times[idx] - current_times
+        return np.where(previous_closer, idx - 1, idx)
+    
+    def compute_color_statistics(self, fps, duration=None, effects=None):
+        """Statistiche colori di un export a `fps` calcolate dalle sole curve di banda.
+
+        Danno gli stessi totali che `update_color_statistics` accumula durante
+        il rendering, ma senza renderizzare: ogni hop viene normalizzato e
+        ridotto ai tre layer una volta sola (un prodotto matriciale) e pesato
+        per il numero di frame che lo mostrano.
+        """
+        if duration is not None and duration < self.duration:
+            total_frames = int(duration * fps)
+        else:
+            total_frames = int(self.duration * fps)
+        time_indices = self.get_frame_time_indices(fps, 0, total_frames)
+        n_hops = self.band_energy.shape[1]
+        frames_per_hop = np.bincount(time_indices[time_indices < n_hops], minlength=n_hops)
+        silent_frames = total_frames - int(frames_per_hop.sum())
+        layer_totals = self.get_layer_curves(effects) @ frames_per_hop + 0.1 * silent_frames
+
+        low_total, mid_total, high_total = (float(total) for total in layer_totals)
+        return {
+            'low_total': low_total,
+            'mid_total': mid_total,
+            'high_total': high_total,
+            'total_energy': low_total + mid_total + high_total
+        }
+    
+    def get_layer_curves(self, effects=None):
+        """Valori normalizzati dei tre layer per ogni hop (3, hop), come `normalize_bands`"""
+        band_energy = self.get_band_energy(effects)
+        n_bands, n_hops = band_energy.shape
+        # Media delle bande di ogni layer come matrice (3, bande)
+        layer_weights = np.zeros((len(GEOMETRY_BANDS), n_bands))
+        for row, layer in enumerate(GEOMETRY_BANDS):
+            bands = list(self.layer_map[layer])
+            layer_weights[row, bands] = 1.0 / len(bands)
+        maxima = self.band_maxima.astype(np.float64)[:, None]
+        normalized = np.divide(band_energy, maxima, out=np.zeros((n_bands, n_hops)), where=maxima > 0)
+        return np.maximum(layer_weights @ normalized, 0.1)
+    
+    def generate_instant_report(self, audio_filename, video_title, pattern_type, colors, effects, fps,
+                                video_quality="Media (1280x720)", aspect_ratio="16:9 (Standard)", duration=None):
+        """Report (percentuali, banda dominante, testo social) senza renderizzare il video"""
+        effects = effects if effects is not None else DEFAULT_EFFECTS
+        statistics = self.compute_color_statistics(fps, duration, effects)
+        low_percent, mid_percent, high_percent = self.get_color_percentages(statistics)
+        total_frames = int(min(duration or self.duration, self.duration) * fps)
+        percentages = {'low': low_percent, 'mid': mid_percent, 'high': high_percent}
+        return {
+            'low_percent': low_percent,
+            'mid_percent': mid_percent,
+            'high_percent': high_percent,
+            'dominant': max(percentages, key=percentages.get),
+            'total_frames': total_frames,
+            'social_report': self.generate_social_report(
+                audio_filename, video_title, pattern_type, colors, effects, fps, total_frames,
+                video_quality, aspect_ratio, low_percent, mid_percent, high_percent
+            )
+        }
+    
     def get_resolution(self, video_quality, aspect_ratio):
         """Determina la risoluzione in pixel per il video"""
+        # Risoluzione personalizzata: (larghezza, altezza) in pixel, arrotondata
+        # a valori pari come richiesto da yuv420p
+        if isinstance(video_quality, (tuple, list)):
+            width, height = int(video_quality[0]), int(video_quality[1])
+            return (max(2, width - width % 2), max(2, height - height % 2))
+
         base_resolutions = {
             "Bassa (960x540)": (960, 540),
             "Media (1280x720)": (1280, 720), 
-            "Alta (1920x1080)": (1920, 1080)
+            "Alta (1920x1080)": (1920, 1080),
+            "2K (2560x1440)": (2560, 1440),
+            "4K (3840x2160)": (3840, 2160)
         }
         
         base_width, base_height = base_resolutions[video_quality]
@@ -133,65 +1335,85 @@ class AudioVisualizer:
             return (10, 10)
         elif aspect_ratio == "9:16 (Verticale)":
             return (9, 16)
-        else:
+
+        # Aspect ratio personalizzato nella forma "L:A (...)"
+        try:
+            ratio_w, ratio_h = aspect_ratio.split(' ')[0].split(':')
+            ratio = float(ratio_w) / float(ratio_h)
+        except (ValueError, ZeroDivisionError):
             return (16, 9)
-    
+        if ratio >= 1:
+            return (16, 16 / ratio)
+        return (16 * ratio, 16)
+
+    def get_render_dpi(self, resolution_px):
+        """DPI di rendering: oltre 1080p scala con la risoluzione.
+
+        Spessori delle linee e font sono in punti tipografici: aumentando i
+        DPI in proporzione al lato corto, un video 4K mantiene lo stesso
+        aspetto di uno 1080p invece di avere linee più sottili.
+        """
+        short_side = min(resolution_px)
+        return 100 * max(1.0, short_side / 1080)
+
+    def get_axes_pixel_size(self, ax):
+        """Dimensione in pixel dell'area di disegno degli assi"""
+        if isinstance(ax, LineRecorder):
+            return ax.size_px
+        fig = ax.figure
+        pos = ax.get_position()
+        width_px = pos.width * fig.get_figwidth() * fig.dpi
+        height_px = pos.height * fig.get_figheight() * fig.dpi
+        return width_px, height_px
+
+    def adaptive_x(self, ax, cycles, amplitude, xlim, ylim):
+        """Campiona l'asse x con il numero minimo di punti per la linea.
+
+        Per una sinusoide di ampiezza A (in pixel) con `cycles` periodi sulla
+        larghezza, l'errore massimo della spezzata con N punti è
+        A * (2π·cycles/(N-1))² / 8: si sceglie N perché resti sotto
+        `line_error_px`, limitato a due punti per pixel orizzontale.
+        """
+        width_px, height_px = self.get_axes_pixel_size(ax)
+        amp_px = np.max(np.abs(amplitude)) * height_px / ylim
+        n_points = int(np.ceil(2 * np.pi * cycles * np.sqrt(amp_px / (8 * self.line_error_px)))) + 1
+        max_points = max(self.min_line_points, int(2 * width_px))
+        n_points = min(max(n_points, self.min_line_points), max_points)
+        return np.linspace(0, xlim, n_points)
+
     def create_pattern_frame(self, time_idx, pattern_type="waves", colors=None, effects=None,
                             aspect_ratio="16:9 (Standard)", title_settings=None, 
                             resolution_px=None, dpi=100):
         """Crea un frame del pattern basato sulle frequenze - SOLO WAVES con effetti"""
-        low_norm, mid_norm, high_norm = self.get_normalized_bands(time_idx)
+        import matplotlib.pyplot as plt
         
-        # Aggiorna statistiche colori
-        self.update_color_statistics(low_norm, mid_norm, high_norm)
+        # Colori ed effetti default se non specificati
+        colors = colors if colors is not None else DEFAULT_COLORS
+        effects = effects if effects is not None else DEFAULT_EFFECTS
         
-        # Colori default se non specificati
-        if colors is None:
-            colors = {
-                'low': '#FF0000', 'mid': '#0000FF', 'high': '#FFFFFF', 'bg': '#000000'
-            }
+        low_norm, mid_norm, high_norm = self.get_normalized_bands(time_idx, effects)
         
-        # Effetti default se non specificati
-        if effects is None:
-            effects = {
-                'intensity': 1.0,
-                'speed': 0.1,
-                'randomness': 0.0
-            }
+        # Aggiorna statistiche colori
+        self.update_color_statistics(low_norm, mid_norm, high_norm)
         
         # Ottieni impostazioni aspect ratio
         xlim, ylim = self.get_aspect_ratio_limits(aspect_ratio)
         
         # Determina figure size basato su risoluzione
         if resolution_px and dpi:
-            figsize = (resolution_px[0] / dpi, resolution_px[1] / dpi)
+            figsize = self.get_figsize(resolution_px, dpi)
         else:
             # Modalità preview
             base_width = 10
             figsize = (base_width, base_width * (ylim / xlim))
         
-        fig, ax = plt.subplots(figsize=figsize, facecolor=colors['bg'], dpi=dpi)
+        # Canvas fisso: gli assi occupano tutta la figura
+        fig = plt.figure(figsize=figsize, facecolor=colors['bg'], dpi=dpi)
+        ax = fig.add_axes([0, 0, 1, 1])
         ax.set_facecolor(colors['bg'])
         
         # Disegna il pattern wave specifico
-        if pattern_type == "waves":
-            self.draw_classic_waves(ax, low_norm, mid_norm, high_norm, colors, effects, time_idx, xlim, ylim)
-        elif pattern_type == "interference":
-            self.draw_interference_waves(ax, low_norm, mid_norm, high_norm, colors, effects, time_idx, xlim, ylim)
-        elif pattern_type == "flowing":
-            self.draw_flowing_waves(ax, low_norm, mid_norm, high_norm, colors, effects, time_idx, xlim, ylim)
-        elif pattern_type == "am":
-            self.draw_am_waves(ax, low_norm, mid_norm, high_norm, colors, effects, time_idx, xlim, ylim)
-        elif pattern_type == "fm":
-            self.draw_fm_waves(ax, low_norm, mid_norm, high_norm, colors, effects, time_idx, xlim, ylim)
-        elif pattern_type == "reflected":
-            self.draw_reflected_waves(ax, low_norm, mid_norm, high_norm, colors, effects, time_idx, xlim, ylim)
-        elif pattern_type == "varied_amplitude":
-            self.draw_varied_amplitude_waves(ax, low_norm, mid_norm, high_norm, colors, effects, time_idx, xlim, ylim)
-        elif pattern_type == "varied_shape":
-            self.draw_varied_shape_waves(ax, low_norm, mid_norm, high_norm, colors, effects, time_idx, xlim, ylim)
-        elif pattern_type == "varied_motion":
-            self.draw_varied_motion_waves(ax, low_norm, mid_norm, high_norm, colors, effects, time_idx, xlim, ylim)
+        self.draw_pattern(ax, pattern_type, low_norm, mid_norm, high_norm, colors, effects, time_idx, xlim, ylim)
             
         # Aggiungi titolo se specificato
         if title_settings and title_settings['text']:
@@ -203,28 +1425,221 @@ class AudioVisualizer:
         
         return fig
 
-    def draw_title(self, ax, title_settings, xlim, ylim):
-        """Disegna il titolo in base alle impostazioni di posizione"""
-        h_pos = title_settings['h_position']
-        v_pos = title_settings['v_position']
-        
-        # Calcola le coordinate in base alla posizione
-        if h_pos == "Sinistra":
-            x = 0.05 * xlim
-            ha = 'left'
-        elif h_pos == "Destra":
-            x = 0.95 * xlim
-            ha = 'right'
-        else:  # Centro
-            x = 0.5 * xlim
-            ha = 'center'
+    def get_figsize(self, resolution_px, dpi):
+        """Dimensione figura in pollici che produce esattamente resolution_px.
+
+        Agg tronca la dimensione in pixel: il piccolo margine evita che
+        larghezza/dpi*dpi dia ad esempio 3839.999 invece di 3840.
+        """
+        return ((resolution_px[0] + 0.01) / dpi, (resolution_px[1] + 0.01) / dpi)
+
+    def draw_pattern(self, ax, pattern_type, low, mid, high, colors, effects, time_idx, xlim, ylim):
+        """Disegna il pattern wave specifico sugli assi"""
+        draw_methods = {
+            "waves": self.draw_classic_waves,
+            "interference": self.draw_interference_waves,
+            "flowing": self.draw_flowing_waves,
+            "am": self.draw_am_waves,
+            "fm": self.draw_fm_waves,
+            "reflected": self.draw_reflected_waves,
+            "varied_amplitude": self.draw_varied_amplitude_waves,
+            "varied_shape": self.draw_varied_shape_waves,
+            "varied_motion": self.draw_varied_motion_waves
+        }
+        draw_method = draw_methods.get(pattern_type)
+        if draw_method is not None:
+            draw_method(ax, low, mid, high, colors, effects, time_idx, xlim, ylim)
+
+    def get_static_layers(self, colors, aspect_ratio, title_settings, resolution_px, dpi):
+        """Prepara (una sola volta per video) i layer statici del frame.
+
+        Sfondo e assi vengono disegnati una volta e salvati come regione
+        Agg da ripristinare a ogni frame; il titolo è rasterizzato una volta
+        su sfondo trasparente e composto sopra le onde come immagine RGBA.
+        """
+        from matplotlib.figure import Figure
+        from matplotlib.backends.backend_agg import FigureCanvasAgg
         
-        if v_pos == "Sotto":
-            y = 0.05 * ylim
-            va = 'bottom'
-        else:  # Sopra
-            y = 0.95 * ylim
-            va = 'top'
+        title_key = None
+        if title_settings and title_settings['text']:
+            title_key = tuple(sorted(title_settings.items()))
+        key = (colors['bg'], aspect_ratio, title_key, tuple(resolution_px), dpi)
+        if self._static_layers is not None and self._static_layers['key'] == key:
+            return self._static_layers
+
+        xlim, ylim = self.get_aspect_ratio_limits(aspect_ratio)
+        figsize = self.get_figsize(resolution_px, dpi)
+
+        # Canvas fisso: gli assi occupano l'intera figura, ogni frame è esattamente W×H
+        fig = Figure(figsize=figsize, facecolor=colors['bg'], dpi=dpi)
+        canvas = FigureCanvasAgg(fig)
+        ax = fig.add_axes([0, 0, 1, 1])
+        ax.set_facecolor(colors['bg'])
+        ax.set_xlim(0, xlim)
+        ax.set_ylim(0, ylim)
+        ax.axis('off')
+        canvas.draw()
+        background = canvas.copy_from_bbox(fig.bbox)
+        if canvas.get_width_height() != tuple(resolution_px):
+            raise RuntimeError(f"Canvas di {canvas.get_width_height()} px invece di {tuple(resolution_px)} px "
+                               f"(dpi {dpi})")
+
+        title_overlay = None
+        if title_key is not None:
+            title_fig = Figure(figsize=figsize, facecolor='none', dpi=dpi)
+            title_canvas = FigureCanvasAgg(title_fig)
+            title_ax = title_fig.add_axes([0, 0, 1, 1])
+            title_ax.set_facecolor('none')
+            title_ax.set_xlim(0, xlim)
+            title_ax.set_ylim(0, ylim)
+            title_ax.axis('off')
+            self.draw_title(title_ax, title_settings, xlim, ylim)
+            title_canvas.draw()
+            rgba = np.asarray(title_canvas.buffer_rgba())
+            rows = np.flatnonzero(rgba[..., 3].any(axis=1))
+            cols = np.flatnonzero(rgba[..., 3].any(axis=0))
+            if rows.size and cols.size:
+                r0, r1, c0, c1 = rows[0], rows[-1] + 1, cols[0], cols[-1] + 1
+                patch = rgba[r0:r1, c0:c1].astype(np.float32)
+                title_overlay = {
+                    'slice': (slice(r0, r1), slice(c0, c1)),
+                    'rgb': patch[..., :3],
+                    'alpha': patch[..., 3:] / 255.0
+                }
+
+        self._static_layers = {
+            'key': key,
+            'fig': fig,
+            'canvas': canvas,
+            'ax': ax,
+            'background': background,
+            'title_overlay': title_overlay,
+            'line_pool': [],
+            'xlim': xlim,
+            'ylim': ylim,
+            'last_lines': None,
+            'last_line_colors': None,
+            'last_frame': None
+        }
+        return self._static_layers
+
+    def compute_frame_geometry(self, time_idx, channel_bands, pattern_type, effects, xlim, ylim, resolution_px):
+        """Calcola la geometria di un frame: linee (banda, x, y, spessore, alpha).
+
+        Con due canali il pattern viene disegnato una volta per canale, il
+        primo nella metà superiore e il secondo in quella inferiore: capovolto
+        (`mirrored`, speculare rispetto al centro) o diritto (`split`).
+        """
+        if len(channel_bands) == 1:
+            recorder = LineRecorder(resolution_px)
+            self.draw_pattern(recorder, pattern_type, *channel_bands[0], GEOMETRY_COLOR_KEYS,
+                              effects, time_idx, xlim, ylim)
+            return recorder.lines
+
+        layout = effects.get('stereo_layout', 'mirrored')
+        half_px = (resolution_px[0], resolution_px[1] / 2)
+        placements = [(0.5, ylim / 2), (-0.5, ylim / 2) if layout == 'mirrored' else (0.5, 0.0)]
+        lines = []
+        for bands, (y_scale, y_offset) in zip(channel_bands, placements):
+            recorder = LineRecorder(half_px, y_scale, y_offset)
+            self.draw_pattern(recorder, pattern_type, *bands, GEOMETRY_COLOR_KEYS, effects, time_idx, xlim, ylim)
+            lines.extend(recorder.lines)
+        return lines
+
+    def open_geometry_cache(self, pattern_type, effects, aspect_ratio, resolution_px, dpi, fps):
+        """Apre la cache di geometria per un video con questi parametri non cosmetici"""
+        effects = effects if effects is not None else DEFAULT_EFFECTS
+        return GeometryCache((
+            GEOMETRY_CACHE_VERSION, self.analysis_key, pattern_type, tuple(sorted(effects.items())),
+            aspect_ratio, tuple(resolution_px), dpi, fps, self.line_error_px
+        ), cache_dir=self.geometry_cache_dir)
+
+    def render_frame(self, time_idx, pattern_type="waves", colors=None, effects=None,
+                     aspect_ratio="16:9 (Standard)", title_settings=None,
+                     resolution_px=(1280, 720), dpi=100, geometry_cache=None, frame_idx=None):
+        """Renderizza un frame come array RGB riusando i layer statici.
+
+        Se la geometria differisce da quella dell'ultimo frame disegnato per
+        meno di `FRAME_REUSE_TOLERANCE_PX` (passaggi silenziosi o sostenuti)
+        viene restituito lo stesso array senza rasterizzare. Con una
+        `geometry_cache` la geometria del frame viene letta dalla cache
+        quando disponibile: resta solo la rasterizzazione con i colori
+        correnti.
+        """
+        from matplotlib.lines import Line2D
+        
+        colors = colors if colors is not None else DEFAULT_COLORS
+        effects = effects if effects is not None else DEFAULT_EFFECTS
+
+        bands = self.get_normalized_bands(time_idx, effects)
+        self.update_color_statistics(*bands)
+        channel_bands = self.get_channel_bands(time_idx, effects)
+
+        layers = self.get_static_layers(colors, aspect_ratio, title_settings, resolution_px, dpi)
+
+        lines = None
+        if geometry_cache is not None:
+            lines = geometry_cache.get(frame_idx)
+        if lines is None:
+            lines = self.compute_frame_geometry(time_idx, channel_bands, pattern_type, effects,
+                                                layers['xlim'], layers['ylim'], resolution_px)
+            if geometry_cache is not None:
+                geometry_cache.put(frame_idx, lines)
+
+        # Confronto con l'ultimo frame disegnato (non il precedente): piccoli
+        # spostamenti non si accumulano oltre la tolleranza
+        line_colors = tuple(colors[band] for band in GEOMETRY_BANDS)
+        px_per_unit = (resolution_px[0] / layers['xlim'], resolution_px[1] / layers['ylim'])
+        if line_colors == layers['last_line_colors'] and same_raster_geometry(lines, layers['last_lines'], px_per_unit):
+            return layers['last_frame']
+
+        canvas, ax = layers['canvas'], layers['ax']
+        canvas.restore_region(layers['background'])
+        line_pool = layers['line_pool']
+        while len(line_pool) < len(lines):
+            line_pool.append(ax.add_line(Line2D([], [])))
+        for line, (band, x, y, width, alpha) in zip(line_pool, lines):
+            line.set_data(x, y)
+            line.set_color(colors[band])
+            line.set_linewidth(width)
+            line.set_alpha(alpha)
+            ax.draw_artist(line)
+
+        frame = np.asarray(canvas.buffer_rgba())[..., :3].copy()
+
+        overlay = layers['title_overlay']
+        if overlay is not None:
+            region = frame[overlay['slice']]
+            blended = region * (1 - overlay['alpha']) + overlay['rgb'] * overlay['alpha']
+            region[...] = np.round(blended).astype(np.uint8)
+
+        layers['last_lines'] = lines
+        layers['last_line_colors'] = line_colors
+        layers['last_frame'] = frame
+        return frame
+
+    def draw_title(self, ax, title_settings, xlim, ylim):
+        """Disegna il titolo in base alle impostazioni di posizione"""
+        h_pos = title_settings['h_position']
+        v_pos = title_settings['v_position']
+        
+        # Calcola le coordinate in base alla posizione
+        if h_pos == "Sinistra":
+            x = 0.05 * xlim
+            ha = 'left'
+        elif h_pos == "Destra":
+            x = 0.95 * xlim
+            ha = 'right'
+        else:  # Centro
+            x = 0.5 * xlim
+            ha = 'center'
+        
+        if v_pos == "Sotto":
+            y = 0.05 * ylim
+            va = 'bottom'
+        else:  # Sopra
+            y = 0.95 * ylim
+            va = 'top'
         
         ax.text(
             x, y, 
@@ -239,10 +1654,8 @@ class AudioVisualizer:
     
     def draw_classic_waves(self, ax, low, mid, high, colors, effects, time_idx, xlim, ylim):
         """Pattern ondulatorio classico - originale con controlli"""
-        x = np.linspace(0, xlim, 500)
-        
         # Usa l'indice temporale per sincronizzare le onde con la musica
-        time_offset = time_idx * effects.get('speed', 0.1)
+        time_offset = self.get_motion_offset(time_idx, effects)
         intensity = effects.get('intensity', 1.0)
         randomness = effects.get('randomness', 0.0)
         
@@ -250,6 +1663,7 @@ class AudioVisualizer:
         for i in range(3):
             y_offset = ylim*0.2 + i * (ylim*0.25)
             random_offset = np.random.random() * randomness if randomness > 0 else 0
+            x = self.adaptive_x(ax, 0.3 + i * 0.2, low * intensity, xlim, ylim)
             wave = y_offset + low * intensity * np.sin(2 * np.pi * (0.3 + i * 0.2) * x/xlim + time_offset + random_offset)
             ax.plot(x, wave, color=colors['low'], linewidth=4*low*intensity, alpha=0.8)
         
@@ -257,6 +1671,7 @@ class AudioVisualizer:
         for i in range(4):
             y_offset = ylim*0.15 + i * (ylim*0.2)
             random_offset = np.random.random() * randomness if randomness > 0 else 0
+            x = self.adaptive_x(ax, 0.8 + i * 0.4, mid * intensity * 0.8, xlim, ylim)
             wave = y_offset + mid * intensity * 0.8 * np.sin(2 * np.pi * (0.8 + i * 0.4) * x/xlim + time_offset + random_offset)
             ax.plot(x, wave, color=colors['mid'], linewidth=3*mid*intensity, alpha=0.7)
         
@@ -264,64 +1679,74 @@ class AudioVisualizer:
         for i in range(5):
             y_offset = ylim*0.1 + i * (ylim*0.18)
             random_offset = np.random.random() * randomness if randomness > 0 else 0
+            x = self.adaptive_x(ax, 1.5 + i * 0.6, high * intensity * 0.6, xlim, ylim)
             wave = y_offset + high * intensity * 0.6 * np.sin(2 * np.pi * (1.5 + i * 0.6) * x/xlim + time_offset + random_offset)
             ax.plot(x, wave, color=colors['high'], linewidth=(1.5+high)*intensity, alpha=0.9)
     
     def draw_interference_waves(self, ax, low, mid, high, colors, effects, time_idx, xlim, ylim):
         """Pattern di interferenza strutturato - onde che si incrociano come nell'immagine"""
-        x = np.linspace(0, xlim, 1000)
-        time_offset = time_idx * effects.get('speed', 0.1)
+        time_offset = self.get_motion_offset(time_idx, effects)
         intensity = effects.get('intensity', 1.0)
         randomness = effects.get('randomness', 0.0)
         
         # Layer 1: Onde ampie (basse frequenze) - rosse/arancioni
-        num_low_waves = int(3 + low * 2)
-        for i in range(num_low_waves):
+        num_low_waves = np.floor(3 + low * 2)
+        for i in range(int(np.max(num_low_waves))):
+            present = i < num_low_waves  # con più frame insieme, onda presente solo in alcuni
             base_freq = 0.4 + i * 0.3
             random_offset = np.random.random() * randomness if randomness > 0 else 0
             
             # Onda principale
-            y1 = ylim/2 + low * intensity * 2.0 * np.sin(2 * np.pi * base_freq * x/xlim + time_offset + random_offset)
+            x1 = self.adaptive_x(ax, base_freq, low * intensity * 2.0, xlim, ylim)
+            y1 = ylim/2 + low * intensity * 2.0 * np.sin(2 * np.pi * base_freq * x1/xlim + time_offset + random_offset)
             # Onda interferente con fase diversa
-            y2 = ylim/2 + low * intensity * 1.5 * np.sin(2 * np.pi * (base_freq * 1.3) * x/xlim - time_offset * 0.7 + random_offset)
+            x2 = self.adaptive_x(ax, base_freq * 1.3, low * intensity * 1.5, xlim, ylim)
+            y2 = ylim/2 + low * intensity * 1.5 * np.sin(2 * np.pi * (base_freq * 1.3) * x2/xlim - time_offset * 0.7 + random_offset)
             
-            ax.plot(x, y1, color=colors['low'], linewidth=3 + low*2*intensity, alpha=0.7)
-            ax.plot(x, y2, color=colors['low'], linewidth=2.5 + low*1.5*intensity, alpha=0.5)
+            ax.plot(x1, y1, color=colors['low'], linewidth=3 + low*2*intensity, alpha=0.7 * present)
+            ax.plot(x2, y2, color=colors['low'], linewidth=2.5 + low*1.5*intensity, alpha=0.5 * present)
         
         # Layer 2: Onde medie (frequenze medie) - blu/turchesi
-        num_mid_waves = int(4 + mid * 3)
-        for i in range(num_mid_waves):
+        num_mid_waves = np.floor(4 + mid * 3)
+        for i in range(int(np.max(num_mid_waves))):
+            present = i < num_mid_waves
             base_freq = 1.0 + i * 0.4
             random_offset = np.random.random() * randomness if randomness > 0 else 0
             
             # Pattern di interferenza più complesso
-            y1 = ylim/2 + mid * intensity * 1.2 * np.sin(2 * np.pi * base_freq * x/xlim + time_offset * 1.5 + random_offset)
-            y2 = ylim/2 + mid * intensity * 0.8 * np.sin(2 * np.pi * (base_freq * 1.6) * x/xlim - time_offset + random_offset)
-            y3 = ylim/2 + mid * intensity * 0.6 * np.sin(2 * np.pi * (base_freq * 0.7) * x/xlim + time_offset * 2 + random_offset)
+            x1 = self.adaptive_x(ax, base_freq, mid * intensity * 1.2, xlim, ylim)
+            y1 = ylim/2 + mid * intensity * 1.2 * np.sin(2 * np.pi * base_freq * x1/xlim + time_offset * 1.5 + random_offset)
+            x2 = self.adaptive_x(ax, base_freq * 1.6, mid * intensity * 0.8, xlim, ylim)
+            y2 = ylim/2 + mid * intensity * 0.8 * np.sin(2 * np.pi * (base_freq * 1.6) * x2/xlim - time_offset + random_offset)
+            x3 = self.adaptive_x(ax, base_freq * 0.7, mid * intensity * 0.6, xlim, ylim)
+            y3 = ylim/2 + mid * intensity * 0.6 * np.sin(2 * np.pi * (base_freq * 0.7) * x3/xlim + time_offset * 2 + random_offset)
             
-            ax.plot(x, y1, color=colors['mid'], linewidth=2 + mid*1.5*intensity, alpha=0.8)
-            ax.plot(x, y2, color=colors['mid'], linewidth=1.5 + mid*intensity, alpha=0.6)
-            ax.plot(x, y3, color=colors['mid'], linewidth=1 + mid*0.8*intensity, alpha=0.4)
+            ax.plot(x1, y1, color=colors['mid'], linewidth=2 + mid*1.5*intensity, alpha=0.8 * present)
+            ax.plot(x2, y2, color=colors['mid'], linewidth=1.5 + mid*intensity, alpha=0.6 * present)
+            ax.plot(x3, y3, color=colors['mid'], linewidth=1 + mid*0.8*intensity, alpha=0.4 * present)
         
         # Layer 3: Onde acute (alte frequenze) - gialle/bianche
-        num_high_waves = int(6 + high * 4)
-        for i in range(num_high_waves):
+        num_high_waves = np.floor(6 + high * 4)
+        for i in range(int(np.max(num_high_waves))):
+            present = i < num_high_waves
             base_freq = 2.0 + i * 0.5
             random_offset = np.random.random() * randomness if randomness > 0 else 0
             
             # Onde rapide e sottili che si intersecano
-            y1 = ylim/2 + high * intensity * 0.8 * np.sin(2 * np.pi * base_freq * x/xlim + time_offset * 3 + random_offset)
-            y2 = ylim/2 + high * intensity * 0.6 * np.sin(2 * np.pi * (base_freq * 1.2) * x/xlim - time_offset * 2.5 + random_offset)
-            y3 = ylim/2 + high * intensity * 0.4 * np.sin(2 * np.pi * (base_freq * 0.8) * x/xlim + time_offset * 4 + random_offset)
+            x1 = self.adaptive_x(ax, base_freq, high * intensity * 0.8, xlim, ylim)
+            y1 = ylim/2 + high * intensity * 0.8 * np.sin(2 * np.pi * base_freq * x1/xlim + time_offset * 3 + random_offset)
+            x2 = self.adaptive_x(ax, base_freq * 1.2, high * intensity * 0.6, xlim, ylim)
+            y2 = ylim/2 + high * intensity * 0.6 * np.sin(2 * np.pi * (base_freq * 1.2) * x2/xlim - time_offset * 2.5 + random_offset)
+            x3 = self.adaptive_x(ax, base_freq * 0.8, high * intensity * 0.4, xlim, ylim)
+            y3 = ylim/2 + high * intensity * 0.4 * np.sin(2 * np.pi * (base_freq * 0.8) * x3/xlim + time_offset * 4 + random_offset)
             
-            ax.plot(x, y1, color=colors['high'], linewidth=1 + high*intensity, alpha=0.9)
-            ax.plot(x, y2, color=colors['high'], linewidth=0.8 + high*0.8*intensity, alpha=0.7)
-            ax.plot(x, y3, color=colors['high'], linewidth=0.6 + high*0.6*intensity, alpha=0.5)
+            ax.plot(x1, y1, color=colors['high'], linewidth=1 + high*intensity, alpha=0.9 * present)
+            ax.plot(x2, y2, color=colors['high'], linewidth=0.8 + high*0.8*intensity, alpha=0.7 * present)
+            ax.plot(x3, y3, color=colors['high'], linewidth=0.6 + high*0.6*intensity, alpha=0.5 * present)
     
     def draw_flowing_waves(self, ax, low, mid, high, colors, effects, time_idx, xlim, ylim):
         """Pattern completamente nuovo: Onde Stratificate Orizzontali come nell'immagine"""
-        x = np.linspace(0, xlim, 1200)
-        time_offset = time_idx * effects.get('speed', 0.1)
+        time_offset = self.get_motion_offset(time_idx, effects)
         intensity = effects.get('intensity', 1.0)
         randomness = effects.get('randomness', 0.0)
         
@@ -340,6 +1765,7 @@ class AudioVisualizer:
                 random_offset = np.random.random() * randomness if randomness > 0 else 0
                 
                 # Onda principale stratificata
+                x = self.adaptive_x(ax, freq, amplitude, xlim, ylim)
                 wave_y = y_base + amplitude * np.sin(2 * np.pi * freq * x/xlim + time_offset + random_offset)
                 
                 # Alpha e spessore basati sul layer
@@ -357,6 +1783,7 @@ class AudioVisualizer:
                 amplitude = mid * intensity * (0.3 + 0.2 * ((layer-4)/4))
                 random_offset = np.random.random() * randomness if randomness > 0 else 0
                 
+                x = self.adaptive_x(ax, freq, amplitude, xlim, ylim)
                 wave_y = y_base + amplitude * np.sin(2 * np.pi * freq * x/xlim + time_offset * 1.5 + random_offset)
                 
                 alpha_val = 0.5 + 0.3 * ((layer-4)/4)
@@ -373,6 +1800,7 @@ class AudioVisualizer:
                 amplitude = high * intensity * (0.2 + 0.15 * ((layer-8)/4))
                 random_offset = np.random.random() * randomness if randomness > 0 else 0
                 
+                x = self.adaptive_x(ax, freq, amplitude, xlim, ylim)
                 wave_y = y_base + amplitude * np.sin(2 * np.pi * freq * x/xlim + time_offset * 2.5 + random_offset)
                 
                 alpha_val = 0.6 + 0.4 * ((layer-8)/4)
@@ -383,54 +1811,58 @@ class AudioVisualizer:
 
     def draw_am_waves(self, ax, low, mid, high, colors, effects, time_idx, xlim, ylim):
         """Onde sinusoidali con modulazione di ampiezza (AM) per le 3 bande"""
-        x = np.linspace(0, xlim, 800)
-        time_offset = time_idx * effects.get('speed', 0.1)
+        time_offset = self.get_motion_offset(time_idx, effects)
         intensity = effects.get('intensity', 1.0)
         
         # Low freq - modulazione lenta e ampia
+        x = self.adaptive_x(ax, 0.4 + 0.2, low * intensity * 1.5, xlim, ylim)
         am_low = (1 + 0.5 * np.sin(2 * np.pi * 0.2 * x/xlim + time_offset)) 
         y_low = ylim*0.3 + low * intensity * am_low * np.sin(2 * np.pi * 0.4 * x/xlim + time_offset)
         ax.plot(x, y_low, color=colors['low'], linewidth=3*low*intensity, alpha=0.8)
 
         # Mid freq - modulazione media
+        x = self.adaptive_x(ax, 0.8 + 0.4, mid * intensity * 1.4, xlim, ylim)
         am_mid = (1 + 0.4 * np.sin(2 * np.pi * 0.4 * x/xlim + time_offset*1.2))
         y_mid = ylim*0.5 + mid * intensity * am_mid * np.sin(2 * np.pi * 0.8 * x/xlim + time_offset*1.5)
         ax.plot(x, y_mid, color=colors['mid'], linewidth=2.5*mid*intensity, alpha=0.7)
 
         # High freq - modulazione veloce
+        x = self.adaptive_x(ax, 1.6 + 0.8, high * intensity * 1.3, xlim, ylim)
         am_high = (1 + 0.3 * np.sin(2 * np.pi * 0.8 * x/xlim + time_offset*2))
         y_high = ylim*0.7 + high * intensity * am_high * np.sin(2 * np.pi * 1.6 * x/xlim + time_offset*2.2)
         ax.plot(x, y_high, color=colors['high'], linewidth=2*high*intensity, alpha=0.9)
 
     def draw_fm_waves(self, ax, low, mid, high, colors, effects, time_idx, xlim, ylim):
         """Onde sinusoidali con modulazione di frequenza (FM) per le 3 bande"""
-        x = np.linspace(0, xlim, 800)
-        time_offset = time_idx * effects.get('speed', 0.1)
+        time_offset = self.get_motion_offset(time_idx, effects)
         intensity = effects.get('intensity', 1.0)
         
         # Low freq - FM lenta
+        x = self.adaptive_x(ax, 0.4 + 0.1 * (1 + 2 * np.pi * 0.2), low * intensity, xlim, ylim)
         freq_low = 0.4 + 0.1 * np.sin(2 * np.pi * 0.2 * x/xlim + time_offset)
         y_low = ylim*0.3 + low * intensity * np.sin(2 * np.pi * freq_low * x/xlim + time_offset)
         ax.plot(x, y_low, color=colors['low'], linewidth=3*low*intensity, alpha=0.8)
 
         # Mid freq - FM media
+        x = self.adaptive_x(ax, 0.8 + 0.15 * (1 + 2 * np.pi * 0.3), mid * intensity, xlim, ylim)
         freq_mid = 0.8 + 0.15 * np.sin(2 * np.pi * 0.3 * x/xlim + time_offset*1.3)
         y_mid = ylim*0.5 + mid * intensity * np.sin(2 * np.pi * freq_mid * x/xlim + time_offset*1.4)
         ax.plot(x, y_mid, color=colors['mid'], linewidth=2.5*mid*intensity, alpha=0.7)
 
         # High freq - FM veloce
+        x = self.adaptive_x(ax, 1.6 + 0.2 * (1 + 2 * np.pi * 0.5), high * intensity, xlim, ylim)
         freq_high = 1.6 + 0.2 * np.sin(2 * np.pi * 0.5 * x/xlim + time_offset*1.8)
         y_high = ylim*0.7 + high * intensity * np.sin(2 * np.pi * freq_high * x/xlim + time_offset*1.9)
         ax.plot(x, y_high, color=colors['high'], linewidth=2*high*intensity, alpha=0.9)
 
     def draw_reflected_waves(self, ax, low, mid, high, colors, effects, time_idx, xlim, ylim):
         """Onde sinusoidali riflesse simmetricamente per le 3 bande"""
-        x = np.linspace(0, xlim, 800)
-        time_offset = time_idx * effects.get('speed', 0.1)
+        time_offset = self.get_motion_offset(time_idx, effects)
         intensity = effects.get('intensity', 1.0)
         
         # Funzione helper per specchiare onde
         def draw_reflected(y_base, amplitude, freq, color, width, alpha):
+            x = self.adaptive_x(ax, freq, amplitude, xlim, ylim)
             y = amplitude * np.sin(2 * np.pi * freq * x/xlim + time_offset)
             ax.plot(x, y_base + y, color=color, linewidth=width, alpha=alpha)
             ax.plot(x, y_base - y, color=color, linewidth=width, alpha=alpha)
@@ -445,81 +1877,173 @@ class AudioVisualizer:
     # NUOVI EFFETTI AGGIUNTI
     def draw_varied_amplitude_waves(self, ax, low, mid, high, colors, effects, time_idx, xlim, ylim):
         """Onde con ampiezza modulata diversamente per ogni banda"""
-        x = np.linspace(0, xlim, 800)
-        time_offset = time_idx * effects.get('speed', 0.1)
+        time_offset = self.get_motion_offset(time_idx, effects)
         intensity = effects.get('intensity', 1.0)
         
         # Low: pulsazione esponenziale
+        x = self.adaptive_x(ax, 0.4, low * intensity * (0.5 + 0.5 * np.e), xlim, ylim)
         amp_low = low * intensity * (0.5 + 0.5 * np.exp(np.sin(0.5 * x/xlim + time_offset)))
         y_low = ylim*0.3 + amp_low * np.sin(2 * np.pi * 0.4 * x/xlim + time_offset)
         ax.plot(x, y_low, color=colors['low'], linewidth=3, alpha=0.8)
 
         # Mid: ampiezza a gradini
+        x = self.adaptive_x(ax, 0.8, mid * intensity, xlim, ylim)
+        # Punti extra ai bordi dei gradini per mantenere il salto netto
+        step_edges = np.arange(1, 5) * xlim / 5
+        x = np.sort(np.concatenate([x, step_edges, step_edges - xlim * 1e-6]))
         steps = np.floor(5 * x/xlim) / 5  # 5 gradini
         amp_mid = mid * intensity * (0.4 + 0.6 * steps)
         y_mid = ylim*0.5 + amp_mid * np.sin(2 * np.pi * 0.8 * x/xlim + time_offset*1.5)
         ax.plot(x, y_mid, color=colors['mid'], linewidth=2.5, alpha=0.7)
 
         # High: modulazione lenta
+        x = self.adaptive_x(ax, 1.6, high * intensity, xlim, ylim)
         amp_high = high * intensity * (0.6 + 0.4 * np.sin(0.2 * x/xlim + time_offset*0.5))
         y_high = ylim*0.7 + amp_high * np.sin(2 * np.pi * 1.6 * x/xlim + time_offset*2)
         ax.plot(x, y_high, color=colors['high'], linewidth=2, alpha=0.9)
 
     def draw_varied_shape_waves(self, ax, low, mid, high, colors, effects, time_idx, xlim, ylim):
         """Onde con forme diverse per ogni banda"""
-        x = np.linspace(0, xlim, 800)
-        time_offset = time_idx * effects.get('speed', 0.1)
+        time_offset = self.get_motion_offset(time_idx, effects)
         intensity = effects.get('intensity', 1.0)
         
         # Low: sinusoide classica
+        x = self.adaptive_x(ax, 0.4, low * intensity, xlim, ylim)
         y_low = ylim*0.3 + low * intensity * np.sin(2 * np.pi * 0.4 * x/xlim + time_offset)
         ax.plot(x, y_low, color=colors['low'], linewidth=3, alpha=0.8)
 
         # Mid: sinusoide + armonica (più appuntita)
+        x = self.adaptive_x(ax, 1.6, mid * intensity * 1.3, xlim, ylim)
         theta = 2 * np.pi * 0.8 * x/xlim + time_offset*1.5
         y_mid = ylim*0.5 + mid * intensity * (np.sin(theta) + 0.3 * np.sin(2*theta))
         ax.plot(x, y_mid, color=colors['mid'], linewidth=2.5, alpha=0.7)
 
         # High: doppio seno (effetto schiacciato)
+        x = self.adaptive_x(ax, 1.6, high * intensity, xlim, ylim)
         y_high = ylim*0.7 + high * intensity * np.sin(np.sin(2 * np.pi * 1.6 * x/xlim + time_offset*2))
         ax.plot(x, y_high, color=colors['high'], linewidth=2, alpha=0.9)
 
     def draw_varied_motion_waves(self, ax, low, mid, high, colors, effects, time_idx, xlim, ylim):
         """Onde con movimenti diversi per ogni banda"""
-        x = np.linspace(0, xlim, 800)
-        time_offset = time_idx * effects.get('speed', 0.1)
+        time_offset = self.get_motion_offset(time_idx, effects)
         intensity = effects.get('intensity', 1.0)
         
         # Low: movimento orizzontale standard
+        x = self.adaptive_x(ax, 0.4, low * intensity, xlim, ylim)
         y_low = ylim*0.3 + low * intensity * np.sin(2 * np.pi * 0.4 * x/xlim + time_offset)
         ax.plot(x, y_low, color=colors['low'], linewidth=3, alpha=0.8)
 
-        # Mid: movimento diagonale (x e y combinati)
+        # Mid: movimento diagonale (x e y combinati), y_low ricampionata sulla griglia della linea
+        x = self.adaptive_x(ax, 0.8, mid * intensity, xlim, ylim)
+        y_low = ylim*0.3 + low * intensity * np.sin(2 * np.pi * 0.4 * x/xlim + time_offset)
         y_mid = ylim*0.5 + mid * intensity * np.sin(2 * np.pi * 0.8 * (0.7*x/xlim + 0.3*y_low/ylim) + time_offset*1.5)
         ax.plot(x, y_mid, color=colors['mid'], linewidth=2.5, alpha=0.7)
 
         # High: movimento a zig-zag (inversione di fase)
+        x = self.adaptive_x(ax, 1.6, high * intensity, xlim, ylim)
         phase_mod = np.sign(np.sin(0.5 * time_offset))  # inverte la fase periodicamente
         y_high = ylim*0.7 + high * intensity * np.sin(2 * np.pi * 1.6 * x/xlim + phase_mod * time_offset*2)
         ax.plot(x, y_high, color=colors['high'], linewidth=2, alpha=0.9)
     
+    def render_poster(self, pattern_type, colors=None, effects=None, resolution_px=POSTER_RESOLUTION,
+                      layout='overlay', frames=None, title_settings=None, dpi=None):
+        """Immagine unica che riassume l'intero brano con il pattern e i colori scelti.
+
+        Il brano è diviso in `frames` tratti consecutivi; per ciascuno si usa
+        la media dei layer normalizzati e il tempo centrale. La geometria di
+        tutti i tratti è calcolata in un solo passaggio dei metodi draw_*
+        (bande e tempi come colonne) e rasterizzata con una sola
+        LineCollection: il costo è quello di circa un frame. `layout`
+        'overlay' sovrappone i tratti in trasparenza, 'strip' li affianca da
+        sinistra a destra come una striscia temporale. In stereo si usano le
+        bande combinate dei due canali. Restituisce l'array RGB.
+        """
+        from matplotlib.figure import Figure
+        from matplotlib.backends.backend_agg import FigureCanvasAgg
+        from matplotlib.collections import LineCollection
+        from matplotlib.colors import to_rgba
+        
+        colors = colors if colors is not None else DEFAULT_COLORS
+        effects = effects if effects is not None else DEFAULT_EFFECTS
+        dpi = dpi or self.get_render_dpi(resolution_px)
+        xlim, ylim = self.get_aspect_ratio_limits(f"{resolution_px[0]}:{resolution_px[1]} (Personalizzato)")
+
+        # Layer medi e hop centrale di ogni tratto
+        curves = self.get_layer_curves(effects)
+        n_hops = curves.shape[1]
+        count = max(1, min(frames or POSTER_FRAMES[layout], n_hops))
+        edges = np.linspace(0, n_hops, count + 1).astype(int)
+        layers = np.add.reduceat(curves, edges[:-1], axis=1) / np.diff(edges)
+        hops = (edges[:-1] + edges[1:]) // 2
+
+        # Geometria di tutti i tratti in un solo passaggio
+        size_px = resolution_px if layout == 'overlay' else (resolution_px[0] / count, resolution_px[1])
+        recorder = LineRecorder(size_px)
+        low, mid, high = (layer[:, None] for layer in layers)
+        self.draw_pattern(recorder, pattern_type, low, mid, high, GEOMETRY_COLOR_KEYS, effects,
+                          hops[:, None], xlim, ylim)
+
+        segments = []
+        for (_, x, y, _, _), row in zip(recorder.lines, recorder.line_rows):
+            if layout == 'strip':
+                x = (row + x / xlim) * (xlim / count)
+            segments.append(np.column_stack([x, y]))
+        # In sovrapposizione l'alpha scala con il numero di tratti, così il poster non satura
+        alpha_scale = min(1.0, 2.0 / np.sqrt(count)) if layout == 'overlay' else 1.0
+        band_rgba = {band: np.array(to_rgba(colors[band])) for band in GEOMETRY_BANDS}
+        line_colors = np.array([band_rgba[band] for band, _, _, _, _ in recorder.lines]).reshape(-1, 4)
+        line_colors[:, 3] *= np.array([alpha for _, _, _, _, alpha in recorder.lines]) * alpha_scale
+
+        fig = Figure(figsize=self.get_figsize(resolution_px, dpi), facecolor=colors['bg'], dpi=dpi)
+        canvas = FigureCanvasAgg(fig)
+        ax = fig.add_axes([0, 0, 1, 1])
+        ax.set_facecolor(colors['bg'])
+        ax.set_xlim(0, xlim)
+        ax.set_ylim(0, ylim)
+        ax.axis('off')
+        ax.add_collection(LineCollection(
+            segments, colors=line_colors, linewidths=[width for _, _, _, width, _ in recorder.lines],
+            capstyle='projecting', joinstyle='round'
+        ))
+        if title_settings and title_settings['text']:
+            self.draw_title(ax, title_settings, xlim, ylim)
+        canvas.draw()
+        return np.asarray(canvas.buffer_rgba())[..., :3].copy()
+    
+    def generate_poster_png(self, pattern_type, colors=None, effects=None, resolution_px=POSTER_RESOLUTION,
+                            layout='overlay', title_settings=None):
+        """Poster del brano codificato in PNG (per download o salvataggio accanto all'MP4)"""
+        import imageio
+        
+        poster = self.render_poster(pattern_type, colors, effects, resolution_px, layout,
+                                    title_settings=title_settings)
+        buf = io.BytesIO()
+        imageio.v2.imwrite(buf, poster, format='png')
+        return buf.getvalue()
+    
     def generate_preview_frames(self, pattern_type, colors, effects, num_frames=12):
         """Genera una griglia di frame preview a bassa risoluzione (no time.sleep)"""
+        import imageio
+        
+        metrics = get_metrics()
+        metrics.renders_started_total.inc(kind='preview')
         preview_times = np.linspace(0, len(self.times) - 1, num_frames, dtype=int)
         frames = []
         for t_idx in preview_times:
-            fig = self.create_pattern_frame(
+            frame_start = time.perf_counter()
+            frame = self.render_frame(
                 int(t_idx), pattern_type, colors, effects,
                 aspect_ratio="16:9 (Standard)",
                 title_settings=None,
                 resolution_px=(320, 180),
                 dpi=72
             )
+            metrics.frame_render_seconds.observe(time.perf_counter() - frame_start, mode='preview')
+            metrics.frames_rendered_total.inc(mode='preview')
             buf = io.BytesIO()
-            fig.savefig(buf, format='png', bbox_inches='tight', pad_inches=0)
-            plt.close(fig)
-            buf.seek(0)
-            frames.append(buf.read())
+            imageio.v2.imwrite(buf, frame, format='png')
+            frames.append(buf.getvalue())
+        metrics.renders_completed_total.inc(kind='preview', status='ok')
         return frames
 
     def generate_social_report(self, audio_filename, video_title, pattern_type, colors, effects,
@@ -601,251 +2125,1733 @@ creating a {intensity_word}, {speed_word} animation,
   DURATION     {self.duration:.1f}s
   SAMPLERATE   {self.sr:,} Hz
 
-:: TRACK INFO
+:: TRACK INFO
+
+  TRACK        *{track_name}*
+  DURATION     {duration_codec}
+  SAMPLERATE   {self.sr:,} Hz
+  RESOLUTION   {w}x{h} px  ·  {aspect_ratio}
+  FRAMES       {total_frames:,} @ {fps} FPS
+  GENERATED    {date_codec}  {time_codec}
+
+__________________________________________
+#audiovisualization #musicvisualizer #audiolinetwo
+#waves #soundart #musicart #visualmusic #frequencyart
+#audioreactive #waveform #sounddesign #generativeart
+__________________________________________
+
+audiovisualization, musicvisualizer, audiolinetwo,
+waves, soundart, musicart, visualmusic, frequencyart,
+audioreactive, waveform, sounddesign, generativeart,
+"""
+        return report
+
+    def create_video_no_audio(self, output_path, pattern_type, colors, effects, fps, 
+                             aspect_ratio="16:9 (Standard)", video_quality="Media (1280x720)", 
+                             title_settings=None, progress_callback=None, frame_range=None):
+        """Crea un video senza audio.
+
+        I frame vengono passati all'encoder uno alla volta appena
+        renderizzati: la memoria resta limitata a un singolo frame qualunque
+        sia la risoluzione o la durata. Con `frame_range` (inizio, fine) viene
+        codificato solo quel tratto della timeline, con la stessa
+        corrispondenza frame→tempo del video completo (segmenti distribuiti).
+        """
+        import imageio
+        
+        # Reset statistiche colori
+        self.color_statistics = {
+            'low_total': 0,
+            'mid_total': 0,
+            'high_total': 0,
+            'total_energy': 0
+        }
+        
+        # Calcola la risoluzione finale
+        resolution_px = self.get_resolution(video_quality, aspect_ratio)
+        dpi = self.get_render_dpi(resolution_px)
+        
+        # Calcola il numero totale di frame
+        total_frames = int(self.duration * fps)
+        first_frame, last_frame = frame_range if frame_range is not None else (0, total_frames)
+        if progress_callback is None:
+            progress_bar = st.progress(0)
+            status_text = st.empty()
+        
+        # Hop di analisi mostrato da ogni frame
+        time_indices = self.get_frame_time_indices(fps, first_frame, last_frame)
+        
+        # Geometria dei frame in cache: se cambiano solo colori/titolo non viene ricalcolata
+        geometry_cache = self.open_geometry_cache(pattern_type, effects, aspect_ratio, resolution_px, dpi, fps)
+        
+        frame_seconds = get_metrics().frame_render_seconds
+        frames_rendered = get_metrics().frames_rendered_total
+        
+        # Genera i frame e codificali in streaming (dimensioni già pari: nessun resize)
+        with imageio.get_writer(output_path, fps=fps, macro_block_size=2) as writer:
+            for frame_idx, time_idx in zip(range(first_frame, last_frame), time_indices):
+                frame_start = time.perf_counter()
+                
+                # Renderizza il frame (layer statici in cache) e invialo all'encoder
+                frame = self.render_frame(
+                    time_idx, pattern_type, colors, effects, aspect_ratio,
+                    title_settings, resolution_px=resolution_px, dpi=dpi,
+                    geometry_cache=geometry_cache, frame_idx=frame_idx
+                )
+                frame_seconds.observe(time.perf_counter() - frame_start, mode='export')
+                frames_rendered.inc(mode='export')
+                writer.append_data(frame)
+                
+                # Aggiorna progresso
+                done_frames, range_frames = frame_idx + 1 - first_frame, last_frame - first_frame
+                if progress_callback is not None:
+                    progress_callback(done_frames, range_frames)
+                else:
+                    progress = done_frames / range_frames
+                    progress_bar.progress(progress)
+                    status_text.text(f"Generando frame {done_frames}/{range_frames}")
+        
+        geometry_cache.close()
+        
+        if progress_callback is None:
+            status_text.text("✅ Video senza audio creato")
+            progress_bar.empty()
+        
+        return total_frames, resolution_px
+    
+    def create_video_distributed(self, output_path, pattern_type, colors, effects, fps,
+                                 aspect_ratio="16:9 (Standard)", video_quality="Media (1280x720)",
+                                 title_settings=None, progress_callback=None, queue_dir=None,
+                                 local_workers=0, segment_seconds=30.0, stale_after=120.0, poll_interval=0.5):
+        """Come `create_video_no_audio`, ma i segmenti sono renderizzati da worker.
+
+        La timeline viene divisa in segmenti (multipli dei blocchi della cache
+        di geometria) pubblicati come job nella `RenderQueue` di `queue_dir`
+        insieme alle sole curve di banda; i worker (`python app.py worker
+        DIR`, anche su altre macchine con la cartella condivisa) restituiscono
+        segmenti MP4 che vengono concatenati senza ricodifica. Con
+        `local_workers` > 0 i worker vengono avviati qui come processi.
+        """
+        colors = colors if colors is not None else DEFAULT_COLORS
+        effects = effects if effects is not None else DEFAULT_EFFECTS
+        resolution_px = self.get_resolution(video_quality, aspect_ratio)
+        total_frames = int(self.duration * fps)
+        segment_frames = max(1, int(round(segment_seconds * fps / GEOMETRY_CHUNK_FRAMES))) * GEOMETRY_CHUNK_FRAMES
+
+        own_queue = queue_dir is None
+        if own_queue:
+            queue_dir = tempfile.mkdtemp(prefix="audioline_queue_")
+        queue = RenderQueue(queue_dir)
+        video_id = uuid.uuid4().hex[:12]
+        analysis_name = f"{video_id}.npz"
+        self.export_analysis(queue.analysis_path(analysis_name))
+
+        job_ids = []
+        for segment_idx, first_frame in enumerate(range(0, total_frames, segment_frames)):
+            job_id = f"{video_id}_{segment_idx:05d}"
+            queue.submit({
+                'id': job_id,
+                'analysis': analysis_name,
+                'pattern_type': pattern_type,
+                'colors': colors,
+                'effects': effects,
+                'fps': fps,
+                'aspect_ratio': aspect_ratio,
+                'video_quality': video_quality,
+                'title_settings': title_settings,
+                'frame_range': [first_frame, min(first_frame + segment_frames, total_frames)]
+            })
+            job_ids.append(job_id)
+
+        # stderr dei worker locali su file nella coda: il traceback resta leggibile se muoiono
+        worker_logs = [os.path.join(queue_dir, f"{video_id}_worker{i}.log") for i in range(local_workers)]
+        workers = []
+        for log_path in worker_logs:
+            with open(log_path, 'wb') as log_file:
+                workers.append(subprocess.Popen([sys.executable, os.path.abspath(__file__), 'worker', queue_dir,
+                                                 '--poll', str(poll_interval)],
+                                                stdout=subprocess.DEVNULL, stderr=log_file))
+        if progress_callback is None:
+            progress_bar = st.progress(0)
+        try:
+            results = {}
+            while len(results) < len(job_ids):
+                for job_id in job_ids:
+                    if job_id in results:
+                        continue
+                    result = queue.result(job_id)
+                    if result is not None and 'error' in result:
+                        raise RuntimeError(f"Segmento {job_id} fallito:\n{result['error']}")
+                    if result is not None:
+                        results[job_id] = result
+                        done_frames = sum(r['frames'] for r in results.values())
+                        if progress_callback is not None:
+                            progress_callback(done_frames, total_frames)
+                        else:
+                            progress_bar.progress(done_frames / max(total_frames, 1))
+                if len(results) < len(job_ids):
+                    # Senza worker locali vivi nessun job verrebbe più completato
+                    if workers and all(worker.poll() is not None for worker in workers):
+                        # Coda di ogni log non vuoto: il primo worker caduto può non essere l'ultimo
+                        log_tails = []
+                        for i, log_path in enumerate(worker_logs):
+                            with open(log_path, errors='replace') as f:
+                                log_text = f.read().strip()
+                            if log_text:
+                                log_tails.append(f"[worker {i}, codice {workers[i].returncode}]\n{log_text[-2000:]}")
+                        exit_codes = ", ".join(str(worker.returncode) for worker in workers)
+                        raise RuntimeError(f"Worker locali terminati (codici di uscita: {exit_codes}) "
+                                           f"con {len(job_ids) - len(results)} segmenti in sospeso:\n"
+                                           + "\n".join(log_tails))
+                    # Job di worker scomparsi (nessun heartbeat) tornano in coda
+                    queue.requeue_stale(stale_after)
+                    time.sleep(poll_interval)
+
+            # Concatenazione senza ricodifica (demuxer concat, stream copy)
+            list_path = os.path.join(queue_dir, f"{video_id}_segments.txt")
+            with open(list_path, 'w') as f:
+                for job_id in job_ids:
+                    # Sintassi del demuxer concat: ' nel percorso diventa '\''
+                    segment_path = queue.segment_path(job_id).replace("'", "'\\''")
+                    f.write(f"file '{segment_path}'\n")
+            subprocess.run(['ffmpeg', '-y', '-v', 'error', '-f', 'concat', '-safe', '0', '-i', list_path,
+                            '-c', 'copy', output_path],
+                           check=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+            os.remove(list_path)
+        finally:
+            for worker in workers:
+                worker.terminate()
+            for worker in workers:
+                worker.wait()
+            for log_path in worker_logs:
+                os.remove(log_path)
+            for job_id in job_ids:
+                queue.discard(job_id)
+            os.remove(queue.analysis_path(analysis_name))
+            if own_queue:
+                shutil.rmtree(queue_dir, ignore_errors=True)
+            if progress_callback is None:
+                progress_bar.empty()
+
+        # Statistiche colori complessive dai worker
+        self.color_statistics = {key: sum(r['color_statistics'][key] for r in results.values())
+                                 for key in self.color_statistics}
+        return total_frames, resolution_px
+    
+    def create_video_progressive(self, output_path, pattern_type, colors, effects, fps,
+                                 aspect_ratio="16:9 (Standard)", video_quality="Media (1280x720)",
+                                 title_settings=None, progress_callback=None, normalize_audio=False):
+        """Crea il video con audio in un solo passaggio come MP4 frammentato.
+
+        I frame vanno in pipe a un unico ffmpeg che codifica il video e
+        interlaccia l'audio (stessi argomenti del mux normale); con
+        `frag_keyframe+empty_moov` e un keyframe al secondo ogni secondo di
+        video viene scritto come frammento autonomo appena codificato, quindi
+        il file è riproducibile mentre cresce (vedi `ProgressiveVideoServer`).
+        """
+        colors = colors if colors is not None else DEFAULT_COLORS
+        effects = effects if effects is not None else DEFAULT_EFFECTS
+        self.color_statistics = {'low_total': 0, 'mid_total': 0, 'high_total': 0, 'total_energy': 0}
+        
+        resolution_px = self.get_resolution(video_quality, aspect_ratio)
+        temp_audio_path = output_path.replace('.mp4', '.wav')
+        audio_input, audio_codec = self.get_audio_mux_args(normalize_audio, temp_audio_path)
+        command = [
+            'ffmpeg', '-y', '-v', 'error',
+            '-f', 'rawvideo', '-pix_fmt', 'rgb24', '-s', f"{resolution_px[0]}x{resolution_px[1]}",
+            '-r', str(fps), '-i', '-',
+            *audio_input,
+            '-map', '0:v:0',
+            '-map', '1:a:0',
+            # Stessa qualità dell'encoder di imageio, keyframe (e frammento) ogni secondo
+            '-c:v', 'libx264', '-pix_fmt', 'yuv420p', '-crf', '25', '-g', str(fps),
+            *audio_codec,
+            '-t', f"{self.duration:.3f}",
+            # delay_moov: il moov parte col primo frammento, quando il ritardo di
+            # B-frame e priming AAC è noto, e porta le edit list che li compensano
+            '-movflags', 'frag_keyframe+empty_moov+delay_moov+default_base_moof',
+            # Audio e video restano interlacciati frammento per frammento
+            '-max_interleave_delta', '0', '-flush_packets', '1',
+            '-f', 'mp4', output_path
+        ]
+        
+        try:
+            total_frames = self.pipe_frames(command, pattern_type, colors, effects, fps, aspect_ratio,
+                                            resolution_px, title_settings, progress_callback)
+        finally:
+            if os.path.exists(temp_audio_path):
+                os.remove(temp_audio_path)
+        return total_frames, resolution_px
+    
+    def pipe_frames(self, command, pattern_type, colors, effects, fps, aspect_ratio, resolution_px,
+                    title_settings=None, progress_callback=None):
+        """Renderizza tutti i frame e li scrive come RGB grezzo nello stdin di un processo ffmpeg.
+
+        `command` deve leggere `-f rawvideo -pix_fmt rgb24` da `-i -` alla
+        risoluzione `resolution_px`. Restituisce il numero di frame; un codice
+        di uscita non nullo di ffmpeg diventa `subprocess.CalledProcessError`.
+        """
+        dpi = self.get_render_dpi(resolution_px)
+        total_frames = int(self.duration * fps)
+        time_indices = self.get_frame_time_indices(fps)
+        
+        metrics = get_metrics()
+        geometry_cache = self.open_geometry_cache(pattern_type, effects, aspect_ratio, resolution_px, dpi, fps)
+        if progress_callback is None:
+            progress_bar = st.progress(0)
+        # stderr su file: una pipe non letta può riempirsi e bloccare ffmpeg
+        stderr_file = tempfile.TemporaryFile()
+        process = subprocess.Popen(command, stdin=subprocess.PIPE, stdout=subprocess.DEVNULL, stderr=stderr_file)
+        try:
+            for frame_idx, time_idx in enumerate(time_indices):
+                frame_start = time.perf_counter()
+                frame = self.render_frame(
+                    time_idx, pattern_type, colors, effects, aspect_ratio,
+                    title_settings, resolution_px=resolution_px, dpi=dpi,
+                    geometry_cache=geometry_cache, frame_idx=frame_idx
+                )
+                metrics.frame_render_seconds.observe(time.perf_counter() - frame_start, mode='export')
+                metrics.frames_rendered_total.inc(mode='export')
+                process.stdin.write(frame.tobytes())
+                if progress_callback is not None:
+                    progress_callback(frame_idx + 1, total_frames)
+                else:
+                    progress_bar.progress((frame_idx + 1) / total_frames)
+            process.stdin.close()
+        except BrokenPipeError:
+            pass  # ffmpeg terminato in anticipo: l'errore arriva dal codice di uscita
+        except BaseException:
+            # Errore di rendering o stop/rerun di Streamlit: con lo stdin aperto
+            # ffmpeg aspetterebbe altri frame per sempre
+            process.kill()
+            raise
+        finally:
+            with contextlib.suppress(OSError):
+                process.stdin.close()
+            returncode = process.wait()
+            stderr_file.seek(0)
+            stderr = stderr_file.read()
+            stderr_file.close()
+            geometry_cache.close()
+            if progress_callback is None:
+                progress_bar.empty()
+        if returncode != 0:
+            raise subprocess.CalledProcessError(returncode, command, stderr=stderr)
+        return total_frames
+    
+    def create_video_with_audio(self, output_path, pattern_type, colors, effects, fps, 
+                               audio_filename="Unknown Track", video_quality="Media (1280x720)", 
+                               aspect_ratio="16:9 (Standard)", video_title="My Audio Visual", title_settings=None,
+                               progress_callback=None, show_report=True, normalize_audio=False,
+                               distributed=None, progressive=False):
+        """Crea un video completo con audio e genera report finale.
+
+        `distributed` (dizionario di argomenti per `create_video_distributed`,
+        es. {'local_workers': 4}) affida il rendering ai worker della coda.
+        Con `progressive` il video viene scritto in un solo passaggio come
+        MP4 frammentato, riproducibile già durante il rendering.
+        """
+        metrics = get_metrics()
+        render_kind = 'progressive' if progressive else 'export' if distributed is None else 'distributed'
+        metrics.renders_started_total.inc(kind=render_kind)
+        
+        if progressive:
+            try:
+                total_frames, resolution_px = self.create_video_progressive(
+                    output_path, pattern_type, colors, effects, fps, aspect_ratio, video_quality,
+                    title_settings, progress_callback, normalize_audio
+                )
+            except subprocess.CalledProcessError as e:
+                metrics.encoder_errors_total.inc(stage='encode')
+                metrics.renders_completed_total.inc(kind=render_kind, status='error')
+                if show_report:
+                    st.error(f"Errore durante la codifica del video: {e.stderr.decode()}")
+                else:
+                    print(f"Errore durante la codifica del video: {e.stderr.decode()}", file=sys.stderr)
+                return False
+            metrics.renders_completed_total.inc(kind=render_kind, status='ok')
+            if show_report:
+                self.show_generation_report(audio_filename, video_title, pattern_type,
+                                            colors, effects, fps, total_frames,
+                                            video_quality, aspect_ratio, title_settings,
+                                            resolution_px)
+            return True
+        
+        # Crea un video temporaneo senza audio
+        temp_video_path = output_path.replace('.mp4', '_no_audio.mp4')
+        try:
+            if distributed is not None:
+                total_frames, resolution_px = self.create_video_distributed(
+                    temp_video_path, pattern_type, colors, effects, fps,
+                    aspect_ratio, video_quality, title_settings, progress_callback, **distributed
+                )
+            else:
+                total_frames, resolution_px = self.create_video_no_audio(
+                    temp_video_path, pattern_type, colors, effects, fps, 
+                    aspect_ratio, video_quality, title_settings, progress_callback
+                )
+        except Exception as e:
+            # Solo gli errori di ffmpeg (processo o scrittura di imageio) sono dell'encoder;
+            # segmenti falliti, analisi e disegno contano solo come render in errore
+            if isinstance(e, (subprocess.CalledProcessError, OSError)):
+                metrics.encoder_errors_total.inc(stage='encode')
+            metrics.renders_completed_total.inc(kind=render_kind, status='error')
+            if os.path.exists(temp_video_path):
+                os.remove(temp_video_path)
+            raise
+        
+        # File audio temporaneo (solo se non c'è un file sorgente da usare direttamente)
+        temp_audio_path = output_path.replace('.mp4', '.wav')
+        
+        # Combina video e audio usando FFmpeg
+        try:
+            audio_input, audio_codec = self.get_audio_mux_args(normalize_audio, temp_audio_path)
+            command = [
+                'ffmpeg',
+                '-y',  # Sovrascrivi senza chiedere
+                '-i', temp_video_path,
+                *audio_input,
+                '-map', '0:v:0',
+                '-map', '1:a:0',
+                '-c:v', 'copy',  # Copia il video senza ri-encodare
+                *audio_codec,
+                '-t', f"{self.duration:.3f}",  # Audio tagliato alla durata del video
+                '-shortest',     # Termina quando il più corto dei due stream termina
+                output_path
+            ]
+            with metrics.mux_seconds.time(audio_mode=self.audio_mux_mode.split(' ')[0].lower()):
+                subprocess.run(command, check=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+            metrics.renders_completed_total.inc(kind=render_kind, status='ok')
+            
+            # Genera e mostra il report finale
+            if show_report:
+                self.show_generation_report(audio_filename, video_title, pattern_type, 
+                                          colors, effects, fps, total_frames, 
+                                          video_quality, aspect_ratio, title_settings,
+                                          resolution_px)
+            
+            return True
+            
+        except subprocess.CalledProcessError as e:
+            metrics.encoder_errors_total.inc(stage='mux')
+            metrics.renders_completed_total.inc(kind=render_kind, status='error')
+            if show_report:
+                st.error(f"Errore durante la combinazione audio/video: {e.stderr.decode()}")
+            else:
+                print(f"Errore durante la combinazione audio/video: {e.stderr.decode()}", file=sys.stderr)
+            return False
+        finally:
+            # Pulisci i file temporanei
+            if os.path.exists(temp_video_path):
+                os.remove(temp_video_path)
+            if os.path.exists(temp_audio_path):
+                os.remove(temp_audio_path)
+    
+    def get_rendition_resolution(self, rendition, aspect_ratio):
+        """Risoluzione di una rendition: il suo lato corto, l'altro dall'aspect ratio (valori pari)"""
+        short_side = RENDITIONS[rendition]['short_side']
+        xlim, ylim = self.get_aspect_ratio_limits(aspect_ratio)
+        long_side = int(round(short_side * max(xlim, ylim) / min(xlim, ylim) / 2)) * 2
+        return (long_side, short_side) if xlim >= ylim else (short_side, long_side)
+    
+    def create_video_renditions(self, output_paths, pattern_type, colors, effects, fps,
+                                audio_filename="Unknown Track", aspect_ratio="16:9 (Standard)",
+                                video_title="My Audio Visual", title_settings=None,
+                                progress_callback=None, show_report=True, normalize_audio=False):
+        """Crea più rendition dello stesso video con un solo rendering.
+
+        `output_paths` associa i nomi di `RENDITIONS` ai file di uscita. Ogni
+        frame è renderizzato una volta alla risoluzione più alta richiesta e
+        passato a un unico ffmpeg: il grafo `split`/`scale` ricava le altre
+        dimensioni e ogni uscita ha le proprie impostazioni x264. L'audio è
+        codificato una sola volta (o copiato dalla sorgente) e copiato in
+        tutte le uscite.
+        """
+        metrics = get_metrics()
+        render_kind = 'renditions'
+        metrics.renders_started_total.inc(kind=render_kind)
+        colors = colors if colors is not None else DEFAULT_COLORS
+        effects = effects if effects is not None else DEFAULT_EFFECTS
+        self.color_statistics = {'low_total': 0, 'mid_total': 0, 'high_total': 0, 'total_energy': 0}
+        
+        # Dalla più grande alla più piccola: la prima è quella renderizzata
+        renditions = sorted(output_paths, key=lambda name: -RENDITIONS[name]['short_side'])
+        sizes = {name: self.get_rendition_resolution(name, aspect_ratio) for name in renditions}
+        resolution_px = sizes[renditions[0]]
+        
+        # Conversione in yuv420p una volta sola, poi una copia per rendition
+        graph = [f"[0:v]format=yuv420p,split={len(renditions)}" + "".join(
+            f"[v{i}]" if i == 0 else f"[s{i}]" for i in range(len(renditions)))]
+        graph += [f"[s{i}]scale={sizes[name][0]}:{sizes[name][1]}:flags=lanczos[v{i}]"
+                  for i, name in enumerate(renditions) if i > 0]
+        
+        with tempfile.TemporaryDirectory() as temp_dir:
+            try:
+                audio_input, audio_codec = self.get_audio_mux_args(normalize_audio, os.path.join(temp_dir, "audio.wav"))
+                if audio_codec != ['-c:a', 'copy']:
+                    shared_audio_path = os.path.join(temp_dir, "audio.m4a")
+                    with metrics.mux_seconds.time(audio_mode=self.audio_mux_mode.split(' ')[0].lower()):
+                        subprocess.run(['ffmpeg', '-y', '-v', 'error', *audio_input, '-vn', *audio_codec,
+                                        '-t', f"{self.duration:.3f}", shared_audio_path],
+                                       check=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+                    audio_input = ['-i', shared_audio_path]
+                
+                command = [
+                    'ffmpeg', '-y', '-v', 'error',
+                    '-f', 'rawvideo', '-pix_fmt', 'rgb24', '-s', f"{resolution_px[0]}x{resolution_px[1]}",
+                    '-r', str(fps), '-i', '-',
+                    *audio_input,
+                    '-filter_complex', ";".join(graph)
+                ]
+                for i, name in enumerate(renditions):
+                    settings = RENDITIONS[name]
+                    command += [
+                        '-map', f"[v{i}]", '-map', '1:a:0',
+                        '-c:v', 'libx264', '-preset', settings['preset'], '-crf', str(settings['crf']),
+                        '-maxrate', settings['maxrate'], '-bufsize', settings['bufsize'],
+                        '-c:a', 'copy',
+                        '-t', f"{self.duration:.3f}",
+                        '-movflags', '+faststart',
+                        output_paths[name]
+                    ]
+                total_frames = self.pipe_frames(command, pattern_type, colors, effects, fps, aspect_ratio,
+                                                resolution_px, title_settings, progress_callback)
+            except subprocess.CalledProcessError as e:
+                metrics.encoder_errors_total.inc(stage='encode')
+                metrics.renders_completed_total.inc(kind=render_kind, status='error')
+                if show_report:
+                    st.error(f"Errore durante la codifica delle rendition: {e.stderr.decode()}")
+                else:
+                    print(f"Errore durante la codifica delle rendition: {e.stderr.decode()}", file=sys.stderr)
+                return False
+        metrics.renders_completed_total.inc(kind=render_kind, status='ok')
+        
+        if show_report:
+            # Etichetta con tutte le rendition codificate, es. "1080p + 720p"
+            self.show_generation_report(audio_filename, video_title, pattern_type,
+                                        colors, effects, fps, total_frames,
+                                        " + ".join(renditions), aspect_ratio, title_settings,
+                                        resolution_px)
+        return True
+    
+    def get_audio_mux_args(self, normalize_audio, temp_audio_path):
+        """Argomenti ffmpeg (input, codec) per la traccia audio del video finale.
+
+        - sorgente già compatibile MP4 (AAC/MP3) e nessuna normalizzazione:
+          lo stream originale viene copiato (`-c:a copy`), senza ricodifica;
+        - altrimenti l'AAC viene codificato direttamente dal file sorgente,
+          con la normalizzazione applicata come guadagno `volume` di ffmpeg;
+        - senza file sorgente (audio passato come array) si scrive un WAV.
+
+        La modalità scelta resta in `self.audio_mux_mode` per il report.
+        """
+        gain = 1.0
+        if normalize_audio:
+            # Picco calcolato in un solo passaggio vettoriale
+            end_sample = int(self.duration * self.sr)
+            peak = float(np.max(np.abs(self.audio_data[:end_sample]), initial=0.0))
+            gain = 1.0 / peak if peak > 0 else 1.0
+
+        if self.source_path is not None:
+            if self.source_info is None:
+                self.source_info = probe_audio(self.source_path)
+            codec = self.source_info['codec']
+            # Segmento: seek sul file sorgente, l'audio parte dallo stesso istante del video
+            seek = ['-ss', f"{self.start_time:.6f}"] if self.start_time > 0 else []
+            audio_input = [*seek, '-i', self.source_path]
+            if not normalize_audio and codec in MP4_AUDIO_CODECS:
+                self.audio_mux_mode = f"passthrough ({codec})"
+                return audio_input, ['-c:a', 'copy']
+            if normalize_audio:
+                # Come in precedenza: mix mono normalizzato sul picco del segnale analizzato
+                self.audio_mux_mode = f"AAC da {codec}, normalizzato"
+                return audio_input, ['-c:a', 'aac', '-b:a', '192k', '-ac', '1', '-af', f"volume={gain:.6f}"]
+            self.audio_mux_mode = f"AAC da {codec}"
+            return audio_input, ['-c:a', 'aac', '-b:a', '192k']
+
+        from scipy.io import wavfile
+        end_sample = int(self.duration * self.sr)
+        audio_segment = self.audio_data[:end_sample]
+        if gain != 1.0:
+            audio_segment = audio_segment * np.float32(gain)
+        wavfile.write(temp_audio_path, self.sr, audio_segment)
+        self.audio_mux_mode = "AAC da WAV" + (", normalizzato" if normalize_audio else "")
+        return ['-i', temp_audio_path], ['-c:a', 'aac', '-b:a', '192k']
+
+    def show_generation_report(self, audio_filename, video_title, pattern_type, colors, effects, fps, total_frames, video_quality, aspect_ratio, title_settings, resolution_px):
+        """Mostra il report dettagliato della generazione"""
+        # Calcola le percentuali dei colori
+        low_percent, mid_percent, high_percent = self.get_color_percentages()
+        
+        # Formatta la risoluzione (con più rendition, es. "1080p + 720p", tutte le dimensioni)
+        final_resolution = f"{resolution_px[0]}x{resolution_px[1]}"
+        renditions = video_quality.split(' + ') if isinstance(video_quality, str) else []
+        if renditions and all(name in RENDITIONS for name in renditions):
+            final_resolution = " + ".join(
+                "{} ({}x{})".format(name, *self.get_rendition_resolution(name, aspect_ratio)) for name in renditions
+            )
+        
+        motion = effects.get('motion', 'time')
+        motion_info = {"time": "costante", "beat": "a ritmo", "onset": "sugli attacchi"}.get(motion, motion)
+        if motion == 'beat' and self.control_signals is not None:
+            motion_info += f" ({self.control_signals['tempo']:.0f} BPM)"
+        if effects.get('smoothing'):
+            motion_info += ", ampiezze morbide"
+        
+        # Mappa nomi pattern
+        pattern_names = {
+            "waves": "Onde Classiche",
+            "interference": "Onde Interferenza Strutturate", 
+            "flowing": "Onde Stratificate Orizzontali",
+            "am": "Onde AM",
+            "fm": "Onde FM",
+            "reflected": "Onde Riflesse",
+            "varied_amplitude": "Onde Ampiezza Variabile",
+            "varied_shape": "Onde Forma Variabile",
+            "varied_motion": "Onde Movimento Variabile"
+        }
+        
+        # Determina intensità basata sui moltiplicatori
+        intensity_level = effects.get('intensity', 1.0)
+        if intensity_level < 0.8:
+            intensity_desc = "Bassa"
+        elif intensity_level > 1.5:
+            intensity_desc = "Alta"
+        else:
+            intensity_desc = "Media"
+        
+        channel_labels = {"mono": "Mono", "stereo": "Stereo L/R", "midside": "Mid/Side"}
+        
+        # Prepara info titolo
+        title_info = "❌ Disabilitato"
+        if title_settings and title_settings['text']:
+            title_position = f"{title_settings['v_position']} {title_settings['h_position']}"
+            title_info = f"{title_settings['text']} ({title_position}, {title_settings['fontsize']}px)"
+        
+        # Crea il report
+        report = f"""
+## 📊 Audio Visual Report - WAVES EDITION
+
+**🎬 Video Title:** {video_title}  
+**🎵 Audio Track:** {audio_filename}  
+**⏱️ Duration:** {self.duration:.1f}s  
+**✂️ Segment:** {self.start_time:.1f}s – {self.start_time + self.duration:.1f}s  
+**🔊 Sample Rate:** {self.sr:,} Hz  
+**🎧 Channels:** {channel_labels.get(self.channel_mode, self.channel_mode)}  
+**🎚️ Bands:** {len(self.band_edges) - 1} ({self.band_edges[0]:.0f}–{self.band_edges[-1]:.0f} Hz)  
+**🔈 Audio:** {self.audio_mux_mode or "-"}  
+**📺 Resolution:** {final_resolution}  
+**📐 Aspect Ratio:** {aspect_ratio}
+
+### 🌈 Color Distribution by Frequency:
+- **🔴 Low Frequencies ({self.get_layer_range('low')}):** {low_percent:.1f}%
+- **🔵 Mid Frequencies ({self.get_layer_range('mid')}):** {mid_percent:.1f}%  
+- **⚪ High Frequencies ({self.get_layer_range('high')}):** {high_percent:.1f}%
+
+### ⚙️ Wave Configuration:
+- **🌊 Wave Style:** {pattern_names.get(pattern_type, pattern_type.title())}
+- **💪 Intensità:** {intensity_desc} ({intensity_level}x)
+- **⚡ Velocità:** {effects.get('speed', 0.1)}x
+- **🥁 Movimento:** {motion_info}
+- **🎲 Casualità:** {effects.get('randomness', 0.0)*100:.0f}%
+- **📐 Format:** {aspect_ratio.split(' ')[0]} | **🎬 FPS:** {fps}
+- **📝 Title:** {title_info}
+- **🖼️ Total Frames:** ~{total_frames:,}
+
+---
+*Generated by **AudioLineTwo** - WAVES EDITION BY LOOP507*  
+*Timestamp: {datetime.now().strftime("%Y-%m-%d %H:%M:%S")}*
+        """
+        
+        # Mostra il report in un expander
+        with st.expander("📊 **WAVE GENERATION REPORT** - Clicca per vedere i dettagli", expanded=True):
+            st.markdown(report)
+        
+        # Salva report social in session_state
+        social_report = self.generate_social_report(
+            audio_filename, video_title, pattern_type,
+            colors, effects, fps, total_frames,
+            resolution_px, aspect_ratio, low_percent, mid_percent, high_percent
+        )
+        st.session_state['social_report'] = social_report
+
+        # Anche come info success
+        st.success(f"""
+        ✅ **Video Wave generato con successo!**
+        
+        **Distribuzione Colori:**
+        🔴 Basse: {low_percent:.1f}% | 🔵 Medie: {mid_percent:.1f}% | ⚪ Acute: {high_percent:.1f}%
+        
+        **Dettagli:** {total_frames:,} frames • {fps} FPS • {self.duration:.1f}s • Wave: {pattern_names.get(pattern_type, pattern_type)} • {final_resolution}
+        **Effetti:** Intensità {intensity_desc} • Velocità {effects.get('speed', 0.1)}x • Casualità {effects.get('randomness', 0.0)*100:.0f}%
+        """)
+
+class RenderQueue:
+    """Coda di job di rendering su una cartella condivisa (locale o di rete).
+
+    Ogni job è un file JSON che passa da pending/ a claimed/ con un
+    `os.rename` atomico: un solo worker lo ottiene anche se più macchine
+    montano la stessa cartella. Il worker aggiorna l'mtime del job come
+    heartbeat; i job senza heartbeat da `stale_after` secondi tornano in
+    pending/. Segmenti e risultati finiscono in done/, gli errori in failed/.
+    """
+
+    def __init__(self, root):
+        self.root = root
+        for name in ('pending', 'claimed', 'done', 'failed', 'analysis'):
+            os.makedirs(os.path.join(root, name), exist_ok=True)
+
+    def _path(self, state, job_id, suffix='.json'):
+        return os.path.join(self.root, state, f"{job_id}{suffix}")
+
+    def _write_json(self, path, data):
+        # Scrittura atomica: chi legge non vede mai un JSON a metà
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump(data, f)
+        os.replace(tmp_path, path)
+
+    def analysis_path(self, name):
+        return os.path.join(self.root, 'analysis', name)
+
+    def segment_path(self, job_id):
+        return self._path('done', job_id, '.mp4')
+
+    def partial_path(self, job_id, worker_id):
+        return self._path('claimed', f"{job_id}.{worker_id}.partial", '.mp4')
+
+    def submit(self, job):
+        self._write_json(self._path('pending', job['id']), job)
+
+    def claim(self):
+        """Prende il primo job in attesa, oppure None se la coda è vuota"""
+        for name in sorted(os.listdir(os.path.join(self.root, 'pending'))):
+            if not name.endswith('.json'):
+                continue
+            job_id = name[:-len('.json')]
+            claimed_path = self._path('claimed', job_id)
+            try:
+                os.rename(self._path('pending', job_id), claimed_path)
+            except FileNotFoundError:
+                continue  # preso da un altro worker
+            self.heartbeat(job_id)
+            with open(claimed_path) as f:
+                return json.load(f)
+        return None
+
+    def heartbeat(self, job_id):
+        try:
+            os.utime(self._path('claimed', job_id))
+        except FileNotFoundError:
+            pass  # già completato o rimesso in coda
+
+    def complete(self, job_id, partial_path, result):
+        os.replace(partial_path, self.segment_path(job_id))
+        self._write_json(self._path('done', job_id), result)
+        self._remove(self._path('claimed', job_id))
+
+    def fail(self, job_id, error):
+        self._write_json(self._path('failed', job_id), {'error': error})
+        self._remove(self._path('claimed', job_id))
+
+    def result(self, job_id):
+        """Risultato del job (con 'error' se fallito), None se non ancora concluso"""
+        for state in ('done', 'failed'):
+            try:
+                with open(self._path(state, job_id)) as f:
+                    return json.load(f)
+            except FileNotFoundError:
+                pass
+        return None
+
+    def requeue_stale(self, stale_after):
+        """Rimette in pending/ i job di worker che non danno segni di vita"""
+        claimed_dir = os.path.join(self.root, 'claimed')
+        now = time.time()
+        requeued = 0
+        for name in os.listdir(claimed_dir):
+            if not name.endswith('.json'):
+                continue
+            job_id = name[:-len('.json')]
+            try:
+                if now - os.path.getmtime(os.path.join(claimed_dir, name)) > stale_after:
+                    os.rename(os.path.join(claimed_dir, name), self._path('pending', job_id))
+                    requeued += 1
+            except FileNotFoundError:
+                pass
+        return requeued
+
+    def discard(self, job_id):
+        for path in (self._path('pending', job_id), self._path('claimed', job_id), self._path('done', job_id),
+                     self._path('failed', job_id), self.segment_path(job_id)):
+            self._remove(path)
+
+    @staticmethod
+    def _remove(path):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+
+def run_worker(queue_dir, worker_id=None, poll_interval=0.5, idle_exit=None, heartbeat_interval=5.0):
+    """Worker di rendering: prende job dalla `RenderQueue` finché ce ne sono.
+
+    Le analisi (solo curve di banda) sono caricate una volta per video; i
+    frame del segmento sono renderizzati con la stessa pipeline del
+    rendering locale. Con `idle_exit` il worker termina dopo tanti secondi
+    senza job. Restituisce il numero di segmenti completati.
+    """
+    queue = RenderQueue(queue_dir)
+    worker_id = worker_id or f"{os.uname().nodename}-{os.getpid()}"
+    visualizers = {}
+    metrics = get_metrics()
+    completed = 0
+    idle_since = time.monotonic()
+    while True:
+        job = queue.claim()
+        if job is None:
+            if idle_exit is not None and time.monotonic() - idle_since > idle_exit:
+                return completed
+            time.sleep(poll_interval)
+            continue
+
+        job_id = job['id']
+        partial_path = queue.partial_path(job_id, worker_id)
+        metrics.renders_started_total.inc(kind='segment')
+        last_beat = [time.monotonic()]
+
+        def heartbeat(done_frames, total_frames):
+            if time.monotonic() - last_beat[0] > heartbeat_interval:
+                queue.heartbeat(job_id)
+                last_beat[0] = time.monotonic()
+
+        try:
+            if job['analysis'] not in visualizers:
+                visualizers.clear()
+                visualizers[job['analysis']] = AudioVisualizer.from_analysis(queue.analysis_path(job['analysis']))
+            visualizer = visualizers[job['analysis']]
+            first_frame, last_frame = job['frame_range']
+            visualizer.create_video_no_audio(
+                partial_path, job['pattern_type'], job['colors'], job['effects'], job['fps'],
+                job['aspect_ratio'], job['video_quality'], job['title_settings'],
+                progress_callback=heartbeat, frame_range=(first_frame, last_frame)
+            )
+            queue.complete(job_id, partial_path, {
+                'frames': last_frame - first_frame,
+                'worker': worker_id,
+                'color_statistics': visualizer.color_statistics
+            })
+            metrics.renders_completed_total.inc(kind='segment', status='ok')
+            completed += 1
+        except Exception:
+            RenderQueue._remove(partial_path)
+            queue.fail(job_id, traceback.format_exc())
+            metrics.renders_completed_total.inc(kind='segment', status='error')
+        idle_since = time.monotonic()
+
+
+# Controllo di ammissione: limiti configurabili da variabili d'ambiente
+# (0 = automatico: un job e una CPU per core, memoria senza limite)
+SCHEDULER_MAX_JOBS = env_int('AUDIOLINE_MAX_JOBS', 0)
+SCHEDULER_CPU_BUDGET = env_int('AUDIOLINE_CPU_BUDGET', 0)
+SCHEDULER_MEMORY_BUDGET_MB = env_int('AUDIOLINE_MEMORY_BUDGET_MB', 0)
+# Priorità dei tipi di job (più basso = prima): le preview non aspettano gli export
+JOB_PRIORITIES = {'preview': 0, 'analysis': 1, 'export': 2}
+# Stima iniziale dei secondi per unità di costo (affinata con i job completati)
+JOB_DEFAULT_RATES = {'preview': 2e-8, 'analysis': 0.02, 'export': 2e-8}
+
+
+class RenderScheduler:
+    """Pianificatore condiviso da tutte le sessioni del processo.
+
+    Ogni lavoro pesante (analisi, preview, export) chiede uno slot con
+    `slot()`: parte solo se restano posti (`max_jobs`) e budget di CPU e
+    memoria, altrimenti attende in coda. L'ordine è per priorità del tipo di
+    job, poi per lavoro già servito alla sessione (start-time fair queuing
+    sulle durate stimate: una sessione con molti export non blocca le
+    altre), poi per arrivo. Un job più grande dell'intero budget parte
+    comunque quando la macchina è libera.
+    """
+
+    def __init__(self, max_jobs=None, cpu_budget=None, memory_budget=None):
+        cpus = os.cpu_count() or 1
+        self.max_jobs = max_jobs or cpus
+        self.cpu_budget = cpu_budget or cpus
+        self.memory_budget = memory_budget
+        self._cond = threading.Condition()
+        self._waiting = []
+        self._running = []
+        self._session_finish = {}
+        self._virtual_time = 0.0
+        self._rates = dict(JOB_DEFAULT_RATES)
+        self._sequence = 0
+
+    def estimate_duration(self, kind, cost):
+        return self._rates[kind] * cost
+
+    def _order(self, ticket):
+        return (JOB_PRIORITIES[ticket['kind']], ticket['tag'], ticket['seq'])
+
+    def _fits(self, ticket):
+        if not self._running:
+            return True
+        cpu_used = sum(t['cpu'] for t in self._running)
+        memory_used = sum(t['memory'] for t in self._running)
+        return (len(self._running) < self.max_jobs
+                and cpu_used + ticket['cpu'] <= self.cpu_budget
+                and (self.memory_budget is None or memory_used + ticket['memory'] <= self.memory_budget))
+
+    def queue_status(self, ticket):
+        """(posizione in coda, secondi stimati all'avvio) di un job in attesa"""
+        with self._cond:
+            ahead = sorted(self._waiting, key=self._order)
+            position = ahead.index(ticket) if ticket in ahead else 0
+            # Simulazione: ogni slot si libera quando finisce il job che lo occupa
+            now = time.monotonic()
+            free_at = [max(0.0, t['start'] + t['estimate'] - now) for t in self._running]
+            free_at += [0.0] * max(1, self.max_jobs - len(free_at))
+            for other in ahead[:position]:
+                free_at.sort()
+                free_at[0] += other['estimate']
+            return position + 1, min(free_at)
+
+    def _admit(self):
+        # Solo la testa della coda può partire: i job grandi non vengono scavalcati all'infinito
+        while self._waiting:
+            ticket = min(self._waiting, key=self._order)
+            if not self._fits(ticket):
+                break
+            self._waiting.remove(ticket)
+            ticket['start'] = time.monotonic()
+            self._running.append(ticket)
+            self._virtual_time = max(self._virtual_time, ticket['tag'])
+            self._cond.notify_all()
+
+    def slot(self, session, kind, cost=1.0, cpu=1, memory=0, on_wait=None, poll_interval=0.5):
+        """Context manager che attende l'ammissione del job e lo rilascia all'uscita.
+
+        `cost` è nell'unità del tipo di job (pixel renderizzati, secondi di
+        audio analizzati) e serve per le stime; `on_wait(posizione, eta)` è
+        chiamata periodicamente finché il job resta in coda.
+        """
+        return _SchedulerSlot(self, {
+            'session': session, 'kind': kind, 'cost': cost, 'cpu': cpu, 'memory': memory,
+            'estimate': self.estimate_duration(kind, cost), 'on_wait': on_wait, 'poll': poll_interval
+        })
+
+    def _acquire(self, ticket):
+        with self._cond:
+            self._sequence += 1
+            ticket['seq'] = self._sequence
+            # Il job parte (virtualmente) dopo i precedenti della stessa sessione,
+            # ma mai prima del tempo virtuale attuale: nessun credito accumulato
+            ticket['tag'] = max(self._virtual_time, self._session_finish.get(ticket['session'], 0.0))
+            self._session_finish[ticket['session']] = ticket['tag'] + ticket['estimate']
+            self._waiting.append(ticket)
+            self._admit()
+        wait_start = time.perf_counter()
+        while True:
+            with self._cond:
+                if ticket in self._running:
+                    get_metrics().scheduler_wait_seconds.observe(time.perf_counter() - wait_start,
+                                                                 kind=ticket['kind'])
+                    return
+                if ticket['on_wait'] is None:
+                    self._cond.wait()
+                    continue
+            ticket['on_wait'](*self.queue_status(ticket))
+            with self._cond:
+                if ticket not in self._running:
+                    self._cond.wait(ticket['poll'])
+
+    def _release(self, ticket, completed):
+        with self._cond:
+            if ticket in self._waiting:
+                self._waiting.remove(ticket)
+            if ticket in self._running:
+                self._running.remove(ticket)
+                elapsed = time.monotonic() - ticket['start']
+                if completed and ticket['cost'] > 0:
+                    # Media mobile dei secondi per unità di costo
+                    rate = elapsed / ticket['cost']
+                    self._rates[ticket['kind']] = 0.7 * self._rates[ticket['kind']] + 0.3 * rate
+            if not any(t['session'] == ticket['session'] for t in self._waiting + self._running):
+                self._session_finish.pop(ticket['session'], None)
+            self._admit()
+            self._cond.notify_all()
+
+
+class _SchedulerSlot:
+    def __init__(self, scheduler, ticket):
+        self.scheduler = scheduler
+        self.ticket = ticket
+
+    def __enter__(self):
+        try:
+            self.scheduler._acquire(self.ticket)
+        except BaseException:
+            # Sessione interrotta mentre era in coda (es. StopException di Streamlit)
+            self.scheduler._release(self.ticket, completed=False)
+            raise
+        return self.ticket
+
+    def __exit__(self, exc_type, exc, tb):
+        self.scheduler._release(self.ticket, completed=exc_type is None)
+        return False
+
+
+@st.cache_resource(show_spinner=False)
+def get_render_scheduler():
+    """Pianificatore unico del processo (condiviso tra rerun e sessioni)"""
+    memory_budget = SCHEDULER_MEMORY_BUDGET_MB * 1024 ** 2 if SCHEDULER_MEMORY_BUDGET_MB else None
+    scheduler = RenderScheduler(SCHEDULER_MAX_JOBS or None, SCHEDULER_CPU_BUDGET or None, memory_budget)
+    metrics = get_metrics()
+    metrics.scheduler_queue_depth.set_function(lambda: len(scheduler._waiting))
+    metrics.scheduler_running_jobs.set_function(lambda: len(scheduler._running))
+    return scheduler
+
+
+def current_session_id():
+    """Identificativo della sessione Streamlit corrente ('cli' fuori da Streamlit)"""
+    from streamlit.runtime.scriptrunner import get_script_run_ctx
+    ctx = get_script_run_ctx()
+    return ctx.session_id if ctx is not None else 'cli'
+
+
+def queue_feedback(placeholder, label):
+    """Callback `on_wait` che mostra posizione in coda e avvio stimato"""
+    def on_wait(position, eta):
+        placeholder.info(f"⏳ {label} in coda (posizione {position}): avvio stimato tra ~{eta:.0f}s")
+    return on_wait
+
+
+# Scrubbing della timeline: frame a risoluzione preview in una cache LRU in memoria
+SCRUB_RESOLUTION = (320, 180)
+SCRUB_DPI = 72
+SCRUB_PREFETCH_FRAMES = 12
+SCRUB_PREFETCH_IDLE_EXIT = 60.0
+FRAME_CACHE_MAX_BYTES = env_int('AUDIOLINE_FRAME_CACHE_MB', 64) * 1024 ** 2
+
+
+class FrameCache:
+    """Cache LRU di frame RGB con un limite di memoria in byte.
+
+    La chiave identifica brano/analisi, pattern, parametri e indice del
+    frame; l'ordine del dict fa da LRU e le voci meno recenti vengono
+    scartate appena la somma dei byte supera `max_bytes`.
+    """
+
+    def __init__(self, max_bytes=FRAME_CACHE_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self.nbytes = 0
+        self.hits = 0
+        self.misses = 0
+        self._entries = {}
+        self._lock = threading.Lock()
+
+    def __contains__(self, key):
+        with self._lock:
+            return key in self._entries
+
+    def get(self, key):
+        with self._lock:
+            frame = self._entries.pop(key, None)
+            if frame is None:
+                self.misses += 1
+                return None
+            self._entries[key] = frame
+            self.hits += 1
+            return frame
+
+    def put(self, key, frame):
+        if frame.nbytes > self.max_bytes:
+            return
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self.nbytes -= previous.nbytes
+            self._entries[key] = frame
+            self.nbytes += frame.nbytes
+            while self.nbytes > self.max_bytes:
+                self.nbytes -= self._entries.pop(next(iter(self._entries))).nbytes
+
+
+@st.cache_resource(show_spinner=False)
+def get_frame_cache():
+    """Cache dei frame di scrubbing condivisa da tutte le sessioni"""
+    return FrameCache(FRAME_CACHE_MAX_BYTES)
+
+
+class FrameScrubber:
+    """Frame esatti a qualunque istante per lo scrubbing interattivo.
+
+    Il frame richiesto viene letto dalla `FrameCache` o renderizzato subito;
+    un thread in background prepara poi i frame vicini (prima nella
+    direzione dello spostamento) finché non arriva una nuova richiesta.
+    Il frame ha l'aspect ratio e il titolo dell'export, alla risoluzione
+    preview (lato lungo di `resolution_px`).
+
+    Lo scrubber usa una copia propria del visualizzatore (layer statici e
+    statistiche colori separati da quelli dell'export) e con uno
+    `scheduler` ogni rendering passa dall'ammissione dei job come 'preview';
+    lo slot è preso sempre prima del lock di rendering, che serializza
+    l'accesso al canvas non thread-safe. Il thread termina da solo dopo
+    `SCRUB_PREFETCH_IDLE_EXIT` secondi senza richieste.
+    """
+
+    def __init__(self, cache, resolution_px=SCRUB_RESOLUTION, dpi=SCRUB_DPI, prefetch_frames=SCRUB_PREFETCH_FRAMES,
+                 scheduler=None, session=None):
+        self.cache = cache
+        self.resolution_px = resolution_px
+        self.dpi = dpi
+        self.prefetch_frames = prefetch_frames
+        self.scheduler = scheduler
+        self.session = session
+        self.visualizer = None
+        self._render_lock = threading.Lock()
+        self._cond = threading.Condition()
+        self._request = None
+        self._generation = 0
+        self._thread = None
+        self._last_frame_idx = None
+
+    def use_visualizer(self, visualizer):
+        """Tiene la copia già usata (layer statici pronti) se l'analisi non è cambiata.
+
+        La copia condivide analisi e curve (sola lettura) ma non canvas,
+        stato dei frame riusati e statistiche colori dell'export.
+        """
+        if self.visualizer is None or self.visualizer.analysis_key != visualizer.analysis_key:
+            own = copy.copy(visualizer)
+            own._static_layers = None
+            own.color_statistics = {'low_total': 0, 'mid_total': 0, 'high_total': 0, 'total_energy': 0}
+            with self._render_lock:
+                self.visualizer = own
+
+    def view(self, aspect_ratio, title_settings, export_resolution_px):
+        """Risoluzione preview per l'aspect ratio e titolo scalato come nell'export"""
+        xlim, ylim = self.visualizer.get_aspect_ratio_limits(aspect_ratio)
+        long_side = max(self.resolution_px)
+        short_side = long_side * min(xlim, ylim) / max(xlim, ylim)
+        short_side = max(2, int(round(short_side / 2)) * 2)
+        resolution_px = (long_side, short_side) if xlim >= ylim else (short_side, long_side)
+        if title_settings and title_settings['text'] and export_resolution_px is not None:
+            # Il titolo è in punti: stessa altezza relativa al frame dell'export
+            export_inches = export_resolution_px[1] / self.visualizer.get_render_dpi(export_resolution_px)
+            scale = resolution_px[1] / self.dpi / export_inches
+            title_settings = {**title_settings, 'fontsize': title_settings['fontsize'] * scale}
+        elif not (title_settings and title_settings['text']):
+            title_settings = None
+        return aspect_ratio, resolution_px, title_settings
+
+    def frame_key(self, pattern_type, colors, effects, fps, view, frame_idx):
+        aspect_ratio, resolution_px, title_settings = view
+        title_key = tuple(sorted(title_settings.items())) if title_settings else None
+        return (self.visualizer.analysis_key, pattern_type, tuple(sorted(colors.items())),
+                tuple(sorted(effects.items())), fps, aspect_ratio, tuple(resolution_px), title_key,
+                int(frame_idx))
+
+    def render(self, key, pattern_type, colors, effects, fps, view, frame_idx):
+        aspect_ratio, resolution_px, title_settings = view
+        slot = contextlib.nullcontext()
+        if self.scheduler is not None:
+            slot = self.scheduler.slot(self.session, 'preview', cost=resolution_px[0] * resolution_px[1])
+        with slot, self._render_lock:
+            time_idx = self.visualizer.get_frame_time_indices(fps, frame_idx, frame_idx + 1)[0]
+            frame = self.visualizer.render_frame(
+                int(time_idx), pattern_type, colors, effects, aspect_ratio=aspect_ratio,
+                title_settings=title_settings, resolution_px=resolution_px, dpi=self.dpi
+            )
+        self.cache.put(key, frame)
+        return frame
+
+    def frame(self, visualizer, pattern_type, colors, effects, fps, frame_idx,
+              aspect_ratio="16:9 (Standard)", title_settings=None, export_resolution_px=None):
+        """Frame `frame_idx` (RGB) e se è arrivato dalla cache; avvia il prefetch dei vicini.
+
+        `export_resolution_px` è la risoluzione dell'export, per scalare il titolo.
+        """
+        colors = colors if colors is not None else DEFAULT_COLORS
+        effects = effects if effects is not None else DEFAULT_EFFECTS
+        self.use_visualizer(visualizer)
+        view = self.view(aspect_ratio, title_settings, export_resolution_px)
+        total_frames = int(self.visualizer.duration * fps)
+        frame_idx = min(max(int(frame_idx), 0), max(total_frames - 1, 0))
+        key = self.frame_key(pattern_type, colors, effects, fps, view, frame_idx)
+        frame = self.cache.get(key)
+        hit = frame is not None
+        if not hit:
+            frame = self.render(key, pattern_type, colors, effects, fps, view, frame_idx)
+
+        direction = 1 if self._last_frame_idx is None or frame_idx >= self._last_frame_idx else -1
+        self._last_frame_idx = frame_idx
+        with self._cond:
+            self._generation += 1
+            self._request = (self._generation, pattern_type, colors, effects, fps, view, frame_idx, direction,
+                             total_frames)
+            self._cond.notify()
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._prefetch_loop, name="audioline-scrub-prefetch",
+                                                daemon=True)
+                self._thread.start()
+        return frame, hit
+
+    def _prefetch_loop(self):
+        while True:
+            with self._cond:
+                if self._request is None:
+                    self._cond.wait(SCRUB_PREFETCH_IDLE_EXIT)
+                    if self._request is None:
+                        self._thread = None
+                        return
+                request, self._request = self._request, None
+            generation, pattern_type, colors, effects, fps, view, center, direction, total_frames = request
+            # Prima la direzione dello scrubbing, poi l'altra, a distanza crescente
+            neighbours = [center + sign * direction * distance
+                          for distance in range(1, self.prefetch_frames + 1) for sign in (1, -1)]
+            for frame_idx in neighbours:
+                if self._generation != generation:
+                    break  # nuova richiesta: si riparte dal nuovo centro
+                if not 0 <= frame_idx < total_frames:
+                    continue
+                key = self.frame_key(pattern_type, colors, effects, fps, view, frame_idx)
+                if key not in self.cache:
+                    self.render(key, pattern_type, colors, effects, fps, view, frame_idx)
+
+
+# Server dei video progressivi: porta (0 = libera, scelta dal sistema) e URL
+# pubblico da usare nel browser se diverso da http://localhost:PORTA
+PROGRESSIVE_PORT = env_int('AUDIOLINE_STREAM_PORT', 0)
+PROGRESSIVE_BASE_URL = os.environ.get('AUDIOLINE_STREAM_URL', '')
+# Nella UI il player punta al server, non a Streamlit: senza porta o URL
+# configurati l'indirizzo sarebbe raggiungibile solo dalla stessa macchina
+PROGRESSIVE_UI_ENABLED = bool(PROGRESSIVE_PORT or PROGRESSIVE_BASE_URL)
+PROGRESSIVE_MAX_VIDEOS = 32
+PROGRESSIVE_CHUNK_BYTES = 1 << 16
+
+
+class ProgressiveVideoServer:
+    """Server HTTP locale che trasmette gli MP4 frammentati mentre vengono scritti.
+
+    Un video pubblicato con `publish` viene inviato in chunked encoding:
+    il server legge il file man mano che cresce e chiude la risposta solo
+    dopo `finish`, così il browser inizia a riprodurre i primi frammenti
+    mentre il rendering è ancora in corso. Sono serviti solo i file pubblicati.
+    """
+
+    def __init__(self, port=PROGRESSIVE_PORT, host="0.0.0.0", base_url=PROGRESSIVE_BASE_URL):
+        from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+        self.videos = {}
+        self._lock = threading.Lock()
+        server = self
+
+        class StreamHandler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def do_GET(self):
+                match = re.fullmatch(r"/video/([0-9a-f]+)\.mp4", self.path.split('?')[0])
+                with server._lock:
+                    video = server.videos.get(match.group(1)) if match else None
+                if video is None:
+                    self.send_error(404)
+                    return
+                self.send_response(200)
+                self.send_header('Content-Type', 'video/mp4')
+                self.send_header('Transfer-Encoding', 'chunked')
+                self.send_header('Cache-Control', 'no-cache')
+                self.end_headers()
+                try:
+                    server.stream(video, self.write_chunk)
+                    self.wfile.write(b"0\r\n\r\n")
+                except (BrokenPipeError, ConnectionResetError):
+                    pass  # il browser ha chiuso il player
+
+            def write_chunk(self, data):
+                self.wfile.write(f"{len(data):x}\r\n".encode() + data + b"\r\n")
+                self.wfile.flush()
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer((host, port), StreamHandler)
+        self.server.daemon_threads = True
+        self.port = self.server.server_address[1]
+        self.base_url = base_url or f"http://localhost:{self.port}"
+        threading.Thread(target=self.server.serve_forever, name="audioline-progressive", daemon=True).start()
+
+    def publish(self, path):
+        """Rende disponibile `path` (anche non ancora creato); restituisce l'URL da riprodurre"""
+        video_id = uuid.uuid4().hex
+        with self._lock:
+            self.videos[video_id] = {'path': path, 'done': threading.Event()}
+            while len(self.videos) > PROGRESSIVE_MAX_VIDEOS:
+                del self.videos[next(iter(self.videos))]
+        return video_id, f"{self.base_url}/video/{video_id}.mp4"
+
+    def finish(self, video_id):
+        """Il file non crescerà più: le risposte in corso terminano a fine file"""
+        with self._lock:
+            video = self.videos.get(video_id)
+        if video is not None:
+            video['done'].set()
+
+    def stream(self, video, write, poll_interval=0.1):
+        with contextlib.ExitStack() as stack:
+            f = None
+            while True:
+                done = video['done'].is_set()
+                if f is None and os.path.exists(video['path']):
+                    f = stack.enter_context(open(video['path'], 'rb'))
+                data = f.read(PROGRESSIVE_CHUNK_BYTES) if f is not None else b""
+                if data:
+                    write(data)
+                elif done:
+                    return  # dopo `finish` una lettura vuota è la fine del file
+                else:
+                    video['done'].wait(poll_interval)
+
+
+@st.cache_resource(show_spinner=False)
+def get_progressive_server():
+    """Server dei video progressivi, unico per processo"""
+    return ProgressiveVideoServer()
+
+
+# Parametri dell'analisi live
+LIVE_HISTORY_FRAMES = 512
+LIVE_BLOCK_FRAMES = 512
+
+
+class LiveVisualizer(AudioVisualizer):
+    """Analisi incrementale per sorgenti live o in streaming.
+
+    L'audio arriva a blocchi con `push()` e finisce in un ring buffer; a ogni
+    blocco la STFT (causale) viene calcolata solo sui nuovi hop completi. Le
+    curve di banda recenti restano in uno storico circolare indicizzato dal
+    numero di hop, che fa da `time_idx` per i metodi di disegno. Al posto del
+    massimo globale i massimi di banda decadono nel tempo (`decay`, tempo di
+    dimezzamento `norm_half_life`) oppure crescono soltanto (`running`).
+    Se l'analisi resta indietro di oltre `max_latency` secondi l'audio più
+    vecchio viene scartato, così la latenza audio→video resta limitata.
+    """
+    # Massimo minimo (modulo STFT): il silenzio non viene amplificato a piena scala
+    norm_floor = 0.05
+
+    def __init__(self, sr, channel_mode='mono', input_channels=1, band_edges=None, layer_map=None,
+                 normalization='decay', norm_half_life=8.0, max_latency=0.25):
+        import librosa
+
+        self.sr = sr
+        self.hop_length = ANALYSIS_HOP_LENGTH
+        self.n_fft = ANALYSIS_N_FFT
+        self.channel_mode = channel_mode if input_channels >= 2 else 'mono'
+        self.freq_bins = librosa.fft_frequencies(sr=sr, n_fft=self.n_fft)
+        self.band_edges = np.asarray(DEFAULT_BAND_EDGES if band_edges is None else band_edges, dtype=np.float64)
+        self.filterbank = build_filterbank(self.freq_bins, self.band_edges)
+        n_channels = 1 if self.channel_mode == 'mono' else 2
+        n_bands = self.filterbank.shape[0]
+
+        # Ring buffer "specchiato": ogni campione è scritto in i e i+capacity, così
+        # qualsiasi finestra lunga fino a `capacity` è una vista contigua
+        backlog = int(np.ceil(max_latency * sr / self.hop_length)) * self.hop_length
+        self.capacity = self.n_fft + backlog
+        self._ring = np.zeros((n_channels, 2 * self.capacity), dtype=np.float32)
+        self.samples_written = 0
+        self.next_frame_start = 0
+
+        self.normalization = normalization
+        self.decay_per_hop = 0.5 ** (self.hop_length / (sr * norm_half_life)) if normalization == 'decay' else 1.0
+        self.band_maxima = np.full(n_bands, self.norm_floor, dtype=np.float32)
+        self.channel_band_energy = np.zeros((n_channels, n_bands, LIVE_HISTORY_FRAMES), dtype=np.float32)
+        self.frame_capture_times = np.zeros(LIVE_HISTORY_FRAMES)
+        # Inviluppi e beat richiedono l'intero brano: nel live il movimento resta a tempo
+        self.control_signals = None
+        self.frames_analyzed = 0
+        self.dropped_hops = 0
+        self._lock = threading.Lock()
+
+        self.start_time = 0.0
+        self.duration = 0.0
+        self.source_path = None
+        self.audio_mux_mode = None
+        self._static_layers = None
+        self.color_statistics = {
+            'low_total': 0,
+            'mid_total': 0,
+            'high_total': 0,
+            'total_energy': 0
+        }
+        self.set_layer_map(layer_map)
+
+    def update_analysis_key(self):
+        """Le curve cambiano di continuo: la chiave identifica solo la configurazione"""
+        self.analysis_key = hashlib.sha1(repr((
+            'live', self.sr, self.channel_mode, tuple(self.band_edges), sorted(self.layer_map.items())
+        )).encode()).hexdigest()
+
+    def push(self, block, capture_time=None):
+        """Aggiunge un blocco audio (campioni,) o (campioni, canali) e analizza i nuovi hop"""
+        capture_time = time.perf_counter() if capture_time is None else capture_time
+        block = np.asarray(block, dtype=np.float32)
+        channels = block.T if block.ndim == 2 else block
+        analysis_audio, _, _ = prepare_analysis_channels(channels, self.channel_mode)
+        analysis_audio = np.atleast_2d(analysis_audio)
+
+        with self._lock:
+            # Oltre la capacità sopravvivono solo gli ultimi campioni
+            total = analysis_audio.shape[1]
+            analysis_audio = analysis_audio[:, -self.capacity:]
+            n = analysis_audio.shape[1]
+            pos = (self.samples_written + total - n) % self.capacity
+            first = min(n, self.capacity - pos)
+            for offset in (0, self.capacity):
+                self._ring[:, offset + pos:offset + pos + first] = analysis_audio[:, :first]
+                self._ring[:, offset:offset + n - first] = analysis_audio[:, first:]
+            self.samples_written += total
+
+            # Hop rimasti troppo indietro (analisi più lenta del tempo reale): scartati
+            oldest = self.samples_written - self.capacity
+            if self.next_frame_start < oldest:
+                skipped = -(-(oldest - self.next_frame_start) // self.hop_length)
+                self.next_frame_start += skipped * self.hop_length
+                self.dropped_hops += skipped
+
+            available = self.samples_written - self.next_frame_start
+            if available < self.n_fft:
+                return 0
+            new_frames = (available - self.n_fft) // self.hop_length + 1
+            span = (new_frames - 1) * self.hop_length + self.n_fft
+            start = self.next_frame_start % self.capacity
+            energy = stft_band_energy(self._ring[:, start:start + span], self.n_fft, self.hop_length,
+                                      self.filterbank, center=False)
+
+            for k in range(new_frames):
+                frame_energy = energy[:, :, k]
+                self.band_maxima = np.maximum(
+                    np.maximum(self.band_maxima * self.decay_per_hop, frame_energy.max(axis=0)), self.norm_floor
+                )
+                slot = self.frames_analyzed % LIVE_HISTORY_FRAMES
+                self.channel_band_energy[:, :, slot] = frame_energy
+                self.frame_capture_times[slot] = capture_time
+                self.frames_analyzed += 1
+            self.next_frame_start += new_frames * self.hop_length
+            return new_frames
+
+    def latest_frame(self):
+        """(time_idx, istante di arrivo dell'audio) dell'ultimo hop analizzato, o (-1, None)"""
+        with self._lock:
+            if self.frames_analyzed == 0:
+                return -1, None
+            time_idx = self.frames_analyzed - 1
+            return time_idx, self.frame_capture_times[time_idx % LIVE_HISTORY_FRAMES]
+
+    def get_history_energy(self, time_idx):
+        """Energie (canali × bande) di un hop ancora nello storico, altrimenti None"""
+        if time_idx < 0 or not self.frames_analyzed - LIVE_HISTORY_FRAMES <= time_idx < self.frames_analyzed:
+            return None
+        return self.channel_band_energy[:, :, time_idx % LIVE_HISTORY_FRAMES]
+
+    def get_frequency_bands(self, time_idx, effects=None):
+        """Energie per banda dell'hop `time_idx` (zero se fuori dallo storico).
+
+        Gli inviluppi di `smoothing` richiedono l'intero brano: qui le curve sono grezze.
+        """
+        with self._lock:
+            energy = self.get_history_energy(time_idx)
+            if energy is None:
+                return np.zeros(self.channel_band_energy.shape[1], dtype=np.float32)
+            return energy.mean(axis=0) if self.channel_mode == 'stereo' else energy[0].copy()
+
+    def get_channel_bands(self, time_idx, effects=None):
+        """Layer normalizzati per canale con i massimi correnti"""
+        with self._lock:
+            energy = self.get_history_energy(time_idx)
+            if energy is None:
+                energy = np.zeros(self.channel_band_energy.shape[:2], dtype=np.float32)
+            return tuple(self.normalize_bands(channel_energy) for channel_energy in energy)
+
+
+class SimulatedLiveSource:
+    """Sorgente live simulata: un file audio rilasciato a blocchi al ritmo del tempo reale.
+
+    Ogni blocco viene restituito solo quando l'orologio raggiunge la fine del
+    blocco stesso, come farebbe un'interfaccia audio.
+    """
+
+    def __init__(self, path, block_frames=LIVE_BLOCK_FRAMES, max_seconds=None, realtime=True):
+        audio, self.sr, _ = decode_audio(path, duration=max_seconds, mono=False)
+        self.audio = np.atleast_2d(audio)
+        self.channels = self.audio.shape[0]
+        self.block_frames = block_frames
+        self.realtime = realtime
+
+    def __iter__(self):
+        start_clock = time.perf_counter()
+        for start in range(0, self.audio.shape[1], self.block_frames):
+            block = self.audio[:, start:start + self.block_frames]
+            if self.realtime:
+                delay = start_clock + (start + block.shape[1]) / self.sr - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+            yield block.T
+
+
+class PipeAudioSource:
+    """Sorgente in streaming: PCM float32 interleaved da uno stream binario (es. stdin).
+
+    Esempio (`-re` legge al ritmo del tempo reale):
+    `ffmpeg -re -i URL -f f32le -ac 2 -ar 44100 - | python app.py live - --sr 44100 --input-channels 2`
+    """
+
+    def __init__(self, stream, sr, channels=1, block_frames=LIVE_BLOCK_FRAMES):
+        self.stream = stream
+        self.sr = sr
+        self.channels = channels
+        self.block_frames = block_frames
+
+    def __iter__(self):
+        frame_bytes = 4 * self.channels
+        block = bytearray(self.block_frames * frame_bytes)
+        view = memoryview(block)
+        pending = 0
+        while True:
+            n = self.stream.readinto(view[pending:])
+            if not n:
+                break
+            pending += n
+            usable = pending - pending % frame_bytes
+            if usable:
+                yield np.frombuffer(block, dtype=np.float32, count=usable // 4).reshape(-1, self.channels).copy()
+            block[:pending - usable] = block[usable:pending]
+            pending -= usable
+
+
+def run_live(visualizer, source, fps=30, pattern_type="waves", colors=None, effects=None,
+             aspect_ratio="16:9 (Standard)", title_settings=None, resolution_px=(1280, 720),
+             on_frame=None, max_frames=None):
+    """Visualizzazione live: l'audio della sorgente alimenta `visualizer` in un thread,
+    mentre i frame vengono emessi a FPS fisso dall'ultimo hop analizzato.
+
+    Se il rendering resta indietro i tick persi vengono saltati invece di
+    accumularsi (latenza limitata). `on_frame(frame, latency)` riceve ogni
+    frame RGB; la latenza è il tempo tra l'arrivo dell'audio analizzato e
+    l'emissione del frame. Restituisce le statistiche della sessione.
+    """
+    dpi = visualizer.get_render_dpi(resolution_px)
+    done = threading.Event()
+
+    # Layer statici e import di matplotlib preparati prima che arrivi l'audio
+    visualizer.render_frame(-1, pattern_type, colors, effects, aspect_ratio, title_settings, resolution_px, dpi)
+
+    def feed():
+        try:
+            for block in source:
+                visualizer.push(block)
+                if done.is_set():
+                    break
+        finally:
+            done.set()
+
+    feeder = threading.Thread(target=feed, name="audioline-live-feed", daemon=True)
+    feeder.start()
+
+    metrics = get_metrics()
+    period = 1.0 / fps
+    latencies = []
+    skipped_ticks = 0
+    next_tick = time.perf_counter()
+    try:
+        while not done.is_set() and (max_frames is None or len(latencies) < max_frames):
+            now = time.perf_counter()
+            if now < next_tick:
+                time.sleep(next_tick - now)
+            elif now - next_tick >= period:
+                missed = int((now - next_tick) / period)
+                skipped_ticks += missed
+                next_tick += missed * period
+            next_tick += period
+
+            time_idx, capture_time = visualizer.latest_frame()
+            if time_idx < 0:
+                continue
+            frame_start = time.perf_counter()
+            frame = visualizer.render_frame(time_idx, pattern_type, colors, effects, aspect_ratio,
+                                            title_settings, resolution_px, dpi)
+            metrics.frame_render_seconds.observe(time.perf_counter() - frame_start, mode='live')
+            metrics.frames_rendered_total.inc(mode='live')
+            latency = time.perf_counter() - capture_time
+            latencies.append(latency)
+            if on_frame is not None:
+                on_frame(frame, latency)
+    finally:
+        done.set()
+        feeder.join(timeout=1.0)
+
+    frames = len(latencies)
+    latencies = np.array(latencies) if latencies else np.zeros(1)
+    return {
+        'frames': frames,
+        'skipped_ticks': skipped_ticks,
+        'dropped_hops': visualizer.dropped_hops,
+        'latency_mean': float(latencies.mean()),
+        'latency_p95': float(np.percentile(latencies, 95)),
+        'latency_max': float(latencies.max())
+    }
+
 
-  TRACK        *{track_name}*
-  DURATION     {duration_codec}
-  SAMPLERATE   {self.sr:,} Hz
-  RESOLUTION   {w}x{h} px  ·  {aspect_ratio}
-  FRAMES       {total_frames:,} @ {fps} FPS
-  GENERATED    {date_codec}  {time_codec}
+WELCOME_DEMO_PATH = os.path.join(tempfile.gettempdir(), "audioline_welcome_demo.png")
 
-__________________________________________
-#audiovisualization #musicvisualizer #audiolinetwo
-#waves #soundart #musicart #visualmusic #frequencyart
-#audioreactive #waveform #sounddesign #generativeart
-__________________________________________
 
-audiovisualization, musicvisualizer, audiolinetwo,
-waves, soundart, musicart, visualmusic, frequencyart,
-audioreactive, waveform, sounddesign, generativeart,
-"""
-        return report
+@st.cache_data(show_spinner=False)
+def get_welcome_demo():
+    """PNG della demo iniziale: letto dal file pre-renderizzato (warm-up) se esiste"""
+    if os.path.exists(WELCOME_DEMO_PATH):
+        with open(WELCOME_DEMO_PATH, 'rb') as f:
+            return f.read()
+    png = render_welcome_demo()
+    tmp_path = f"{WELCOME_DEMO_PATH}.{os.getpid()}.tmp"
+    with open(tmp_path, 'wb') as f:
+        f.write(png)
+    os.replace(tmp_path, WELCOME_DEMO_PATH)
+    return png
 
-    def create_video_no_audio(self, output_path, pattern_type, colors, effects, fps, 
-                             aspect_ratio="16:9 (Standard)", video_quality="Media (1280x720)", 
-                             title_settings=None):
-        """Crea un video senza audio"""
-        # Reset statistiche colori
-        self.color_statistics = {
-            'low_total': 0,
-            'mid_total': 0,
-            'high_total': 0,
-            'total_energy': 0
-        }
-        
-        # Calcola la risoluzione finale
-        resolution_px = self.get_resolution(video_quality, aspect_ratio)
-        
-        # Calcola il numero totale di frame
-        total_frames = int(self.duration * fps)
-        progress_bar = st.progress(0)
-        status_text = st.empty()
-        
-        # Crea una directory temporanea per i frame
-        temp_dir = tempfile.mkdtemp()
-        frame_paths = []
-        
-        # Calcola il passo temporale per frame
-        time_step = self.times[-1] / total_frames
-        
-        # Genera tutti i frame
-        for frame_idx in range(total_frames):
-            # Calcola il tempo corrente
-            current_time = frame_idx * time_step
-            
-            # Trova l'indice temporale più vicino
-            time_idx = np.argmin(np.abs(self.times - current_time))
-            
-            # Crea frame con la risoluzione corretta
-            fig = self.create_pattern_frame(
-                time_idx, pattern_type, colors, effects, aspect_ratio, 
-                title_settings, resolution_px=resolution_px, dpi=100
-            )
-            
-            # Salva il frame come immagine
-            frame_path = os.path.join(temp_dir, f"frame_{frame_idx:04d}.png")
-            fig.savefig(frame_path, bbox_inches='tight', pad_inches=0)
-            plt.close(fig)
-            frame_paths.append(frame_path)
-            
-            # Aggiorna progresso
-            progress = (frame_idx + 1) / total_frames
-            progress_bar.progress(progress)
-            status_text.text(f"Generando frame {frame_idx+1}/{total_frames}")
-        
-        # Crea video dai frame
-        with imageio.get_writer(output_path, fps=fps) as writer:
-            for frame_path in frame_paths:
-                image = imageio.imread(frame_path)
-                writer.append_data(image)
-                os.remove(frame_path)  # Rimuovi frame dopo l'uso
-        
-        # Rimuovi directory temporanea
-        os.rmdir(temp_dir)
-        status_text.text("✅ Video senza audio creato")
-        progress_bar.empty()
-        
-        return total_frames, resolution_px
+
+def render_welcome_demo():
+    """Renderizza l'immagine demo della schermata iniziale (3 stili wave)"""
+    from matplotlib.figure import Figure
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
     
-    def create_video_with_audio(self, output_path, pattern_type, colors, effects, fps, 
-                               audio_filename="Unknown Track", video_quality="Media (1280x720)", 
-                               aspect_ratio="16:9 (Standard)", video_title="My Audio Visual", title_settings=None):
-        """Crea un video completo con audio e genera report finale"""
-        # Crea un video temporaneo senza audio
-        temp_video_path = output_path.replace('.mp4', '_no_audio.mp4')
-        total_frames, resolution_px = self.create_video_no_audio(
-            temp_video_path, pattern_type, colors, effects, fps, 
-            aspect_ratio, video_quality, title_settings
-        )
-        
-        # Crea un file audio temporaneo
-        temp_audio_path = output_path.replace('.mp4', '.wav')
-        
-        # Estrai l'audio corrispondente alla durata effettiva
-        start_sample = 0
-        end_sample = int(self.duration * self.sr)
-        audio_segment = self.audio_data[start_sample:end_sample]
-        
-        # Normalizza e salva l'audio
-        if np.max(np.abs(audio_segment)) > 0:
-            audio_segment = audio_segment / np.max(np.abs(audio_segment))
-        wavfile.write(temp_audio_path, self.sr, audio_segment)
-        
-        # Combina video e audio usando FFmpeg
-        try:
-            command = [
-                'ffmpeg',
-                '-y',  # Sovrascrivi senza chiedere
-                '-i', temp_video_path,
-                '-i', temp_audio_path,
-                '-c:v', 'copy',  # Copia il video senza ri-encodare
-                '-c:a', 'aac',   # Encodare audio in AAC
-                '-shortest',     # Termina quando il più corto dei due stream termina
-                '-strict', 'experimental',
-                output_path
-            ]
-            subprocess.run(command, check=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-            
-            # Genera e mostra il report finale
-            self.show_generation_report(audio_filename, video_title, pattern_type, 
-                                      colors, effects, fps, total_frames, 
-                                      video_quality, aspect_ratio, title_settings,
-                                      resolution_px)
-            
-            return True
-            
-        except subprocess.CalledProcessError as e:
-            st.error(f"Errore durante la combinazione audio/video: {e.stderr.decode()}")
-            return False
-        finally:
-            # Pulisci i file temporanei
-            if os.path.exists(temp_video_path):
-                os.remove(temp_video_path)
-            if os.path.exists(temp_audio_path):
-                os.remove(temp_audio_path)
+    demo_fig = Figure(figsize=(14, 12), facecolor='black')
+    FigureCanvasAgg(demo_fig)
+    ax1, ax2, ax3 = demo_fig.subplots(3, 1)
+    x = np.linspace(0, 16, 500)
     
-    def show_generation_report(self, audio_filename, video_title, pattern_type, colors, effects, fps, total_frames, video_quality, aspect_ratio, title_settings, resolution_px):
-        """Mostra il report dettagliato della generazione"""
-        # Calcola le percentuali dei colori
-        low_percent, mid_percent, high_percent = self.get_color_percentages()
-        
-        # Formatta la risoluzione
-        final_resolution = f"{resolution_px[0]}x{resolution_px[1]}"
-        
-        # Mappa nomi pattern
-        pattern_names = {
-            "waves": "Onde Classiche",
-            "interference": "Onde Interferenza Strutturate", 
-            "flowing": "Onde Stratificate Orizzontali",
-            "am": "Onde AM",
-            "fm": "Onde FM",
-            "reflected": "Onde Riflesse",
-            "varied_amplitude": "Onde Ampiezza Variabile",
-            "varied_shape": "Onde Forma Variabile",
-            "varied_motion": "Onde Movimento Variabile"
-        }
-        
-        # Determina intensità basata sui moltiplicatori
-        intensity_level = effects.get('intensity', 1.0)
-        if intensity_level < 0.8:
-            intensity_desc = "Bassa"
-        elif intensity_level > 1.5:
-            intensity_desc = "Alta"
-        else:
-            intensity_desc = "Media"
-        
-        # Prepara info titolo
-        title_info = "❌ Disabilitato"
-        if title_settings and title_settings['text']:
-            title_position = f"{title_settings['v_position']} {title_settings['h_position']}"
-            title_info = f"{title_settings['text']} ({title_position}, {title_settings['fontsize']}px)"
+    # Demo onde classiche
+    ax1.set_facecolor('black')
+    for i in range(3):
+        y = 1.5 + i * 0.8 + 0.8 * np.sin(2 * np.pi * (0.5 + i * 0.3) * x/16)
+        ax1.plot(x, y, color=['#FF0000', '#0000FF', '#FFFFFF'][i], linewidth=3, alpha=0.8)
+    ax1.set_xlim(0, 16)
+    ax1.set_ylim(0, 4)
+    ax1.set_title('🌊 Onde Classiche', color='white', fontsize=14, pad=20)
+    ax1.axis('off')
+    
+    # Demo interferenza
+    ax2.set_facecolor('black')
+    for i in range(8):
+        freq1 = 0.8 + i * 0.2
+        freq2 = 1.0 + i * 0.15
+        y1 = 2 + 0.6 * np.sin(2 * np.pi * freq1 * x/16)
+        y2 = 2 + 0.4 * np.sin(2 * np.pi * freq2 * x/16 + np.pi/4)
+        colors = ['#FF4444', '#4444FF', '#FFFFFF']
+        ax2.plot(x, y1, color=colors[i % 3], linewidth=1.5, alpha=0.6)
+        ax2.plot(x, y2, color=colors[(i+1) % 3], linewidth=1.5, alpha=0.4)
+    ax2.set_xlim(0, 16)
+    ax2.set_ylim(0, 4)
+    ax2.set_title('🔄 Onde Interferenza', color='white', fontsize=14, pad=20)
+    ax2.axis('off')
+    
+    # Demo fluide
+    ax3.set_facecolor('black')
+    for i in range(15):
+        freq = 1.0 + i * 0.1
+        phase = i * np.pi/8
+        amplitude = 0.3 + 0.2 * (i/15)
+        y = 2 + amplitude * np.sin(2 * np.pi * freq * x/16 + phase)
         
-        # Crea il report
-        report = f"""
-## 📊 Audio Visual Report - WAVES EDITION
+        # Colore sfumato
+        color_intensity = 0.3 + 0.7 * (i/15)
+        color = (color_intensity, color_intensity * 0.7, color_intensity)
+        ax3.plot(x, y, color=color, linewidth=0.8, alpha=0.4 + 0.4*(i/15))
+    
+    ax3.set_xlim(0, 16)
+    ax3.set_ylim(0, 4)
+    ax3.set_title('💫 Onde Fluide', color='white', fontsize=14, pad=20)
+    ax3.axis('off')
+    
+    demo_fig.tight_layout()
+    buf = io.BytesIO()
+    demo_fig.savefig(buf, format='png', facecolor='black')
+    return buf.getvalue()
 
-**🎬 Video Title:** {video_title}  
-**🎵 Audio Track:** {audio_filename}  
-**⏱️ Duration:** {self.duration:.1f}s  
-**🔊 Sample Rate:** {self.sr:,} Hz  
-**📺 Resolution:** {final_resolution}  
-**📐 Aspect Ratio:** {aspect_ratio}
 
-### 🌈 Color Distribution by Frequency:
-- **🔴 Low Frequencies (20-250Hz):** {low_percent:.1f}%
-- **🔵 Mid Frequencies (250-4000Hz):** {mid_percent:.1f}%  
-- **⚪ High Frequencies (4000-20000Hz):** {high_percent:.1f}%
+def warm_up():
+    """Prepara il processo al primo rendering e restituisce i tempi di ogni fase.
 
-### ⚙️ Wave Configuration:
-- **🌊 Wave Style:** {pattern_names.get(pattern_type, pattern_type.title())}
-- **💪 Intensità:** {intensity_desc} ({intensity_level}x)
-- **⚡ Velocità:** {effects.get('speed', 0.1)}x
-- **🎲 Casualità:** {effects.get('randomness', 0.0)*100:.0f}%
-- **📐 Format:** {aspect_ratio.split(' ')[0]} | **🎬 FPS:** {fps}
-- **📝 Title:** {title_info}
-- **🖼️ Total Frames:** ~{total_frames:,}
+    Importa i moduli pesanti, costruisce la cache dei font di matplotlib,
+    inizializza i piani FFT (e l'eventuale JIT di librosa) con un'analisi
+    breve, compila il beat tracker, rende un frame e pre-renderizza la demo
+    della schermata iniziale, così la prima visita e il primo upload non
+    pagano questi costi.
+    """
+    timings = {}
 
----
-*Generated by **AudioLineTwo** - WAVES EDITION BY LOOP507*  
-*Timestamp: {datetime.now().strftime("%Y-%m-%d %H:%M:%S")}*
-        """
-        
-        # Mostra il report in un expander
-        with st.expander("📊 **WAVE GENERATION REPORT** - Clicca per vedere i dettagli", expanded=True):
-            st.markdown(report)
-        
-        # Salva report social in session_state
-        social_report = self.generate_social_report(
-            audio_filename, video_title, pattern_type,
-            colors, effects, fps, total_frames,
-            video_quality, aspect_ratio, low_percent, mid_percent, high_percent
-        )
-        st.session_state['social_report'] = social_report
+    start = time.perf_counter()
+    import librosa  # noqa: F401
+    import imageio  # noqa: F401
+    from scipy.io import wavfile  # noqa: F401
+    from matplotlib import font_manager
+    from matplotlib.figure import Figure
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+    timings['import'] = time.perf_counter() - start
 
-        # Anche come info success
-        st.success(f"""
-        ✅ **Video Wave generato con successo!**
-        
-        **Distribuzione Colori:**
-        🔴 Basse: {low_percent:.1f}% | 🔵 Medie: {mid_percent:.1f}% | ⚪ Acute: {high_percent:.1f}%
-        
-        **Dettagli:** {total_frames:,} frames • {fps} FPS • {self.duration:.1f}s • Wave: {pattern_names.get(pattern_type, pattern_type)} • {final_resolution}
-        **Effetti:** Intensità {intensity_desc} • Velocità {effects.get('speed', 0.1)}x • Casualità {effects.get('randomness', 0.0)*100:.0f}%
-        """)
+    start = time.perf_counter()
+    font_manager.findfont(font_manager.FontProperties(weight='bold'))
+    fig = Figure(figsize=(2, 1), dpi=72)
+    canvas = FigureCanvasAgg(fig)
+    fig.text(0.5, 0.5, "AudioLineTwo", fontweight='bold')
+    canvas.draw()
+    timings['fonts'] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    sr = 22050
+    noise = np.random.default_rng(0).standard_normal(sr).astype(np.float32)
+    visualizer = AudioVisualizer(noise, sr)
+    timings['analysis'] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    visualizer.get_control_signal('beat_frames')
+    timings['beat_tracker'] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    visualizer.render_frame(0, resolution_px=(320, 180), dpi=72)
+    timings['render'] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    get_welcome_demo()
+    timings['welcome_demo'] = time.perf_counter() - start
+
+    return timings
+
+
+@st.cache_resource(show_spinner=False)
+def start_warm_up():
+    """Hook di avvio: esegue il warm-up una sola volta per processo, in background"""
+    thread = threading.Thread(target=warm_up, name="audioline-warmup", daemon=True)
+    thread.start()
+    return thread
 
-# Configurazione pagina
-st.set_page_config(
-    page_title="AudioLineTwo WAVES by Loop507",
-    page_icon="🌊",
-    layout="wide",
-    initial_sidebar_state="expanded"
-)
 
 def main():
+    # Configurazione pagina
+    st.set_page_config(
+        page_title="AudioLineTwo WAVES by Loop507",
+        page_icon="🌊",
+        layout="wide",
+        initial_sidebar_state="expanded"
+    )
+    
+    # Warm-up del processo (una sola volta, non blocca la pagina)
+    start_warm_up()
+    start_metrics_exporters()
+    
     # Inizializza session_state
     for _key in ('run_preview', 'preview_frames', 'create_video',
-                 'video_bytes', 'video_filename', 'video_path', 'social_report'):
+                 'video_bytes', 'video_filename', 'video_path', 'social_report',
+                 'uploaded_audio', 'decoded_audio', 'instant_report', 'scrubber', 'poster_png',
+                 'rendition_files'):
         if _key not in st.session_state:
             st.session_state[_key] = None
 
@@ -858,7 +3864,7 @@ def main():
     # Upload file audio
     uploaded_file = st.sidebar.file_uploader(
         "Carica file audio",
-        type=['wav', 'mp3', 'm4a', 'flac'],
+        type=list(AUDIO_EXTENSIONS),
         help="Formati supportati: WAV, MP3, M4A, FLAC"
     )
     
@@ -872,8 +3878,7 @@ def main():
     # Selezione pattern WAVE
     pattern_type = st.sidebar.selectbox(
         "Tipo di Onda",
-        ["waves", "interference", "flowing", "am", "fm", "reflected", 
-         "varied_amplitude", "varied_shape", "varied_motion"],
+        list(PATTERN_TYPES),
         help="Scegli il tipo di visualizzazione wave",
         format_func=lambda x: {
             "waves": "🌊 Onde Classiche",
@@ -938,21 +3943,94 @@ def main():
     randomness_factor = st.sidebar.slider("Casualità", 0.0, 1.0, 0.0, 0.05,
                                         help="Aggiunge variazione casuale alle onde")
     
+    # Movimento e inviluppi (segnali di controllo precalcolati con l'analisi)
+    motion_mode = st.sidebar.selectbox(
+        "Movimento", list(MOTION_MODES),
+        format_func=lambda x: {"time": "⏱️ Costante", "beat": "🥁 A ritmo (beat)", "onset": "⚡ Sugli attacchi"}[x],
+        help="Costante: velocità fissa • Beat: scatto su ogni battito • Attacchi: accelera sui transienti, "
+             "si ferma nel silenzio"
+    )
+    smoothing = st.sidebar.checkbox("Ampiezze morbide", value=False,
+                                    help="Inviluppo attack/release sulle bande: salita rapida, discesa graduale")
+    
+    # Canali: downmix mono oppure un layer per canale (L/R o Mid/Side)
+    channel_mode = st.sidebar.selectbox(
+        "Canali", list(CHANNEL_MODES),
+        format_func=lambda x: {"mono": "Mono", "stereo": "Stereo L/R", "midside": "Mid/Side"}[x],
+        help="In stereo ogni canale guida un proprio layer di onde"
+    )
+    if channel_mode != "mono":
+        stereo_layout = st.sidebar.selectbox(
+            "Layout Stereo", list(STEREO_LAYOUTS),
+            format_func=lambda x: {"mirrored": "🪞 Speculare", "split": "⬒ Schermo diviso"}[x]
+        )
+    
     # Preparazione effetti
     effects = {
         'intensity': intensity_multiplier,
         'speed': speed_multiplier,
-        'randomness': randomness_factor
+        'randomness': randomness_factor,
+        'motion': motion_mode,
+        'smoothing': smoothing
     }
+    if channel_mode != "mono":
+        effects['stereo_layout'] = stereo_layout
     
     # FPS per la visualizzazione
-    frame_rate = st.sidebar.selectbox("FPS", [10, 15, 20, 30], index=2)
+    frame_rate = int(st.sidebar.number_input("FPS", min_value=1, max_value=120, value=20, step=1,
+                                             help="Frame al secondo del video (es. 24, 30, 60)"))
     
     # Qualità video
-    video_quality = st.sidebar.selectbox("Qualità Video", ["Bassa (960x540)", "Media (1280x720)", "Alta (1920x1080)"], index=1)
+    video_quality = st.sidebar.selectbox(
+        "Qualità Video",
+        ["Bassa (960x540)", "Media (1280x720)", "Alta (1920x1080)",
+         "2K (2560x1440)", "4K (3840x2160)", "Personalizzata"],
+        index=1
+    )
     
-    # Aspect Ratio
-    aspect_ratio = st.sidebar.selectbox("Aspect Ratio", ["16:9 (Standard)", "1:1 (Quadrato)", "9:16 (Verticale)"], index=0)
+    if video_quality == "Personalizzata":
+        # Risoluzione libera (es. LED wall): l'aspect ratio segue le dimensioni
+        col_w, col_h = st.sidebar.columns(2)
+        with col_w:
+            custom_width = int(st.number_input("Larghezza (px)", min_value=64, max_value=7680, value=1920, step=2))
+        with col_h:
+            custom_height = int(st.number_input("Altezza (px)", min_value=64, max_value=4320, value=1080, step=2))
+        video_quality = (custom_width, custom_height)
+        aspect_ratio = f"{custom_width}:{custom_height} (Personalizzato)"
+    else:
+        # Aspect Ratio
+        aspect_ratio = st.sidebar.selectbox("Aspect Ratio", ["16:9 (Standard)", "1:1 (Quadrato)", "9:16 (Verticale)"], index=0)
+    
+    # Audio: di default la traccia originale viene copiata senza ricodifica
+    normalize_audio = st.sidebar.checkbox("Normalizza audio", value=False,
+                                          help="Porta il picco dell'audio a 0 dB (richiede la ricodifica AAC)")
+    poster_layout = st.sidebar.selectbox(
+        "Poster del brano", list(POSTER_LAYOUTS),
+        format_func=lambda x: {"overlay": "Sovrapposto", "strip": "Striscia temporale"}[x],
+        help="Immagine riassuntiva dell'intero brano, generata con il video e con il report istantaneo"
+    )
+    render_workers = int(st.sidebar.number_input(
+        "Worker di rendering", min_value=0, max_value=max(os.cpu_count() or 1, 1) * 2, value=0,
+        help="0 = un solo processo; con N > 0 la timeline è divisa in segmenti renderizzati da N processi"
+    ))
+    progressive_export = st.sidebar.checkbox(
+        "Riproduzione durante il rendering", value=False, disabled=not PROGRESSIVE_UI_ENABLED,
+        help="Video con audio in un solo passaggio (MP4 frammentato): il player parte dopo pochi secondi "
+             "mentre il resto viene ancora generato. Ignora i worker di rendering. Il player si collega a un "
+             "server separato: disponibile solo se AUDIOLINE_STREAM_URL (indirizzo pubblico) o "
+             "AUDIOLINE_STREAM_PORT sono configurati."
+    )
+    if progressive_export:
+        render_workers = 0
+    export_renditions = st.sidebar.multiselect(
+        "Rendition multiple", list(RENDITIONS),
+        help="Più risoluzioni da un solo rendering (es. 1080p per YouTube, 720p per il web, 540p per le "
+             "anteprime), ognuna con la propria qualità x264. Sostituisce risoluzione di export, "
+             "riproduzione durante il rendering e worker."
+    )
+    if export_renditions:
+        progressive_export = False
+        render_workers = 0
     
     # Prepara impostazioni titolo
     title_settings = {
@@ -964,16 +4042,133 @@ def main():
     }
     
     if uploaded_file is not None:
-        with st.spinner("🎵 Caricamento e analisi audio..."):
-            # Carica file audio
-            audio_bytes = uploaded_file.read()
-            audio_data, sr = librosa.load(io.BytesIO(audio_bytes), sr=None)
+        # File temporaneo + probe una sola volta per upload
+        file_id = getattr(uploaded_file, 'file_id', None) or uploaded_file.name
+        upload = st.session_state.get('uploaded_audio')
+        if upload is None or upload['file_id'] != file_id:
+            if upload is not None and os.path.exists(upload['path']):
+                os.remove(upload['path'])
+            audio_path = spool_upload(uploaded_file)
+            try:
+                info = probe_audio(audio_path)
+            except (OSError, ValueError):
+                info = None
+            upload = {
+                'file_id': file_id,
+                'path': audio_path,
+                'info': info,
+                'fingerprint': file_fingerprint(audio_path)
+            }
+            st.session_state['uploaded_audio'] = upload
+            st.session_state['decoded_audio'] = None
+
+        # Segmento da renderizzare: si decodifica e analizza solo questo tratto
+        track_duration = upload['info']['duration'] if upload['info'] and upload['info']['duration'] else None
+        st.sidebar.subheader("✂️ Segmento")
+        start_time, end_time = 0.0, None
+        if track_duration:
+            start_time, end_time = st.sidebar.slider(
+                "Intervallo (secondi)", 0.0, float(track_duration), (0.0, float(track_duration)), step=0.5,
+                help="Solo questo tratto viene decodificato, analizzato e renderizzato"
+            )
+            if end_time >= track_duration:
+                end_time = None
+            elif end_time <= start_time:
+                st.sidebar.warning("Intervallo vuoto: la fine deve essere dopo l'inizio")
+                st.stop()
+        full_track_norm = st.sidebar.checkbox(
+            "Normalizza sull'intero brano", value=False,
+            help="Usa i picchi dell'intero brano: clip diverse dello stesso brano hanno lo stesso aspetto"
+        )
+
+        # Bande di analisi e loro assegnazione ai layer delle onde
+        st.sidebar.subheader("🎚️ Bande")
+        band_scale = st.sidebar.selectbox(
+            "Scala", list(BAND_SCALES),
+            format_func=lambda x: {"standard": "Standard (3 bande)", "linear": "Lineare", "log": "Logaritmica",
+                                   "mel": "Mel", "custom": "Bordi personalizzati"}[x]
+        )
+        band_count, band_fmin, band_fmax, custom_edges = 3, 20.0, 20000.0, None
+        if band_scale in ("linear", "log", "mel"):
+            band_count = st.sidebar.slider("Numero di bande", 3, 64, 8)
+            col_fmin, col_fmax = st.sidebar.columns(2)
+            with col_fmin:
+                band_fmin = st.number_input("Da (Hz)", min_value=1.0, max_value=20000.0, value=20.0, step=10.0)
+            with col_fmax:
+                band_fmax = st.number_input("A (Hz)", min_value=band_fmin + 1, max_value=24000.0, value=20000.0, step=100.0)
+        elif band_scale == "custom":
+            edges_text = st.sidebar.text_input("Bordi (Hz)", "20, 250, 4000, 20000",
+                                               help="Valori separati da virgola: N+1 bordi per N bande")
+            try:
+                custom_edges = [float(v) for v in edges_text.split(',') if v.strip()]
+                make_band_edges('custom', edges=custom_edges)
+            except ValueError:
+                st.sidebar.error("Bordi non validi: uso le 3 bande standard")
+                band_scale = "standard"
+        band_edges = make_band_edges(band_scale, band_count, band_fmin, band_fmax, custom_edges,
+                                     sr=upload['info']['sr'] if upload['info'] else None)
+        n_bands = len(band_edges) - 1
+        layer_map = default_layer_map(n_bands)
+        with st.sidebar.expander("Mappa bande → layer"):
+            band_labels = [f"{i}: {lo:.0f}–{hi:.0f} Hz" for i, (lo, hi) in enumerate(zip(band_edges[:-1], band_edges[1:]))]
+            for layer, label in zip(GEOMETRY_BANDS, ("Layer basse", "Layer medie", "Layer acute")):
+                chosen = st.multiselect(label, list(range(n_bands)), default=list(layer_map[layer]),
+                                        format_func=lambda i: band_labels[i], key=f"layer_map_{layer}")
+                if chosen:
+                    layer_map[layer] = tuple(chosen)
+
+        # Lavori pesanti (analisi, preview, export) passano dal pianificatore condiviso
+        scheduler = get_render_scheduler()
+        session_id = current_session_id()
+        queue_placeholder = st.empty()
+        segment = (start_time, end_time, channel_mode == 'mono')
+        decoded = st.session_state.get('decoded_audio')
+        analysis_cache_key = (upload['fingerprint'], start_time, end_time, channel_mode, tuple(band_edges))
+        track_cache_key = (upload['fingerprint'], 0.0, None, channel_mode, tuple(band_edges))
+        needs_analysis = (decoded is None or decoded['segment'] != segment
+                          or get_cached_analysis(analysis_cache_key) is None
+                          or (full_track_norm and get_cached_analysis(track_cache_key) is None))
+        analysis_seconds = (end_time if end_time is not None else track_duration or 0.0) - start_time
+        if full_track_norm:
+            analysis_seconds += track_duration or 0.0
+        analysis_slot = contextlib.nullcontext()
+        if needs_analysis:
+            analysis_slot = scheduler.slot(session_id, 'analysis', cost=analysis_seconds,
+                                           on_wait=queue_feedback(queue_placeholder, "Analisi"))
+
+        with analysis_slot, st.spinner("🎵 Caricamento e analisi audio..."):
+            queue_placeholder.empty()
+            if decoded is None or decoded['segment'] != segment:
+                decode_start = time.perf_counter()
+                audio_data, sr, decoder, preroll = load_segment(upload['path'], start_time, end_time,
+                                                                upload['info'], mono=channel_mode == 'mono')
+                decoded = {
+                    'segment': segment,
+                    'audio': audio_data,
+                    'sr': sr,
+                    'preroll': preroll,
+                    'decoder': decoder,
+                    'decode_time': time.perf_counter() - decode_start
+                }
+                st.session_state['decoded_audio'] = decoded
+            audio_data, sr = decoded['audio'], decoded['sr']
             
-            # Calcola la durata effettiva
-            duration = len(audio_data) / sr
+            norm_maxima = None
+            if full_track_norm:
+                norm_maxima = get_track_band_maxima(upload['path'], upload['fingerprint'], upload['info'],
+                                                    channel_mode, band_edges)
+            
+            # Analisi del solo segmento (riusata dalla cache ai rerun successivi)
+            visualizer = AudioVisualizer(
+                audio_data, sr, duration=end_time - start_time if end_time is not None else None,
+                source_path=upload['path'], source_info=upload['info'], start_time=start_time,
+                preroll_samples=decoded['preroll'], norm_maxima=norm_maxima,
+                analysis_cache_key=analysis_cache_key,
+                channel_mode=channel_mode, band_edges=band_edges, layer_map=layer_map
+            )
             
-            # Crea visualizzatore con la durata effettiva
-            visualizer = AudioVisualizer(audio_data, sr)
+            # Calcola la durata effettiva
+            duration = visualizer.duration
             
             # Prepara colori
             colors = {
@@ -983,10 +4178,11 @@ def main():
                 'bg': bg_color
             }
             
-        st.success(f"✅ Audio caricato! Durata: {duration:.1f}s, Sample Rate: {sr}Hz")
+        st.success(f"✅ Audio caricato! Durata: {duration:.1f}s ({start_time:.1f}s – {start_time + duration:.1f}s), Sample Rate: {sr}Hz "
+                   f"(decoder: {decoded['decoder']}, {decoded['decode_time']:.2f}s)")
 
         # ── Bottoni azione ──────────────────────────────────────────────
-        col1, col2, col3 = st.columns([1, 1, 2])
+        col1, col2, col_report, col3 = st.columns([1, 1, 1, 2])
         with col1:
             if st.button("🔍 Preview Rapida"):
                 st.session_state['run_preview'] = True
@@ -996,7 +4192,20 @@ def main():
                 st.session_state['create_video'] = True
                 st.session_state['video_bytes'] = None   # reset
                 st.session_state['video_filename'] = None
+                st.session_state['rendition_files'] = None
                 st.session_state['social_report'] = None
+                st.session_state['instant_report'] = None
+        with col_report:
+            if st.button("📊 Report Istantaneo", help="Percentuali colori e report social dalle sole curve di banda, senza renderizzare"):
+                instant_report = visualizer.generate_instant_report(
+                    uploaded_file.name or "Unknown Track", video_title, pattern_type, colors, effects,
+                    frame_rate, video_quality, aspect_ratio
+                )
+                st.session_state['instant_report'] = instant_report
+                st.session_state['social_report'] = instant_report['social_report']
+                st.session_state['poster_png'] = visualizer.generate_poster_png(
+                    pattern_type, colors, effects, layout=poster_layout, title_settings=title_settings
+                )
         with col3:
             pattern_labels_ui = {
                 "waves": "🌊 Onde Classiche",
@@ -1011,9 +4220,22 @@ def main():
             }
             st.write(f"Wave selezionata: **{pattern_labels_ui.get(pattern_type, pattern_type)}**")
 
+        if st.session_state.get('instant_report'):
+            instant_report = st.session_state['instant_report']
+            dominant_labels = {'low': "🔴 Basse", 'mid': "🔵 Medie", 'high': "⚪ Acute"}
+            st.info(
+                f"📊 **Report istantaneo** (senza rendering): "
+                f"🔴 Basse {instant_report['low_percent']:.1f}% | 🔵 Medie {instant_report['mid_percent']:.1f}% | "
+                f"⚪ Acute {instant_report['high_percent']:.1f}% — dominante: {dominant_labels[instant_report['dominant']]} "
+                f"• {instant_report['total_frames']:,} frame"
+            )
+
         # ── PREVIEW a bassa risoluzione ─────────────────────────────────
         if st.session_state.get('run_preview'):
-            with st.spinner("🔍 Generando preview (12 frame a 320×180)..."):
+            preview_slot = scheduler.slot(session_id, 'preview', cost=12 * 320 * 180,
+                                          on_wait=queue_feedback(queue_placeholder, "Preview"))
+            with preview_slot, st.spinner("🔍 Generando preview (12 frame a 320×180)..."):
+                queue_placeholder.empty()
                 preview_frames = visualizer.generate_preview_frames(
                     pattern_type, colors, effects, num_frames=12
                 )
@@ -1026,18 +4248,78 @@ def main():
             for i, frame_bytes in enumerate(st.session_state['preview_frames']):
                 cols[i % 4].image(frame_bytes, use_container_width=True)
 
+        # ── SCRUBBER: frame esatto a qualunque istante ───────────────────
+        if st.checkbox("🎞️ Scrubber timeline", value=False,
+                       help="Frame esatto del video a qualunque istante, a risoluzione preview"):
+            if st.session_state['scrubber'] is None:
+                st.session_state['scrubber'] = FrameScrubber(get_frame_cache(), scheduler=scheduler,
+                                                             session=session_id)
+            scrubber = st.session_state['scrubber']
+            scrub_time = st.slider("Istante (secondi)", 0.0, float(duration), 0.0, step=1.0 / frame_rate,
+                                   format="%.2f")
+            scrub_start = time.perf_counter()
+            scrub_frame, cache_hit = scrubber.frame(
+                visualizer, pattern_type, colors, effects, frame_rate, int(round(scrub_time * frame_rate)),
+                aspect_ratio, title_settings, visualizer.get_resolution(video_quality, aspect_ratio)
+            )
+            scrub_ms = (time.perf_counter() - scrub_start) * 1000
+            st.image(scrub_frame, width=640)
+            st.caption(f"Frame {int(round(scrub_time * frame_rate)):,} • {'cache' if cache_hit else 'renderizzato'} "
+                       f"in {scrub_ms:.0f} ms • cache {scrubber.cache.nbytes / 1024 ** 2:.1f}/"
+                       f"{scrubber.cache.max_bytes / 1024 ** 2:.0f} MB")
+
         # ── CREAZIONE VIDEO ──────────────────────────────────────────────
         if st.session_state.get('create_video'):
-            with st.spinner("🎥 Creazione video wave in corso (potrebbe richiedere alcuni minuti)..."):
+            if export_renditions:
+                # Si renderizza solo la rendition più grande: le altre sono scalate da ffmpeg
+                export_renditions = sorted(export_renditions, key=lambda name: -RENDITIONS[name]['short_side'])
+                export_width, export_height = visualizer.get_rendition_resolution(export_renditions[0], aspect_ratio)
+            else:
+                export_width, export_height = visualizer.get_resolution(video_quality, aspect_ratio)
+            export_slot = scheduler.slot(
+                session_id, 'export', cost=int(duration * frame_rate) * export_width * export_height,
+                cpu=max(render_workers, 1),
+                # Un frame RGB in rendering più i buffer dell'encoder per processo
+                memory=4 * export_width * export_height * 3 * max(render_workers, 1) + audio_data.nbytes,
+                on_wait=queue_feedback(queue_placeholder, "Export")
+            )
+            with export_slot, st.spinner("🎥 Creazione video wave in corso (potrebbe richiedere alcuni minuti)..."):
+                queue_placeholder.empty()
                 with tempfile.NamedTemporaryFile(delete=False, suffix='.mp4') as tmpfile:
                     video_path = tmpfile.name
 
                 audio_filename_str = uploaded_file.name if uploaded_file.name else "Unknown Track"
 
-                success = visualizer.create_video_with_audio(
-                    video_path, pattern_type, colors, effects, frame_rate,
-                    audio_filename_str, video_quality, aspect_ratio, video_title, title_settings
-                )
+                # Player collegato al file in crescita: parte appena c'è il primo frammento
+                if progressive_export:
+                    st.session_state['video_bytes'] = None
+                    stream_server = get_progressive_server()
+                    stream_id, stream_url = stream_server.publish(video_path)
+                    live_player = st.empty()
+                    live_player.video(stream_url)
+
+                try:
+                    if export_renditions:
+                        rendition_paths = {name: video_path.replace('.mp4', f'_{name}.mp4')
+                                           for name in export_renditions[1:]}
+                        rendition_paths[export_renditions[0]] = video_path
+                        success = visualizer.create_video_renditions(
+                            rendition_paths, pattern_type, colors, effects, frame_rate,
+                            audio_filename_str, aspect_ratio, video_title, title_settings,
+                            normalize_audio=normalize_audio
+                        )
+                    else:
+                        success = visualizer.create_video_with_audio(
+                            video_path, pattern_type, colors, effects, frame_rate,
+                            audio_filename_str, video_quality, aspect_ratio, video_title, title_settings,
+                            normalize_audio=normalize_audio,
+                            distributed={'local_workers': render_workers} if render_workers else None,
+                            progressive=progressive_export
+                        )
+                finally:
+                    if progressive_export:
+                        stream_server.finish(stream_id)
+                        live_player.empty()
 
                 if success:
                     with open(video_path, "rb") as f:
@@ -1047,9 +4329,22 @@ def main():
                     ts = datetime.now().strftime('%Y%m%d_%H%M%S')
                     video_filename = f"audioline_wave_{slug}_{ts}.mp4"
 
+                    # Rendition minori: scaricabili a parte, il player mostra la più grande
+                    if export_renditions:
+                        video_filename = f"audioline_wave_{slug}_{ts}_{export_renditions[0]}.mp4"
+                        rendition_files = []
+                        for name in export_renditions[1:]:
+                            with open(rendition_paths[name], "rb") as f:
+                                rendition_files.append((name, f"audioline_wave_{slug}_{ts}_{name}.mp4", f.read()))
+                            os.remove(rendition_paths[name])
+                        st.session_state['rendition_files'] = rendition_files
+
                     st.session_state['video_bytes'] = video_bytes
                     st.session_state['video_filename'] = video_filename
                     st.session_state['video_path'] = video_path
+                    st.session_state['poster_png'] = visualizer.generate_poster_png(
+                        pattern_type, colors, effects, layout=poster_layout, title_settings=title_settings
+                    )
                 else:
                     st.error("Errore nella creazione del video wave.")
 
@@ -1065,6 +4360,26 @@ def main():
                 mime="video/mp4",
                 key="dl_video"
             )
+            for name, filename, data in st.session_state.get('rendition_files') or []:
+                st.download_button(
+                    label=f"📥 Scarica rendition {name}",
+                    data=data,
+                    file_name=filename,
+                    mime="video/mp4",
+                    key=f"dl_video_{name}"
+                )
+
+        # ── POSTER DEL BRANO ─────────────────────────────────────────────
+        if st.session_state.get('poster_png'):
+            st.markdown("#### 🖼️ Poster del brano")
+            st.image(st.session_state['poster_png'], use_container_width=True)
+            st.download_button(
+                label="🖼️ Scarica Poster (.png)",
+                data=st.session_state['poster_png'],
+                file_name=f"audioline_poster_{datetime.now().strftime('%Y%m%d_%H%M%S')}.png",
+                mime="image/png",
+                key="dl_poster"
+            )
 
         # ── DOWNLOAD REPORT SOCIAL (stabile, fuori dal bottone) ──────────
         if st.session_state.get('social_report'):
@@ -1121,7 +4436,7 @@ def main():
         - **Colori personalizzabili** per ogni banda di frequenza
         - **Report dettagliato** con distribuzione colori
         - **Aspect ratio multipli:** 16:9, 1:1, 9:16
-        - **Qualità video HD** fino a 1920x1080
+        - **Qualità video** fino a 4K o risoluzione personalizzata, FPS liberi
         
         **Come usare:**
         1. Carica un file audio dalla sidebar
@@ -1137,58 +4452,352 @@ def main():
         - Estetica minimalista e pulita
         """)
         
-        # Demo wave pattern statico
+        # Demo wave pattern statico (pre-renderizzata e in cache)
         st.markdown("### 🌊 Anteprima Stili Wave")
-        
-        demo_fig, (ax1, ax2, ax3) = plt.subplots(3, 1, figsize=(14, 12), facecolor='black')
-        x = np.linspace(0, 16, 500)
-        
-        # Demo onde classiche
-        ax1.set_facecolor('black')
-        for i in range(3):
-            y = 1.5 + i * 0.8 + 0.8 * np.sin(2 * np.pi * (0.5 + i * 0.3) * x/16)
-            ax1.plot(x, y, color=['#FF0000', '#0000FF', '#FFFFFF'][i], linewidth=3, alpha=0.8)
-        ax1.set_xlim(0, 16)
-        ax1.set_ylim(0, 4)
-        ax1.set_title('🌊 Onde Classiche', color='white', fontsize=14, pad=20)
-        ax1.axis('off')
-        
-        # Demo interferenza
-        ax2.set_facecolor('black')
-        for i in range(8):
-            freq1 = 0.8 + i * 0.2
-            freq2 = 1.0 + i * 0.15
-            y1 = 2 + 0.6 * np.sin(2 * np.pi * freq1 * x/16)
-            y2 = 2 + 0.4 * np.sin(2 * np.pi * freq2 * x/16 + np.pi/4)
-            colors = ['#FF4444', '#4444FF', '#FFFFFF']
-            ax2.plot(x, y1, color=colors[i % 3], linewidth=1.5, alpha=0.6)
-            ax2.plot(x, y2, color=colors[(i+1) % 3], linewidth=1.5, alpha=0.4)
-        ax2.set_xlim(0, 16)
-        ax2.set_ylim(0, 4)
-        ax2.set_title('🔄 Onde Interferenza', color='white', fontsize=14, pad=20)
-        ax2.axis('off')
-        
-        # Demo fluide
-        ax3.set_facecolor('black')
-        for i in range(15):
-            freq = 1.0 + i * 0.1
-            phase = i * np.pi/8
-            amplitude = 0.3 + 0.2 * (i/15)
-            y = 2 + amplitude * np.sin(2 * np.pi * freq * x/16 + phase)
-            
-            # Colore sfumato
-            color_intensity = 0.3 + 0.7 * (i/15)
-            color = (color_intensity, color_intensity * 0.7, color_intensity)
-            ax3.plot(x, y, color=color, linewidth=0.8, alpha=0.4 + 0.4*(i/15))
-        
-        ax3.set_xlim(0, 16)
-        ax3.set_ylim(0, 4)
-        ax3.set_title('💫 Onde Fluide', color='white', fontsize=14, pad=20)
-        ax3.axis('off')
-        
-        plt.tight_layout()
-        st.pyplot(demo_fig, clear_figure=True)
-        plt.close(demo_fig)
+        st.image(get_welcome_demo(), use_container_width=True)
+
+def print_progress(frame_idx, total_frames):
+    """Avanzamento testuale per la riga di comando"""
+    if frame_idx % 25 == 0 or frame_idx == total_frames:
+        end = '\n' if frame_idx == total_frames else ''
+        print(f"\rFrame {frame_idx}/{total_frames}", end=end, flush=True)
+
+
+def collect_audio_files(inputs):
+    """File audio indicati direttamente o contenuti nelle cartelle indicate"""
+    paths = []
+    for item in inputs:
+        if os.path.isdir(item):
+            paths.extend(sorted(
+                os.path.join(item, name) for name in os.listdir(item)
+                if name.lower().rsplit('.', 1)[-1] in AUDIO_EXTENSIONS
+            ))
+        else:
+            paths.append(item)
+    return paths
+
+
+def parse_resolution(value):
+    """Converte una stringa "LARGHEZZAxALTEZZA" in una tupla di interi"""
+    try:
+        width, height = (int(v) for v in value.lower().split('x'))
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"Risoluzione non valida: {value} (usa es. 3840x2160)")
+    if width <= 0 or height <= 0:
+        raise argparse.ArgumentTypeError(f"Risoluzione non valida: {value}")
+    return (width, height)
+
+
+def benchmark_resolutions(visualizer, resolutions, fps=30, pattern_type="waves"):
+    """Misura il throughput di rendering + encoding per ogni risoluzione"""
+    results = []
+    for width, height in resolutions:
+        with tempfile.NamedTemporaryFile(delete=False, suffix='.mp4') as tmpfile:
+            video_path = tmpfile.name
+        start = time.perf_counter()
+        total_frames, _ = visualizer.create_video_no_audio(
+            video_path, pattern_type, None, None, fps,
+            aspect_ratio=f"{width}:{height} (Personalizzato)",
+            video_quality=(width, height),
+            progress_callback=lambda *_: None
+        )
+        elapsed = time.perf_counter() - start
+        os.remove(video_path)
+        results.append({
+            'resolution': f"{width}x{height}",
+            'frames': total_frames,
+            'seconds': elapsed,
+            'fps': total_frames / elapsed,
+            'mpix_per_s': total_frames * width * height / elapsed / 1e6
+        })
+    return results
+
+
+def cli_main(argv=None):
+    """Interfaccia a riga di comando (rendering senza Streamlit)"""
+    parser = argparse.ArgumentParser(prog="app.py", description="AudioLineTwo WAVES - rendering da riga di comando")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    render_parser = subparsers.add_parser('render', help="Crea un video wave da un file audio")
+    render_parser.add_argument('input', help="File audio (wav, mp3, m4a, flac)")
+    render_parser.add_argument('output', help="File MP4 di uscita")
+    render_parser.add_argument('--pattern', default='waves', help="Tipo di onda (default: waves)")
+    render_parser.add_argument('--resolution', type=parse_resolution, default=(1920, 1080),
+                               help="Risoluzione LARGHEZZAxALTEZZA (default: 1920x1080)")
+    render_parser.add_argument('--fps', type=int, default=30, help="Frame al secondo (default: 30)")
+    render_parser.add_argument('--normalize-audio', action='store_true',
+                               help="Normalizza il picco dell'audio (altrimenti lo stream originale è copiato se possibile)")
+    render_parser.add_argument('--start', type=float, default=0.0, help="Inizio del segmento in secondi (default: 0)")
+    render_parser.add_argument('--end', type=float, default=None, help="Fine del segmento in secondi (default: fine del brano)")
+    render_parser.add_argument('--full-track-norm', action='store_true',
+                               help="Normalizza le bande sui picchi dell'intero brano invece che del segmento")
+    render_parser.add_argument('--channels', choices=CHANNEL_MODES, default='mono',
+                               help="Analisi mono, stereo (L/R) o midside (default: mono)")
+    render_parser.add_argument('--stereo-layout', choices=STEREO_LAYOUTS, default='mirrored',
+                               help="Layer stereo speculari o a schermo diviso (default: mirrored)")
+    render_parser.add_argument('--band-scale', choices=BAND_SCALES[:-1], default='standard',
+                               help="Bande standard (3) o N bande linear/log/mel (default: standard)")
+    render_parser.add_argument('--bands', type=int, default=8, help="Numero di bande per linear/log/mel (default: 8)")
+    render_parser.add_argument('--fmin', type=float, default=20.0, help="Frequenza minima delle bande (default: 20)")
+    render_parser.add_argument('--fmax', type=float, default=20000.0, help="Frequenza massima delle bande (default: 20000)")
+    render_parser.add_argument('--band-edges', type=lambda v: [float(x) for x in v.split(',')],
+                               help="Bordi personalizzati in Hz, es. 20,150,600,2500,20000")
+    render_parser.add_argument('--layer-map', type=parse_layer_map,
+                               help="Bande per layer, es. \"low=0,1;mid=2-5;high=6,7\" (default: divise in tre)")
+    render_parser.add_argument('--poster', help="Salva anche il poster del brano (PNG) in questo file")
+    render_parser.add_argument('--poster-layout', choices=POSTER_LAYOUTS, default='overlay',
+                               help="Poster sovrapposto o a striscia temporale (default: overlay)")
+    render_parser.add_argument('--workers', type=int, default=0,
+                               help="Renderizza a segmenti con N worker locali (default: 0, un solo processo)")
+    render_parser.add_argument('--queue', help="Cartella condivisa della coda per worker su altre macchine")
+    render_parser.add_argument('--segment-seconds', type=float, default=30.0,
+                               help="Durata dei segmenti distribuiti in secondi (default: 30)")
+    render_parser.add_argument('--motion', choices=MOTION_MODES, default='time',
+                               help="Movimento delle onde: costante, a ritmo dei beat o sugli attacchi (default: time)")
+    render_parser.add_argument('--smoothing', action='store_true',
+                               help="Inviluppo attack/release sulle bande invece dei valori grezzi")
+    render_parser.add_argument('--progressive', action='store_true',
+                               help="MP4 frammentato in un solo passaggio, riproducibile mentre viene scritto")
+    render_parser.add_argument('--serve-port', type=int, default=None,
+                               help="Con --progressive trasmette il video in corso su http://HOST:PORT/video/…")
+    render_parser.add_argument('--renditions', nargs='+', choices=list(RENDITIONS),
+                               help="Più rendition da un solo rendering, salvate come OUTPUT_<nome>.mp4 "
+                                    "(il lato lungo segue l'aspect ratio di --resolution)")
+    render_parser.add_argument('--metrics-file', default=METRICS_FILE or None,
+                               help="Scrive le metriche in formato testo Prometheus in questo file")
+
+    bench_parser = subparsers.add_parser('benchmark', help="Misura il throughput per risoluzione")
+    bench_parser.add_argument('input', nargs='?', help="File audio (default: segnale sintetico)")
+    bench_parser.add_argument('--seconds', type=float, default=2.0, help="Durata renderizzata per risoluzione")
+    bench_parser.add_argument('--fps', type=int, default=30)
+    bench_parser.add_argument('--pattern', default='waves')
+    bench_parser.add_argument('--resolutions', type=parse_resolution, nargs='+',
+                              default=[(1280, 720), (1920, 1080), (2560, 1440), (3840, 2160)])
+
+    report_parser = subparsers.add_parser('report', help="Report istantaneo dalle curve di banda, senza rendering")
+    report_parser.add_argument('inputs', nargs='+', help="File audio o cartelle (tutti i brani contenuti)")
+    report_parser.add_argument('--pattern', default='waves')
+    report_parser.add_argument('--fps', type=int, default=30)
+    report_parser.add_argument('--resolution', type=parse_resolution, default=(1920, 1080))
+    report_parser.add_argument('--channels', choices=CHANNEL_MODES, default='mono')
+    report_parser.add_argument('--output-dir', help="Salva qui il report social di ogni brano (<file>.txt)")
+    report_parser.add_argument('--poster', choices=POSTER_LAYOUTS,
+                               help="Con --output-dir salva anche il poster di ogni brano (.png)")
+
+    subparsers.add_parser('warmup', help="Prepara import, cache dei font e FFT (es. all'avvio del container)")
+
+    live_parser = subparsers.add_parser('live', help="Visualizzazione in tempo reale da file (simulato) o da stdin")
+    live_parser.add_argument('input', help="File audio riprodotto in tempo reale, oppure '-' per PCM float32 da stdin")
+    live_parser.add_argument('--sr', type=int, default=44100, help="Sample rate dello stream su stdin (default: 44100)")
+    live_parser.add_argument('--input-channels', type=int, default=1, help="Canali dello stream su stdin (default: 1)")
+    live_parser.add_argument('--channels', choices=CHANNEL_MODES, default='mono')
+    live_parser.add_argument('--pattern', default='waves')
+    live_parser.add_argument('--fps', type=int, default=30)
+    live_parser.add_argument('--resolution', type=parse_resolution, default=(1280, 720))
+    live_parser.add_argument('--seconds', type=float, default=None, help="Durata massima della sessione")
+    live_parser.add_argument('--normalization', choices=('decay', 'running'), default='decay',
+                             help="Massimi di banda con decadimento o solo crescenti (default: decay)")
+    live_parser.add_argument('--half-life', type=float, default=8.0, help="Dimezzamento dei massimi in secondi")
+    live_parser.add_argument('--output', help="Salva i frame emessi in un MP4 (senza audio)")
+
+    worker_parser = subparsers.add_parser('worker', help="Worker di rendering su una cartella di coda condivisa")
+    worker_parser.add_argument('queue', help="Cartella della coda (la stessa passata a render --queue)")
+    worker_parser.add_argument('--poll', type=float, default=0.5, help="Intervallo di polling in secondi")
+    worker_parser.add_argument('--idle-exit', type=float, default=None,
+                               help="Termina dopo tanti secondi senza job (default: resta attivo)")
+    worker_parser.add_argument('--metrics-port', type=int, default=METRICS_PORT,
+                               help="Espone le metriche Prometheus su http://HOST:PORT/metrics")
+    worker_parser.add_argument('--metrics-file', default=METRICS_FILE or None,
+                               help="Scrive le metriche in formato testo Prometheus in questo file")
+
+    args = parser.parse_args(argv)
+
+    if args.command == 'worker':
+        start_metrics_exporters(args.metrics_port, args.metrics_file)
+        try:
+            completed = run_worker(args.queue, poll_interval=args.poll, idle_exit=args.idle_exit)
+        finally:
+            if args.metrics_file:
+                get_metrics().write_file(args.metrics_file)
+        print(f"Segmenti completati: {completed}")
+        return 0
+
+    if args.command == 'warmup':
+        for stage, seconds in warm_up().items():
+            print(f"{stage:>12}: {seconds:.2f}s")
+        return 0
+
+    if args.command == 'render':
+        mono = args.channels == 'mono'
+        if args.end is not None and args.end <= args.start:
+            parser.error(f"--end ({args.end:g}) deve essere maggiore di --start ({args.start:g})")
+        audio_data, sr, decoder, preroll = load_segment(args.input, args.start, args.end, mono=mono)
+        if args.band_edges:
+            band_edges = make_band_edges('custom', edges=args.band_edges)
+        else:
+            band_edges = make_band_edges(args.band_scale, args.bands, args.fmin, args.fmax, sr=sr)
+        norm_maxima = None
+        if args.full_track_norm:
+            norm_maxima = get_track_band_maxima(args.input, channel_mode=args.channels, band_edges=band_edges)
+        segment_duration = args.end - args.start if args.end is not None else None
+        try:
+            visualizer = AudioVisualizer(audio_data, sr, duration=segment_duration, source_path=args.input,
+                                         start_time=args.start, preroll_samples=preroll, norm_maxima=norm_maxima,
+                                         channel_mode=args.channels, band_edges=band_edges, layer_map=args.layer_map)
+        except ValueError as e:
+            parser.error(str(e))
+        effects = {**DEFAULT_EFFECTS, 'motion': args.motion, 'smoothing': args.smoothing}
+        if not mono:
+            effects['stereo_layout'] = args.stereo_layout
+        print(f"Audio decodificato con {decoder}: {args.start:.1f}s – {args.start + visualizer.duration:.1f}s @ {sr} Hz")
+        width, height = args.resolution
+        distributed = None
+        stream_server = None
+        if args.serve_port is not None and not args.progressive:
+            parser.error("--serve-port richiede --progressive")
+        if args.progressive and (args.workers or args.queue):
+            parser.error("--progressive non si combina con --workers/--queue")
+        if args.renditions and (args.progressive or args.workers or args.queue):
+            parser.error("--renditions non si combina con --progressive/--workers/--queue")
+        if args.serve_port is not None:
+            stream_server = ProgressiveVideoServer(port=args.serve_port)
+            # Un'uscita preesistente verrebbe trasmessa prima che ffmpeg la sovrascriva
+            open(args.output, 'wb').close()
+            stream_id, stream_url = stream_server.publish(args.output)
+            print(f"Riproduzione: {stream_url}")
+        if args.workers or args.queue:
+            distributed = {'queue_dir': args.queue, 'local_workers': args.workers,
+                           'segment_seconds': args.segment_seconds}
+        try:
+            if args.renditions:
+                stem = os.path.splitext(args.output)[0]
+                rendition_paths = {name: f"{stem}_{name}.mp4" for name in args.renditions}
+                success = visualizer.create_video_renditions(
+                    rendition_paths, args.pattern, None, effects, args.fps,
+                    audio_filename=os.path.basename(args.input),
+                    aspect_ratio=f"{width}:{height} (Personalizzato)",
+                    progress_callback=print_progress,
+                    show_report=False,
+                    normalize_audio=args.normalize_audio
+                )
+                if success:
+                    for name, path in rendition_paths.items():
+                        print(f"Rendition {name}: {path}")
+            else:
+                success = visualizer.create_video_with_audio(
+                    args.output, args.pattern, None, effects, args.fps,
+                    audio_filename=os.path.basename(args.input),
+                    video_quality=args.resolution,
+                    aspect_ratio=f"{width}:{height} (Personalizzato)",
+                    progress_callback=print_progress,
+                    show_report=False,
+                    normalize_audio=args.normalize_audio,
+                    distributed=distributed,
+                    progressive=args.progressive
+                )
+        except RuntimeError as e:
+            print(f"Errore: {e}", file=sys.stderr)
+            return 1
+        finally:
+            if stream_server is not None:
+                stream_server.finish(stream_id)
+            if args.metrics_file:
+                get_metrics().write_file(args.metrics_file)
+        print(f"Audio: {visualizer.audio_mux_mode}")
+        if success and args.poster:
+            with open(args.poster, 'wb') as f:
+                f.write(visualizer.generate_poster_png(args.pattern, None, effects, args.resolution, args.poster_layout))
+            print(f"Poster: {args.poster}")
+        return 0 if success else 1
+
+    if args.command == 'report':
+        paths = collect_audio_files(args.inputs)
+        if not paths:
+            parser.error("Nessun file audio trovato")
+        if args.output_dir:
+            os.makedirs(args.output_dir, exist_ok=True)
+        output_names = set()
+        width, height = args.resolution
+        print(f"{'Brano':<40} {'Basse':>7} {'Medie':>7} {'Acute':>7} {'Dominante':>10} {'Analisi':>8} {'Report':>8}")
+        for path in paths:
+            try:
+                analysis_start = time.perf_counter()
+                audio_data, sr, _, preroll = load_segment(path, mono=args.channels == 'mono')
+                visualizer = AudioVisualizer(audio_data, sr, source_path=path, preroll_samples=preroll,
+                                             channel_mode=args.channels)
+                report_start = time.perf_counter()
+                report = visualizer.generate_instant_report(
+                    os.path.basename(path), os.path.basename(path), args.pattern, None, None, args.fps,
+                    video_quality=args.resolution, aspect_ratio=f"{width}:{height} (Personalizzato)"
+                )
+                report_end = time.perf_counter()
+            except (OSError, ValueError, subprocess.CalledProcessError) as e:
+                print(f"{os.path.basename(path)[:40]:<40} errore: {e}", file=sys.stderr)
+                continue
+            print(f"{os.path.basename(path)[:40]:<40} {report['low_percent']:>6.1f}% {report['mid_percent']:>6.1f}% "
+                  f"{report['high_percent']:>6.1f}% {report['dominant']:>10} "
+                  f"{report_start - analysis_start:>7.2f}s {(report_end - report_start) * 1000:>6.1f}ms")
+            if args.output_dir:
+                # Estensione nel nome (st.wav e st.m4a restano distinti), suffisso per
+                # brani omonimi in cartelle diverse
+                name = base_name = os.path.basename(path)
+                suffix = 2
+                while name in output_names:
+                    name, suffix = f"{base_name}_{suffix}", suffix + 1
+                output_names.add(name)
+                with open(os.path.join(args.output_dir, f"{name}.txt"), 'w', encoding='utf-8') as f:
+                    f.write(report['social_report'])
+                if args.poster:
+                    with open(os.path.join(args.output_dir, f"{name}.png"), 'wb') as f:
+                        f.write(visualizer.generate_poster_png(args.pattern, resolution_px=args.resolution,
+                                                               layout=args.poster))
+        return 0
+
+    if args.command == 'live':
+        if args.input == '-':
+            source = PipeAudioSource(sys.stdin.buffer, args.sr, args.input_channels)
+        else:
+            source = SimulatedLiveSource(args.input, max_seconds=args.seconds)
+        visualizer = LiveVisualizer(source.sr, args.channels, source.channels,
+                                    normalization=args.normalization, norm_half_life=args.half_life)
+        writer = None
+        if args.output:
+            import imageio
+            writer = imageio.get_writer(args.output, fps=args.fps, macro_block_size=2)
+        max_frames = int(args.seconds * args.fps) if args.seconds else None
+        try:
+            stats = run_live(visualizer, source, args.fps, args.pattern, resolution_px=args.resolution,
+                             on_frame=(lambda frame, latency: writer.append_data(frame)) if writer else None,
+                             max_frames=max_frames)
+        finally:
+            if writer is not None:
+                writer.close()
+        print(f"Frame: {stats['frames']} (tick saltati: {stats['skipped_ticks']}, hop scartati: {stats['dropped_hops']})")
+        print(f"Latenza audio→video: media {stats['latency_mean'] * 1000:.1f} ms, "
+              f"p95 {stats['latency_p95'] * 1000:.1f} ms, max {stats['latency_max'] * 1000:.1f} ms")
+        return 0
+
+    if args.command == 'benchmark':
+        if args.input:
+            audio_data, sr, _ = decode_audio(args.input)
+        else:
+            sr = 22050
+            t = np.arange(int(sr * args.seconds)) / sr
+            audio_data = (0.5 * np.sin(2 * np.pi * 110 * t) + 0.2 * np.sin(2 * np.pi * 2000 * t)).astype(np.float32)
+        visualizer = AudioVisualizer(audio_data, sr, duration=args.seconds)
+        results = benchmark_resolutions(visualizer, args.resolutions, args.fps, args.pattern)
+        print(f"{'Risoluzione':>12} {'Frame':>6} {'Secondi':>8} {'FPS':>7} {'Mpix/s':>7}")
+        for row in results:
+            print(f"{row['resolution']:>12} {row['frames']:>6} {row['seconds']:>8.2f} "
+                  f"{row['fps']:>7.2f} {row['mpix_per_s']:>7.1f}")
+        return 0
+
+    return 1
+
 
 if __name__ == "__main__":
-    main()
+    from streamlit import runtime
+    if runtime.exists():
+        main()
+    else:
+        sys.exit(cli_main())
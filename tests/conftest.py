@@ -0,0 +1,38 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import app  # noqa: E402
+from synthetic import SAMPLE_RATE, reference_frames, synthesize_test_track  # noqa: E402
+
+
+def pytest_addoption(parser):
+    parser.addoption('--update-goldens', action='store_true',
+                     help="Riscrive in golden_frames.json gli hash dei pattern verificati")
+
+
+@pytest.fixture(scope='session')
+def geometry_cache_dir(tmp_path_factory):
+    # Cartella privata: la geometria salvata da esecuzioni precedenti (con lo
+    # stesso audio sintetico) nasconderebbe le modifiche al codice da verificare
+    return str(tmp_path_factory.mktemp("geometry"))
+
+
+@pytest.fixture(scope='session')
+def tone_bursts():
+    return synthesize_test_track('tone_bursts')
+
+
+@pytest.fixture(scope='session')
+def tone_visualizer(tone_bursts, geometry_cache_dir):
+    audio, _ = tone_bursts
+    return app.AudioVisualizer(audio, SAMPLE_RATE, geometry_cache_dir=geometry_cache_dir)
+
+
+@pytest.fixture(scope='session')
+def tone_frames(tone_bursts):
+    _, onsets = tone_bursts
+    return reference_frames(onsets)
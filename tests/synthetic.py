@@ -0,0 +1,71 @@
+"""Tracce sintetiche con eventi a istanti noti e hash percettivi dei frame per i test."""
+import numpy as np
+
+SAMPLE_RATE = 22050
+DURATION = 4.5
+FPS = 25
+RESOLUTION = (320, 180)
+DPI = 72
+# Burst sinusoidali (inizio in secondi, frequenza): basse, medie e acute a turno
+TONE_BURSTS = ((0.4, 80.0), (1.1, 1000.0), (1.8, 8000.0), (2.5, 80.0), (2.9, 1000.0), (3.3, 8000.0))
+# Click di rumore nel silenzio e segmento renderizzato (verifica anche il seek
+# dell'audio); i click cadono esattamente su istanti di frame del segmento, così
+# la misura non ha errore di quantizzazione e un frame di ritardo è già un errore
+CLICKS = (0.7, 1.54, 2.34, 3.18)
+SEGMENT = (0.3, 4.0)
+HASH_SIZE = 16
+# Bit diversi (su 256) tollerati: differenze di antialiasing tra versioni di
+# matplotlib sì, un frame di distanza nella timeline no
+HASH_TOLERANCE = 6
+
+
+def synthesize_test_track(kind, sr=SAMPLE_RATE, duration=DURATION):
+    """Traccia sintetica con eventi a istanti noti: (audio, istanti di onset in secondi).
+
+    - 'tone_bursts': burst sinusoidali di 0.3 s che eccitano a turno i tre layer;
+    - 'clicks': burst di rumore di 2 ms nel silenzio, onset netti per la sincronia.
+    """
+    t = np.arange(int(duration * sr)) / sr
+    audio = np.zeros(len(t), dtype=np.float32)
+    if kind == 'tone_bursts':
+        for start, freq in TONE_BURSTS:
+            mask = (t >= start) & (t < start + 0.3)
+            attack = np.minimum((t[mask] - start) / 0.005, 1.0)
+            audio[mask] += 0.8 * attack * np.sin(2 * np.pi * freq * t[mask])
+        return audio, [start for start, _ in TONE_BURSTS]
+    if kind == 'clicks':
+        rng = np.random.default_rng(0)
+        click_len = int(0.002 * sr)
+        for start in CLICKS:
+            first = int(start * sr)
+            audio[first:first + click_len] = np.clip(0.8 * rng.standard_normal(click_len), -1, 1)
+        return audio, list(CLICKS)
+    raise ValueError(f"Traccia sintetica sconosciuta: {kind}")
+
+
+def frame_dhash(frame, hash_size=HASH_SIZE):
+    """Difference hash del frame (hash_size² bit, in esadecimale).
+
+    Il frame in scala di grigi è ridotto a media di blocchi a
+    hash_size × (hash_size + 1) celle; ogni bit dice se una cella è più
+    luminosa della vicina a sinistra.
+    """
+    gray = np.asarray(frame, dtype=np.float32)
+    if gray.ndim == 3:
+        gray = gray.mean(axis=2)
+    rows = np.linspace(0, gray.shape[0], hash_size + 1).astype(int)
+    cols = np.linspace(0, gray.shape[1], hash_size + 2).astype(int)
+    cells = np.add.reduceat(np.add.reduceat(gray, rows[:-1], axis=0), cols[:-1], axis=1)
+    cells /= np.outer(np.diff(rows), np.diff(cols))
+    bits = (cells[:, 1:] > cells[:, :-1]).ravel()
+    return f"{int(''.join('1' if b else '0' for b in bits), 2):0{hash_size * hash_size // 4}x}"
+
+
+def hash_distance(hash_a, hash_b):
+    """Numero di bit diversi tra due hash esadecimali"""
+    return bin(int(hash_a, 16) ^ int(hash_b, 16)).count('1')
+
+
+def reference_frames(onsets, fps=FPS):
+    """Frame verificati: due frame dentro ogni evento più uno nel silenzio iniziale"""
+    return [5] + [int(round(start * fps)) + 2 for start in onsets]
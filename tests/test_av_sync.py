@@ -0,0 +1,69 @@
+import subprocess
+
+import numpy as np
+import pytest
+
+import app
+from synthetic import FPS, RESOLUTION, SAMPLE_RATE, SEGMENT, synthesize_test_track
+
+
+@pytest.fixture(scope='module')
+def clicks_source(tmp_path_factory):
+    from scipy.io import wavfile
+
+    audio, onsets = synthesize_test_track('clicks')
+    path = str(tmp_path_factory.mktemp("av_sync") / "clicks.wav")
+    wavfile.write(path, SAMPLE_RATE, audio)
+    return path, onsets
+
+
+@pytest.mark.parametrize('mode', ('export', 'progressive', 'renditions'))
+def test_visual_onsets_match_audio(clicks_source, geometry_cache_dir, tmp_path, mode):
+    """Onset visivi contro onset audio nell'MP4 finale, entro un frame.
+
+    Un click renderizzato deve illuminare il frame mostrato nello stesso
+    istante in cui il click si sente nel file muxato: entrambi sono misurati
+    decodificando l'MP4 (frame più luminoso, primo campione sopra metà
+    picco). L'audio è verificato anche rispetto all'istante atteso nel
+    segmento, per intercettare errori di seek o priming dell'encoder. In
+    modalità 'renditions' si verifica la rendition più piccola, con l'AAC
+    codificato a parte e poi copiato.
+    """
+    source_path, onsets = clicks_source
+    start, end = SEGMENT
+    segment_audio, segment_sr, _, preroll = app.load_segment(source_path, start, end)
+    visualizer = app.AudioVisualizer(segment_audio, segment_sr, duration=end - start, source_path=source_path,
+                                     start_time=start, preroll_samples=preroll,
+                                     geometry_cache_dir=geometry_cache_dir)
+    output_path = str(tmp_path / f"sync_{mode}.mp4")
+    if mode == 'renditions':
+        rendition = min(app.RENDITIONS, key=lambda name: app.RENDITIONS[name]['short_side'])
+        frame_size = visualizer.get_rendition_resolution(rendition, "16:9 (Standard)")
+        ok = visualizer.create_video_renditions({rendition: output_path}, "waves", None, None, FPS,
+                                                progress_callback=lambda *_: None, show_report=False)
+    else:
+        frame_size = RESOLUTION
+        ok = visualizer.create_video_with_audio(output_path, "waves", None, None, FPS, video_quality=RESOLUTION,
+                                                aspect_ratio=f"{RESOLUTION[0]}:{RESOLUTION[1]} (Personalizzato)",
+                                                progress_callback=lambda *_: None, show_report=False,
+                                                progressive=mode == 'progressive')
+    assert ok, "rendering non riuscito"
+
+    video = subprocess.run(['ffmpeg', '-v', 'error', '-i', output_path, '-map', '0:v:0',
+                            '-f', 'rawvideo', '-pix_fmt', 'gray', '-'], capture_output=True, check=True).stdout
+    brightness = np.frombuffer(video, dtype=np.uint8).reshape(-1, frame_size[0] * frame_size[1]).mean(axis=1)
+    pcm = subprocess.run(['ffmpeg', '-v', 'error', '-i', output_path, '-map', '0:a:0', '-ac', '1',
+                          '-ar', str(SAMPLE_RATE), '-f', 'f32le', '-'], capture_output=True, check=True).stdout
+    level = np.abs(np.frombuffer(pcm, dtype=np.float32))
+    offsets, seek_errors = [], []
+    for onset in onsets:
+        expected = onset - start
+        lo, hi = max(int((expected - 0.25) * SAMPLE_RATE), 0), int((expected + 0.25) * SAMPLE_RATE)
+        window = level[lo:hi]
+        audio_onset = (lo + int(np.argmax(window > 0.5 * window.max()))) / SAMPLE_RATE
+        first, last = max(int((expected - 0.25) * FPS), 0), int((expected + 0.25) * FPS) + 1
+        visual_onset = (first + int(np.argmax(brightness[first:last]))) / FPS
+        offsets.append((visual_onset - audio_onset) * FPS)
+        seek_errors.append((audio_onset - expected) * FPS)
+    assert max(map(abs, offsets)) < 1.0, f"video−audio (frame): {offsets}"
+    assert max(map(abs, seek_errors)) < 1.0, f"audio−atteso (frame): {seek_errors}"
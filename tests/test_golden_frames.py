@@ -0,0 +1,53 @@
+import json
+import os
+
+import pytest
+
+import app
+from synthetic import DPI, FPS, HASH_TOLERANCE, RESOLUTION, frame_dhash, hash_distance
+
+GOLDEN_FRAMES_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "golden_frames.json")
+
+
+def load_golden():
+    if not os.path.exists(GOLDEN_FRAMES_PATH):
+        return None
+    with open(GOLDEN_FRAMES_PATH) as f:
+        return json.load(f)
+
+
+def update_golden(pattern, hashes, frames):
+    """Riscrive gli hash di `pattern`; quelli degli altri pattern restano se i frame sono gli stessi"""
+    golden = load_golden()
+    previous = golden['hashes'] if golden is not None and golden['frames'] == frames else {}
+    golden = {
+        'track': 'tone_bursts',
+        'fps': FPS,
+        'resolution': list(RESOLUTION),
+        'dpi': DPI,
+        'frames': frames,
+        'hashes': {**previous, pattern: hashes}
+    }
+    with open(GOLDEN_FRAMES_PATH, 'w') as f:
+        json.dump(golden, f, indent=2)
+        f.write("\n")
+
+
+@pytest.mark.parametrize('pattern', app.PATTERN_TYPES)
+def test_golden_frame_hashes(tone_visualizer, tone_frames, pattern, request):
+    """Hash dei frame renderizzati contro quelli salvati (`pytest --update-goldens` li riscrive)"""
+    time_indices = tone_visualizer.get_frame_time_indices(FPS)
+    hashes = [frame_dhash(tone_visualizer.render_frame(time_indices[frame_idx], pattern,
+                                                       resolution_px=RESOLUTION, dpi=DPI))
+              for frame_idx in tone_frames]
+    if request.config.getoption('--update-goldens'):
+        update_golden(pattern, hashes, tone_frames)
+        return
+
+    golden = load_golden()
+    assert golden is not None, f"{GOLDEN_FRAMES_PATH} mancante (pytest --update-goldens)"
+    assert golden['frames'] == tone_frames, "frame di riferimento diversi: rigenerare con --update-goldens"
+    assert pattern in golden['hashes'], "hash mancanti: rigenerare con --update-goldens"
+    distances = dict(zip(tone_frames, (hash_distance(a, b) for a, b in zip(hashes, golden['hashes'][pattern]))))
+    failed = {frame_idx: d for frame_idx, d in distances.items() if d > HASH_TOLERANCE}
+    assert not failed, f"frame diversi (bit): {failed}"
@@ -0,0 +1,35 @@
+import numpy as np
+import pytest
+
+import app
+from synthetic import DPI, FPS, HASH_TOLERANCE, RESOLUTION, frame_dhash, hash_distance
+
+# Differenza media massima (livelli 0-255) tra percorso veloce e di riferimento
+MAX_MEAN_DIFF = 1.0
+
+
+@pytest.mark.parametrize('pattern', app.PATTERN_TYPES)
+def test_fast_path_matches_full_figure(tone_visualizer, tone_frames, pattern):
+    """Percorso veloce (layer statici, cache di geometria) contro il frame matplotlib completo"""
+    import matplotlib.pyplot as plt
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+
+    time_indices = tone_visualizer.get_frame_time_indices(FPS)
+    worst_diff, worst_distance = 0.0, 0
+    # Due passaggi: il primo scrive la cache di geometria, il secondo la legge
+    for _ in range(2):
+        geometry_cache = tone_visualizer.open_geometry_cache(pattern, None, "16:9 (Standard)", RESOLUTION, DPI, FPS)
+        for frame_idx in tone_frames:
+            time_idx = time_indices[frame_idx]
+            fast = tone_visualizer.render_frame(time_idx, pattern, resolution_px=RESOLUTION, dpi=DPI,
+                                                geometry_cache=geometry_cache, frame_idx=frame_idx)
+            fig = tone_visualizer.create_pattern_frame(time_idx, pattern, resolution_px=RESOLUTION, dpi=DPI)
+            canvas = FigureCanvasAgg(fig)
+            canvas.draw()
+            reference = np.asarray(canvas.buffer_rgba())[..., :3]
+            plt.close(fig)
+            worst_diff = max(worst_diff, float(np.abs(fast.astype(np.int16) - reference).mean()))
+            worst_distance = max(worst_distance, hash_distance(frame_dhash(fast), frame_dhash(reference)))
+        geometry_cache.close()
+    assert worst_diff <= MAX_MEAN_DIFF
+    assert worst_distance <= HASH_TOLERANCE
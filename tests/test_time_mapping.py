@@ -0,0 +1,16 @@
+import numpy as np
+import pytest
+
+
+@pytest.mark.parametrize('fps', (24, 25, 30, 60))
+def test_frame_time_indices_match_nearest_hop(tone_visualizer, fps):
+    """Frame → hop: versione vettoriale e segmenti contro il calcolo frame per frame"""
+    total_frames = int(tone_visualizer.duration * fps)
+    reference = np.array([np.argmin(np.abs(tone_visualizer.times - frame_idx / fps))
+                          for frame_idx in range(total_frames)])
+    fast = tone_visualizer.get_frame_time_indices(fps)
+    bounds = np.linspace(0, total_frames, 4).astype(int)
+    segments = np.concatenate([tone_visualizer.get_frame_time_indices(fps, a, b)
+                               for a, b in zip(bounds[:-1], bounds[1:])])
+    np.testing.assert_array_equal(fast, reference)
+    np.testing.assert_array_equal(segments, reference)